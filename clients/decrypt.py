@@ -1,9 +1,11 @@
 """Client script to request a private key (extract) from the PKG and decrypt an envelope."""
 from __future__ import annotations
 import argparse
-import requests
 import json
-from ibe.crypto_iface import ub64, canonicalize_identity
+from clients.pkg_client import PKGClient, PKGError
+from ibe import tracing
+from ibe.identity import canonicalize_identity
+from ibe.sender import decrypt_with_privkey
 
 
 def main():
@@ -14,19 +16,18 @@ def main():
     p.add_argument('--envelope', required=True, help='JSON string of the envelope')
     args = p.parse_args()
 
-    identity = canonicalize_identity(args.identity)
-    # Request private key from PKG
-    r = requests.post(args.pkg + '/extract', json={'identity': identity, 'otp': args.otp})
-    if r.status_code != 200:
-        print('Failed to extract private key:', r.status_code, r.text)
-        return
-    priv_b64 = r.json()['private_b64']
-    priv = ub64(priv_b64)
+    with tracing.span('client.decrypt'):
+        identity = canonicalize_identity(args.identity)
+        # Request private key from PKG
+        with tracing.span('client.extract'), PKGClient(args.pkg) as pkg:
+            try:
+                priv = pkg.extract(identity, args.otp)
+            except PKGError as e:
+                print('Failed to extract private key:', e)
+                return
 
-    env = json.loads(args.envelope)
-    from ibe.crypto_iface import DemoIBE
-    demo = DemoIBE()
-    pt = demo.decrypt(priv, env)
+        env = json.loads(args.envelope)
+        pt = decrypt_with_privkey(priv, env)
     print(pt.decode('utf8'))
 
 
@@ -0,0 +1,301 @@
+"""Reusable HTTP client for the PKG's public-key lookups.
+
+One `PKGClient` keeps a pooled keep-alive `requests.Session`, so repeated
+lookups reuse TCP connections instead of opening one per call. It adds:
+
+- connect/read timeouts on every request,
+- retries with full-jitter exponential backoff on connection errors, timeouts
+  and 429/502/503/504 responses (a `Retry-After` header is honoured),
+- a cap on concurrent requests to the PKG,
+- request coalescing: concurrent lookups of the same identity share one
+  in-flight request,
+- batching through `POST /get_pubkeys` (`get_pubkeys`), and concurrent
+  single lookups for PKGs without the batch endpoint (`lookup_many`),
+- a `traceparent` header on every request when tracing is enabled, so the
+  PKG's spans join the caller's trace (see `ibe.tracing`),
+- optionally (`use_filter=True`) a local copy of the PKG's identity Bloom
+  filter, refreshed every `filter_ttl` seconds, so lookups of identities the
+  PKG has never issued a key to are answered locally. Identities issued
+  after the last refresh can be reported unknown until the next one.
+
+HTTP/1.1 pipelining is not available in `requests`; batching and pooled
+connections give the same effect of many lookups per round trip.
+
+`extract` fetches a private key with an OTP over the same session. The OTP
+is consumed by the first request the PKG processes, so a retry after a lost
+response fails with 401; request a new OTP then.
+
+`AsyncPKGClient` exposes the same lookups to asyncio code.
+
+Usage:
+    with PKGClient('http://127.0.0.1:5000') as pkg:
+        pub = pkg.get_pubkey('alice@example.com')
+        keys = pkg.get_pubkeys(['alice@example.com', 'bob@example.com'])
+"""
+from __future__ import annotations
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ibe import tracing
+from ibe.bloom import BloomFilter
+from ibe.identity import canonicalize_identity, canonicalize_many
+from ibe.sender import ub64
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class PKGError(RuntimeError):
+    """The PKG returned an error response (after any retries)."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__('PKG returned %d: %s' % (status, body[:200]))
+        self.status = status
+
+
+class PKGClient:
+    """Thread-safe pooled client for `/get_pubkey` and `/get_pubkeys`."""
+
+    def __init__(self, pkg_url: str, pool_size: int = 16, max_concurrency: int = 16,
+                 timeout: Union[float, Tuple[float, float]] = (3.05, 10.0), retries: int = 3,
+                 backoff: float = 0.05, max_backoff: float = 2.0, batch_size: int = 500,
+                 use_filter: bool = False, filter_ttl: float = 60.0):
+        self.pkg_url = pkg_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.use_filter = use_filter
+        self.filter_ttl = filter_ttl
+        self._filter: Optional[BloomFilter] = None
+        self._filter_etag: Optional[str] = None
+        self._filter_at = float('-inf')
+        self.requests = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.filtered = 0
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _request(self, method: str, path: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """Send one request under the concurrency cap, retrying transient failures."""
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            response = None
+            with self._slots, tracing.span('pkg_client %s %s' % (method, path), attempt=attempt) as span:
+                self.requests += 1
+                kwargs['headers'] = tracing.inject(dict(kwargs.get('headers') or {}))
+                try:
+                    response = self._session.request(method, self.pkg_url + path, timeout=self.timeout, **kwargs)
+                    span.set(status=response.status_code)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt >= retries:
+                        raise
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt >= retries:
+                return response
+            time.sleep(self._delay(attempt, response))
+            attempt += 1
+            self.retried += 1
+
+    def _fetch_pubkey(self, identity: str) -> Optional[bytes]:
+        r = self._request('GET', '/get_pubkey', params={'identity': identity})
+        if r.status_code == 404:
+            return None
+        if r.status_code != 200:
+            raise PKGError(r.status_code, r.text)
+        return ub64(r.json()['pub_b64'])
+
+    def load_filter(self) -> Optional[BloomFilter]:
+        """Download (or revalidate) the PKG's identity filter from `/pubkeys/filter`."""
+        headers = {'If-None-Match': self._filter_etag} if self._filter_etag else {}
+        r = self._request('GET', '/pubkeys/filter', headers=headers)
+        if r.status_code == 200:
+            self._filter = BloomFilter.from_bytes(r.content)
+            self._filter_etag = r.headers.get('ETag')
+        elif r.status_code != 304:
+            raise PKGError(r.status_code, r.text)
+        self._filter_at = time.monotonic()
+        return self._filter
+
+    def _maybe_known(self, identity: str) -> bool:
+        """False only if the identity filter rules `identity` out."""
+        if not self.use_filter:
+            return True
+        if time.monotonic() - self._filter_at > self.filter_ttl:
+            try:
+                self.load_filter()
+            except (PKGError, requests.RequestException):
+                self._filter_at = time.monotonic()  # keep the old filter (or none) until the next ttl
+        if self._filter is None or identity in self._filter:
+            return True
+        self.filtered += 1
+        return False
+
+    def get_pubkey(self, identity: str) -> Optional[bytes]:
+        """Public key bytes for `identity`, or None if the PKG does not know it."""
+        identity = canonicalize_identity(identity)
+        if not self._maybe_known(identity):
+            return None
+        with self._lock:
+            fut = self._inflight.get(identity)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[identity] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return fut.result()
+        try:
+            fut.set_result(self._fetch_pubkey(identity))
+        except BaseException as exc:
+            fut.set_exception(exc)
+        finally:
+            with self._lock:
+                self._inflight.pop(identity, None)
+        return fut.result()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix='pkg-client')
+            return self._executor
+
+    def lookup_many(self, identities: Iterable[str]) -> Dict[str, bytes]:
+        """Concurrent single lookups (at most `max_concurrency` in flight); unknown identities are omitted."""
+        unique = list(dict.fromkeys(canonicalize_many(identities)))
+        results = self._pool().map(tracing.bind(self.get_pubkey), unique)
+        return {identity: pub for identity, pub in zip(unique, results) if pub is not None}
+
+    def _fetch_batch(self, identities: List[str]) -> Dict[str, bytes]:
+        r = self._request('POST', '/get_pubkeys', json={'identities': identities})
+        if r.status_code != 200:
+            raise PKGError(r.status_code, r.text)
+        return {ident: ub64(pub_b64) for ident, pub_b64 in r.json()['pubkeys'].items()}
+
+    def get_pubkeys(self, identities: Iterable[str]) -> Dict[str, bytes]:
+        """Batch lookup via `POST /get_pubkeys`, split into `batch_size` chunks sent concurrently."""
+        unique = [i for i in dict.fromkeys(canonicalize_many(identities)) if self._maybe_known(i)]
+        chunks = [unique[i:i + self.batch_size] for i in range(0, len(unique), self.batch_size)]
+        if len(chunks) <= 1:
+            return self._fetch_batch(chunks[0]) if chunks else {}
+        out: Dict[str, bytes] = {}
+        for part in self._pool().map(tracing.bind(self._fetch_batch), chunks):
+            out.update(part)
+        return out
+
+    __call__ = get_pubkeys  # usable as the SMTP relay's resolver
+
+    def extract(self, identity: str, otp: str) -> bytes:
+        """Private key bytes for `identity`, authorized by an OTP from `/request_extract_code`."""
+        r = self._request('POST', '/extract', json={'identity': canonicalize_identity(identity), 'otp': otp})
+        if r.status_code != 200:
+            raise PKGError(r.status_code, r.text)
+        return ub64(r.json()['private_b64'])
+
+    def get_changes(self, since: int, limit: Optional[int] = None, epoch: Optional[str] = None) -> Dict:
+        """One page of the PKG's `/pubkeys/changes` feed (see `clients.pubkey_replica`), or of one epoch's."""
+        params = {'since': since}
+        if limit:
+            params['limit'] = limit
+        if epoch:
+            params['epoch'] = epoch
+        r = self._request('GET', '/pubkeys/changes', params=params)
+        if r.status_code != 200:
+            raise PKGError(r.status_code, r.text)
+        return r.json()
+
+    def stats(self) -> Dict[str, int]:
+        return {'requests': self.requests, 'retried': self.retried, 'coalesced': self.coalesced,
+                'filtered': self.filtered, 'inflight': len(self._inflight)}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class AsyncPKGClient:
+    """asyncio front end for `PKGClient`.
+
+    Blocking HTTP calls run in a thread pool sized to the concurrency cap;
+    lookups of the same identity awaited concurrently share one task.
+
+    Usage:
+        async with AsyncPKGClient('http://127.0.0.1:5000') as pkg:
+            keys = await pkg.lookup_many(recipients)
+    """
+
+    def __init__(self, pkg_url: str, **kwargs):
+        self.client = PKGClient(pkg_url, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=self.client.max_concurrency,
+                                            thread_name_prefix='pkg-client-async')
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, tracing.bind(fn), *args)
+
+    async def get_pubkey(self, identity: str) -> Optional[bytes]:
+        identity = canonicalize_identity(identity)
+        # Same filter check as the sync lookups; a refresh downloads, so it runs off the event loop
+        if self.client.use_filter and not await self._run(self.client._maybe_known, identity):
+            return None
+        fut = self._inflight.get(identity)
+        if fut is not None:
+            self.client.coalesced += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.ensure_future(self._run(self.client._fetch_pubkey, identity))
+        self._inflight[identity] = fut
+        fut.add_done_callback(lambda _: self._inflight.pop(identity, None))
+        return await asyncio.shield(fut)
+
+    async def lookup_many(self, identities: Iterable[str]) -> Dict[str, bytes]:
+        unique = list(dict.fromkeys(canonicalize_many(identities)))
+        results = await asyncio.gather(*(self.get_pubkey(i) for i in unique))
+        return {identity: pub for identity, pub in zip(unique, results) if pub is not None}
+
+    async def get_pubkeys(self, identities: Iterable[str]) -> Dict[str, bytes]:
+        return await self._run(self.client.get_pubkeys, list(identities))
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+__all__ = ['PKGClient', 'AsyncPKGClient', 'PKGError']
@@ -0,0 +1,274 @@
+"""Client-side replica of the PKG's public-key directory.
+
+Senders that resolve keys from a local replica need no network call per
+message. The replica follows the PKG's `/pubkeys/changes` feed: every
+keystore mutation has a monotonic sequence number, so catching up after being
+offline costs O(changes since the last sync), not a full download.
+
+Epoch keys (`alice@example.com|202611`, see `ibe/epochs.py`) are numbered per
+epoch, so the replica keeps one cursor per epoch the PKG still retains and
+pages each epoch's feed the same way. Epochs that drop out of the PKG's
+`epochs` list are removed with their keys.
+
+On-disk format (all integers big-endian):
+
+    header   magic 'IBEREPL1' | version u8 | reserved 7 | store_id 8 | seq u64
+    records  op u8 | len u16 | identity or epoch label utf8 | payload
+             op 1=put (payload: pub 32), 2=delete, 3=epoch cursor (payload: seq u64),
+             4=drop epoch
+
+New changes are appended as records and only then is `seq` in the header
+advanced (for an epoch: its cursor record follows the epoch's keys), so a
+crash mid-sync at worst re-applies a page (records are idempotent). A torn
+trailing record is dropped on load. The file is
+rewritten without superseded records once they outnumber the live ones.
+If the PKG reports a different `store_id` (its store was replaced), the
+replica starts over from sequence 0.
+
+Usage:
+    replica = PubkeyReplica('pubkeys.replica', 'http://127.0.0.1:5000')
+    replica.sync()
+    pub = replica.get_pubkey('alice@example.com')   # local, no network
+"""
+from __future__ import annotations
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Optional, Union
+
+from clients.pkg_client import PKGClient
+from ibe.epochs import split_epoch
+from ibe.identity import canonicalize_identity, canonicalize_many
+from ibe.sender import ub64
+
+MAGIC = b'IBEREPL1'
+VERSION = 2  # 2 adds the epoch records; version 1 files load unchanged
+_HEADER = struct.Struct('>8sB7x8sQ')
+_RECORD = struct.Struct('>BH')
+_CURSOR = struct.Struct('>Q')
+_SEQ_OFFSET = _HEADER.size - 8
+OP_PUT = 1
+OP_DELETE = 2
+OP_EPOCH = 3
+OP_DROP_EPOCH = 4
+KEY_SIZE = 32
+_PAYLOAD = {OP_PUT: KEY_SIZE, OP_DELETE: 0, OP_EPOCH: _CURSOR.size, OP_DROP_EPOCH: 0}
+
+
+def _encode(op: int, identity: str, pub: Optional[bytes] = None) -> bytes:
+    raw = identity.encode('utf8')
+    return _RECORD.pack(op, len(raw)) + raw + (pub if op == OP_PUT else b'')
+
+
+def _encode_cursor(epoch: str, seq: int) -> bytes:
+    raw = epoch.encode('utf8')
+    return _RECORD.pack(OP_EPOCH, len(raw)) + raw + _CURSOR.pack(seq)
+
+
+class PubkeyReplica:
+    """Local, incrementally synced copy of the PKG's identity -> public key map."""
+
+    def __init__(self, path: str, pkg: Union[str, PKGClient, None] = None, page_size: int = 5000):
+        self.path = path
+        self.pkg = PKGClient(pkg) if isinstance(pkg, str) else pkg
+        self.page_size = page_size
+        self._keys: Dict[str, bytes] = {}
+        self._records = 0
+        self.store_id: Optional[str] = None
+        self.seq = 0
+        self.epochs: Dict[str, int] = {}  # retained epoch -> last applied seq in its feed
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._load()
+
+    # -- persistence ---------------------------------------------------------
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            self._rewrite()
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError('not a public-key replica file: %s' % self.path)
+        magic, version, store_id, seq = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError('not a public-key replica file: %s' % self.path)
+        self.store_id = store_id.hex() if store_id.strip(b'\x00') else None
+        self.seq = seq
+        pos, end = _HEADER.size, len(data)
+        while pos + _RECORD.size <= end:
+            op, n = _RECORD.unpack_from(data, pos)
+            if op not in _PAYLOAD:
+                raise ValueError('corrupt public-key replica file: %s' % self.path)
+            rec_end = pos + _RECORD.size + n + _PAYLOAD[op]
+            if rec_end > end:
+                break
+            name = data[pos + _RECORD.size:pos + _RECORD.size + n].decode('utf8')
+            if op == OP_PUT:
+                self._keys[name] = data[rec_end - KEY_SIZE:rec_end]
+            elif op == OP_DELETE:
+                self._keys.pop(name, None)
+            elif op == OP_EPOCH:
+                self.epochs[name] = _CURSOR.unpack_from(data, rec_end - _CURSOR.size)[0]
+            else:
+                self._forget_epoch(name)
+            self._records += 1
+            pos = rec_end
+        if pos != end:  # torn write at the tail: drop it
+            with open(self.path, 'r+b') as f:
+                f.truncate(pos)
+
+    def _header(self) -> bytes:
+        store_id = bytes.fromhex(self.store_id) if self.store_id else b'\x00' * 8
+        return _HEADER.pack(MAGIC, VERSION, store_id, self.seq)
+
+    def _rewrite(self):
+        """Write a compacted file (one record per live identity) and swap it in atomically."""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(self._header())
+            f.write(b''.join(_encode(OP_PUT, i, pub) for i, pub in self._keys.items()))
+            f.write(b''.join(_encode_cursor(e, seq) for e, seq in self.epochs.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._records = len(self._keys) + len(self.epochs)
+
+    def _append(self, records: bytes, count: int):
+        with open(self.path, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            f.write(records)
+            f.flush()
+            os.fsync(f.fileno())
+            # Advance the sequence number only once the records are durable
+            f.seek(_SEQ_OFFSET)
+            f.write(struct.pack('>Q', self.seq))
+            f.flush()
+            os.fsync(f.fileno())
+        self._records += count
+        if self._records > 2 * len(self._keys) + 1024:
+            self._rewrite()
+
+    # -- sync ----------------------------------------------------------------
+
+    def apply(self, page: Dict) -> int:
+        """Apply one page of the change feed; returns the number of changes applied."""
+        with self._lock:
+            if page['store_id'] != self.store_id:
+                # Following a different store: start over
+                self._keys.clear()
+                self.epochs.clear()
+                self.store_id = page['store_id']
+                self.seq = 0
+                self._rewrite()
+            out = []
+            for change in page['changes']:
+                if change['seq'] <= self.seq:
+                    continue
+                identity = change['identity']
+                if change.get('op', 'put') == 'delete':
+                    self._keys.pop(identity, None)
+                    out.append(_encode(OP_DELETE, identity))
+                else:
+                    pub = ub64(change['pub_b64'])
+                    self._keys[identity] = pub
+                    out.append(_encode(OP_PUT, identity, pub))
+            self.seq = max(self.seq, page['next'])
+            self._append(b''.join(out), len(out))
+            return len(out)
+
+    def apply_epoch(self, epoch: str, page: Dict) -> int:
+        """Apply one page of an epoch's feed (`get_changes(..., epoch=)`); returns the number applied."""
+        with self._lock:
+            since = self.epochs.get(epoch, 0)
+            out = []
+            for change in page['changes']:
+                if change['seq'] <= since:
+                    continue
+                pub = ub64(change['pub_b64'])
+                self._keys[change['identity']] = pub
+                out.append(_encode(OP_PUT, change['identity'], pub))
+            self.epochs[epoch] = max(since, page['next'])
+            # The cursor goes after the keys it covers
+            self._append(b''.join(out) + _encode_cursor(epoch, self.epochs[epoch]), len(out) + 1)
+            return len(out)
+
+    def _forget_epoch(self, epoch: str):
+        self.epochs.pop(epoch, None)
+        for identity in [i for i in self._keys if split_epoch(i)[1] == epoch]:
+            del self._keys[identity]
+
+    def drop_epoch(self, epoch: str):
+        """Remove an epoch the PKG no longer retains, with all its keys."""
+        with self._lock:
+            self._forget_epoch(epoch)
+            self._append(_encode(OP_DROP_EPOCH, epoch), 1)
+
+    def sync(self) -> int:
+        """Pull all changes since the last sync; returns how many were applied."""
+        if self.pkg is None:
+            raise ValueError('replica has no PKG to sync from')
+        applied = 0
+        while True:
+            page = self.pkg.get_changes(self.seq, self.page_size)
+            if page['store_id'] != self.store_id and self.seq:
+                # The PKG's store was replaced; this page is relative to our old seq, so reset and refetch
+                self.apply({'store_id': page['store_id'], 'changes': [], 'next': 0})
+                continue
+            applied += self.apply(page)
+            if not page['more']:
+                break
+        retained = page.get('epochs')
+        if retained is None:  # a PKG without epoch feeds
+            return applied
+        for epoch in [e for e in self.epochs if e not in retained]:
+            self.drop_epoch(epoch)
+        for epoch in retained:
+            applied += self._sync_epoch(epoch)
+        return applied
+
+    def _sync_epoch(self, epoch: str) -> int:
+        applied = 0
+        while True:
+            page = self.pkg.get_changes(self.epochs.get(epoch, 0), self.page_size, epoch=epoch)
+            if page['store_id'] != self.store_id:
+                return applied  # replaced meanwhile; the next sync starts over
+            applied += self.apply_epoch(epoch, page)
+            if not page['more']:
+                return applied
+
+    def start(self, interval: float = 30.0):
+        """Keep syncing in a daemon thread every `interval` seconds."""
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sync()
+                except Exception:
+                    pass  # PKG unreachable: keep serving the local copy, retry next tick
+        self._thread = threading.Thread(target=loop, name='pubkey-replica', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # -- lookups -------------------------------------------------------------
+
+    def get_pubkey(self, identity: str) -> Optional[bytes]:
+        return self._keys.get(canonicalize_identity(identity))
+
+    def get_pubkeys(self, identities: Iterable[str]) -> Dict[str, bytes]:
+        keys = self._keys
+        return {i: keys[i] for i in canonicalize_many(identities) if i in keys}
+
+    __call__ = get_pubkeys  # usable as the SMTP relay's resolver
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, identity: str) -> bool:
+        return canonicalize_identity(identity) in self._keys
+
+
+__all__ = ['PubkeyReplica']
@@ -0,0 +1,119 @@
+"""Bloom filter over canonical identities.
+
+The PKG keeps one of these for every identity it has issued a key to and
+serves it at `/pubkeys/filter`. Clients download it and drop recipients the
+filter rules out before asking the PKG: a negative answer is definite (for the
+identities the filter was built from), a positive one is correct with
+probability 1 - `fp_rate`.
+
+Bit positions use double hashing over one BLAKE2b digest
+(index_i = h1 + i*h2 mod m), so building and probing cost one hash per
+identity regardless of `k`.
+
+Serialized form (big-endian): magic 'IBEBLOM1' | version u8 | k u8 | reserved 2
+| m_bits u64 | count u64 | bit array.
+
+Configuration via environment variables (PKG side):
+- PKG_BLOOM_CAPACITY (default 100000) — identities before the filter is rebuilt larger
+- PKG_BLOOM_FP_RATE (default 0.01) — target false-positive rate at capacity
+"""
+from __future__ import annotations
+import hashlib
+import math
+import os
+import struct
+from typing import Iterable
+
+PKG_BLOOM_CAPACITY = int(os.environ.get('PKG_BLOOM_CAPACITY', '100000'))
+PKG_BLOOM_FP_RATE = float(os.environ.get('PKG_BLOOM_FP_RATE', '0.01'))
+
+MAGIC = b'IBEBLOM1'
+VERSION = 1
+_HEADER = struct.Struct('>8sBB2xQQ')
+_MASK64 = (1 << 64) - 1
+
+
+def _hashes(identity: str):
+    d = hashlib.blake2b(identity.encode('utf8'), digest_size=16).digest()
+    return int.from_bytes(d[:8], 'little'), int.from_bytes(d[8:], 'little') | 1
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` items at `fp_rate`.
+
+    Usage:
+        f = BloomFilter(capacity=1_000_000, fp_rate=0.001)
+        f.add('alice@example.com')
+        'bob@example.com' in f   # False unless a false positive
+    """
+
+    def __init__(self, capacity: int = None, fp_rate: float = None):
+        capacity = max(1, capacity or PKG_BLOOM_CAPACITY)
+        fp_rate = fp_rate or PKG_BLOOM_FP_RATE
+        if not 0 < fp_rate < 1:
+            raise ValueError('fp_rate must be between 0 and 1')
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        m = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        self.m = (m + 7) // 8 * 8
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray(self.m // 8)
+        self.count = 0
+
+    def add(self, identity: str):
+        h1, h2 = _hashes(identity)
+        bits, m = self.bits, self.m
+        for i in range(self.k):
+            pos = ((h1 + i * h2) & _MASK64) % m
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def update(self, identities: Iterable[str]):
+        for identity in identities:
+            self.add(identity)
+
+    def __contains__(self, identity: str) -> bool:
+        h1, h2 = _hashes(identity)
+        bits, m = self.bits, self.m
+        for i in range(self.k):
+            pos = ((h1 + i * h2) & _MASK64) % m
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def full(self) -> bool:
+        """True once more items were added than the filter was sized for."""
+        return self.count > self.capacity
+
+    def estimated_fp_rate(self) -> float:
+        return (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(MAGIC, VERSION, self.k, self.m, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        if len(data) < _HEADER.size:
+            raise ValueError('not a serialized Bloom filter')
+        magic, version, k, m, count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a serialized Bloom filter')
+        # k = 0 would match everything and m = 0 cannot be probed; the bit array must be exactly m bits
+        if k < 1 or m < 8 or m % 8:
+            raise ValueError('invalid Bloom filter header (k=%d, m=%d)' % (k, m))
+        if len(data) != _HEADER.size + m // 8:
+            raise ValueError('Bloom filter bit array is %d bytes, header says %d'
+                             % (len(data) - _HEADER.size, m // 8))
+        f = cls.__new__(cls)
+        f.m, f.k, f.count = m, k, count
+        f.capacity = max(1, round(m * math.log(2) / k))
+        f.fp_rate = f.estimated_fp_rate()
+        f.bits = bytearray(data[_HEADER.size:])
+        return f
+
+
+__all__ = ['BloomFilter']
@@ -0,0 +1,126 @@
+"""Bounded in-memory cache with TTL expiry and LRU eviction.
+
+Used to hold parsed key objects (and other small derived values) so hot
+paths do not repeat base64 decoding and key construction on every request.
+Entries expire after `ttl` seconds and the least recently used entry is
+evicted once `max_entries` is reached. The cache is thread-safe so it can be
+shared by Flask worker threads.
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUTTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Usage:
+        cache = LRUTTLCache(max_entries=1024, ttl=900)
+        cache.set(('session', 'alice@example.com'), key_obj)
+        key_obj = cache.get(('session', 'alice@example.com'))
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 900.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_entries <= 0:
+            raise ValueError('max_entries must be positive')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, value); ordered from least to most recently used
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else self._clock() + ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            ent = self._data.get(key)
+            if ent is None:
+                self.misses += 1
+                return default
+            expires_at, value = ent
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (self._expiry(ttl), value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the cached value for `key`, computing it with `factory` on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            ent = self._data.pop(key, None)
+        return default if ent is None else ent[1]
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove every entry whose key matches `predicate`. Returns the count removed."""
+        with self._lock:
+            doomed = [k for k in self._data if predicate(k)]
+            for k in doomed:
+                del self._data[k]
+        return len(doomed)
+
+    def purge_expired(self) -> int:
+        """Drop all expired entries now instead of waiting for them to be touched."""
+        now = self._clock()
+        with self._lock:
+            doomed = [k for k, (exp, _) in self._data.items() if exp is not None and now >= exp]
+            for k in doomed:
+                del self._data[k]
+            self.expirations += len(doomed)
+        return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Metrics snapshot: current size, capacity, hit/miss and eviction counters."""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+__all__ = ['LRUTTLCache']
@@ -15,6 +15,8 @@ import json
 import os
 from typing import Any, Dict, Tuple
 
+from ibe import tracing
+
 try:
     from charm.toolbox.pairinggroup import PairingGroup
     from charm.schemes.ibenc.ibenc_bf01 import IBE_BF01
@@ -48,6 +50,7 @@ class CharmIBE:
         self.group = PairingGroup(group_name)
         self.ibe = IBE_BF01(self.group)
 
+    @tracing.traced('charm.setup')
     def setup(self) -> Tuple[Dict[str, Any], bytes]:
         mpk, msk = self.ibe.setup()
         # Serialize mpk and msk to base64 so they can be stored/transferred
@@ -57,6 +60,7 @@ class CharmIBE:
         # Return mpk as dict and msk as raw bytes (caller should keep msk secret)
         return mpk_blob, msk_bytes
 
+    @tracing.traced('charm.extract')
     def extract(self, msk_bytes: bytes, identity: str) -> str:
         # Convert msk bytes back to charm object
         msk = bytesToObject(msk_bytes, self.group)
@@ -69,6 +73,7 @@ class CharmIBE:
         # Return empty to keep interface compatible with DemoIBE
         return b''
 
+    @tracing.traced('charm.encrypt')
     def encrypt(self, identity: str, message: bytes) -> Dict[str, Any]:
         # The charm IBE encrypt method returns a ciphertext (scheme-specific)
         # We'll serialize it with objectToBytes and base64 encode for JSON transport
@@ -79,6 +84,7 @@ class CharmIBE:
         ct_bytes = objectToBytes(ct, self.group)
         return {"charm_ct_b64": b64(ct_bytes)}
 
+    @tracing.traced('charm.decrypt')
     def decrypt(self, sk_b64: str, envelope: Dict[str, Any]) -> bytes:
         sk_bytes = ub64(sk_b64)
         sk = bytesToObject(sk_bytes, self.group)
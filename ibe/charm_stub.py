@@ -16,6 +16,8 @@ be replaced by a fully tested class after you install charm-crypto.
 from __future__ import annotations
 import os
 
+from ibe import tracing
+
 try:
     # Try importing a common Boneh-Franklin implementation in charm
     from charm.toolbox.pairinggroup import PairingGroup
@@ -44,6 +46,7 @@ class CharmIBE:
         self.mpk = None
         self.msk = None
 
+    @tracing.traced('charm.setup')
     def setup(self):
         mpk, msk = self.ibe.setup()
         self.mpk = mpk
@@ -51,6 +54,7 @@ class CharmIBE:
         # Serialize mpk in a JSON-friendly manner; exact representation depends on charm
         return {'version': 1, 'mpk': str(mpk)}, self.msk
 
+    @tracing.traced('charm.extract')
     def extract(self, msk: bytes, identity: str) -> bytes:
         # charm's extract returns a private key object; you must serialize it
         sk = self.ibe.extract(msk, identity)
@@ -63,12 +67,14 @@ class CharmIBE:
         # We return a placeholder to match the DemoIBE interface.
         return b''
 
+    @tracing.traced('charm.encrypt')
     def encrypt(self, identity: str, message: bytes):
         # The charm scheme's encrypt expects plaintext in a specific format.
         # Use the scheme's api: self.ibe.encrypt(self.mpk, identity, message)
         ct = self.ibe.encrypt(self.mpk, identity, message)
         return {'charm_ct': ct}
 
+    @tracing.traced('charm.decrypt')
     def decrypt(self, private_key_bytes: bytes, envelope: dict) -> bytes:
         # Convert serialized private key back to charm object, then decrypt
         sk = private_key_bytes
@@ -0,0 +1,289 @@
+"""Memory-compact keystore for millions of identities.
+
+The JSON keystore keeps a dict per identity holding two base64 strings, which
+costs several hundred bytes of Python objects per identity. This store keeps
+everything in a few flat buffers instead:
+
+    records.bin  fixed 96-byte records, in insertion (= sequence) order:
+                 hash u64 | seq u64 | pub 32 | priv 32 | ident_off u64 | ident_len u32 | pad 4
+    idents.bin   UTF-8 identity bytes, back to back (each identity stored once)
+    index.bin    open-addressing hash table (linear probing) of u64 slots holding
+                 record_no + 1 (0 = empty), preceded by the record count it covers
+
+Lookups hash the identity (BLAKE2b-64), probe the table and compare the stored
+hash and identity bytes, so they are O(1) and create no per-identity objects.
+That is about 96 + len(identity) + ~12 bytes of table per identity, or roughly
+1.3 GB for 10M identities.
+
+`records.bin` and `idents.bin` are append-only: `add` appends one record, so
+issuing a key does not rewrite the store. The index is written by `flush()`,
+`close()`, and automatically from `add` once enough records have been appended
+since the last write (a quarter of the store, at least `flush_every`) or
+`flush_interval` seconds have passed. The growing threshold keeps the
+amortized cost of index writes per `add` constant. On open, records added
+after the last index write are re-inserted, so the cost of a crash or an
+unclean shutdown is bounded by that threshold.
+
+With `use_mmap=True` the files (and a current index) are memory-mapped
+read-only. Opening is then O(1) and pages are loaded on demand, which suits read-mostly processes. `add`
+is not available in that mode.
+
+Configuration via environment variables:
+- IBE_COMPACT_FLUSH_EVERY (default 1000) — appends before the index is rewritten (at least)
+- IBE_COMPACT_FLUSH_SECONDS (default 60) — longest the index may lag behind the records
+"""
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Iterator, List, Optional, Tuple
+
+_RECORD = struct.Struct('<QQ32s32sQI4x')
+RECORD_SIZE = _RECORD.size
+_HASH = struct.Struct('<Q')
+_INDEX_HEAD = struct.Struct('<8sQQ')  # magic, covered record count, table capacity
+_INDEX_MAGIC = b'IBEIDX01'
+_MIN_CAPACITY = 1024
+_MAX_LOAD = 0.7
+
+IBE_COMPACT_FLUSH_EVERY = int(os.environ.get('IBE_COMPACT_FLUSH_EVERY', '1000'))
+IBE_COMPACT_FLUSH_SECONDS = float(os.environ.get('IBE_COMPACT_FLUSH_SECONDS', '60'))
+
+
+def identity_hash(raw: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little')
+
+
+class CompactKeyStore:
+    """Packed identity -> (public key, private key, seq) store backed by a directory.
+
+    Usage:
+        store = CompactKeyStore('keys.d')
+        store.add('alice@example.com', pub, priv, seq=1)
+        store.get_pub('alice@example.com')
+        store.close()
+    """
+
+    def __init__(self, directory: str, use_mmap: bool = False, flush_every: int = None,
+                 flush_interval: float = None):
+        self.directory = directory
+        self.read_only = use_mmap
+        self.flush_every = flush_every or IBE_COMPACT_FLUSH_EVERY
+        self.flush_interval = IBE_COMPACT_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        self._records_path = os.path.join(directory, 'records.bin')
+        self._idents_path = os.path.join(directory, 'idents.bin')
+        self._index_path = os.path.join(directory, 'index.bin')
+        for path in (self._records_path, self._idents_path):
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+        self._maps = []
+        if use_mmap:
+            self._records = self._map(self._records_path)
+            self._idents = self._map(self._idents_path)
+        else:
+            with open(self._records_path, 'rb') as f:
+                self._records = bytearray(f.read())
+            with open(self._idents_path, 'rb') as f:
+                self._idents = bytearray(f.read())
+        # Drop a torn trailing record left by a crash mid-append
+        self.count = len(self._records) // RECORD_SIZE
+        if not use_mmap and len(self._records) != self.count * RECORD_SIZE:
+            del self._records[self.count * RECORD_SIZE:]
+            with open(self._records_path, 'r+b') as f:
+                f.truncate(len(self._records))
+        self._load_index()
+        self._records_file = None if use_mmap else open(self._records_path, 'ab')
+        self._idents_file = None if use_mmap else open(self._idents_path, 'ab')
+
+    def _map(self, path: str):
+        if os.path.getsize(path) == 0:
+            return b''
+        f = open(path, 'rb')
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append((f, m))
+        return m
+
+    # -- index ---------------------------------------------------------------
+
+    def _load_index(self):
+        covered = 0
+        self._table = None
+        if os.path.exists(self._index_path) and os.path.getsize(self._index_path) >= _INDEX_HEAD.size:
+            with open(self._index_path, 'rb') as f:
+                magic, covered, capacity = _INDEX_HEAD.unpack(f.read(_INDEX_HEAD.size))
+                if magic == _INDEX_MAGIC and covered <= self.count and capacity * _MAX_LOAD >= self.count:
+                    if self.read_only and covered == self.count:
+                        # Probe the mapped table directly: nothing is read until it is used
+                        m = self._map(self._index_path)
+                        self._table = memoryview(m)[_INDEX_HEAD.size:].cast('Q')
+                    else:
+                        self._table = array('Q')
+                        self._table.frombytes(f.read(capacity * 8))
+                    if len(self._table) != capacity:
+                        self._table = None
+        if self._table is None:
+            capacity = _MIN_CAPACITY
+            while capacity * _MAX_LOAD < self.count:
+                capacity *= 2
+            self._table = array('Q', bytes(8 * capacity))
+            covered = 0
+        self._mask = len(self._table) - 1
+        for rec in range(covered, self.count):
+            self._insert_slot(_HASH.unpack_from(self._records, rec * RECORD_SIZE)[0], rec)
+
+    def _insert_slot(self, h: int, rec: int):
+        table, mask = self._table, self._mask
+        i = h & mask
+        while table[i]:
+            i = (i + 1) & mask
+        table[i] = rec + 1
+
+    def _grow(self):
+        self._table = array('Q', bytes(16 * len(self._table)))
+        self._mask = len(self._table) - 1
+        records = self._records
+        for rec in range(self.count):
+            self._insert_slot(_HASH.unpack_from(records, rec * RECORD_SIZE)[0], rec)
+
+    def _find(self, identity: str) -> int:
+        """Record number for `identity`, or -1."""
+        raw = identity.encode('utf8')
+        h = identity_hash(raw)
+        table, mask, records, idents = self._table, self._mask, self._records, self._idents
+        i = h & mask
+        while True:
+            slot = table[i]
+            if not slot:
+                return -1
+            rec = slot - 1
+            rh, _, _, _, off, n = _RECORD.unpack_from(records, rec * RECORD_SIZE)
+            if rh == h and idents[off:off + n] == raw:
+                return rec
+            i = (i + 1) & mask
+
+    # -- access --------------------------------------------------------------
+
+    def add(self, identity: str, pub: bytes, priv: bytes, seq: int):
+        """Append a new identity; raises KeyError if it already exists."""
+        if self.read_only:
+            raise ValueError('store is opened read-only (use_mmap=True)')
+        if self._find(identity) >= 0:
+            raise KeyError(identity)
+        raw = identity.encode('utf8')
+        h = identity_hash(raw)
+        rec = _RECORD.pack(h, seq, pub, priv, len(self._idents), len(raw))
+        # Identity bytes first, so a record never points past the end of idents.bin
+        self._idents_file.write(raw)
+        self._idents_file.flush()
+        self._records_file.write(rec)
+        self._records_file.flush()
+        self._idents += raw
+        self._records += rec
+        self.count += 1
+        if self.count > len(self._table) * _MAX_LOAD:
+            self._grow()
+        else:
+            self._insert_slot(h, self.count - 1)
+        self._unflushed += 1
+        if self._unflushed >= max(self.flush_every, self.count // 4) \
+                or time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def _record(self, identity: str) -> Optional[Tuple]:
+        rec = self._find(identity)
+        return None if rec < 0 else _RECORD.unpack_from(self._records, rec * RECORD_SIZE)
+
+    def get_pub(self, identity: str) -> Optional[bytes]:
+        r = self._record(identity)
+        return None if r is None else bytes(r[2])
+
+    def get_priv(self, identity: str) -> Optional[bytes]:
+        r = self._record(identity)
+        return None if r is None else bytes(r[3])
+
+    def get_seq(self, identity: str) -> Optional[int]:
+        r = self._record(identity)
+        return None if r is None else r[1]
+
+    def __contains__(self, identity: str) -> bool:
+        return self._find(identity) >= 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def entry(self, rec: int) -> Tuple[int, str, bytes]:
+        """(seq, identity, pub) of record number `rec` (records are in sequence order)."""
+        _, seq, pub, _, off, n = _RECORD.unpack_from(self._records, rec * RECORD_SIZE)
+        return seq, bytes(self._idents[off:off + n]).decode('utf8'), bytes(pub)
+
+    def __iter__(self) -> Iterator[str]:
+        for rec in range(self.count):
+            yield self.entry(rec)[1]
+
+    def records(self) -> Iterator[Tuple[str, bytes, bytes, int]]:
+        """(identity, pub, priv, seq) for every record, in sequence order."""
+        for rec in range(self.count):
+            _, seq, pub, priv, off, n = _RECORD.unpack_from(self._records, rec * RECORD_SIZE)
+            yield bytes(self._idents[off:off + n]).decode('utf8'), bytes(pub), bytes(priv), seq
+
+    def first_after(self, seq: int) -> int:
+        """Record number of the first record with sequence number > `seq` (binary search)."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _RECORD.unpack_from(self._records, mid * RECORD_SIZE)[1] <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries_after(self, seq: int, limit: int) -> List[Tuple[int, str, bytes]]:
+        start = self.first_after(seq)
+        return [self.entry(rec) for rec in range(start, min(start + limit, self.count))]
+
+    @property
+    def last_seq(self) -> int:
+        return _RECORD.unpack_from(self._records, (self.count - 1) * RECORD_SIZE)[1] if self.count else 0
+
+    # -- persistence ---------------------------------------------------------
+
+    def flush(self):
+        """Make appended records durable and write the hash index so reopening is O(1)."""
+        if self.read_only or self._closed:
+            return
+        for f in (self._idents_file, self._records_file):
+            f.flush()
+            os.fsync(f.fileno())
+        tmp = self._index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_HEAD.pack(_INDEX_MAGIC, self.count, len(self._table)))
+            f.write(self._table.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._index_path)
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for f in (self._idents_file, self._records_file):
+            if f is not None:
+                f.close()
+        self._table = None  # release any view into a mapped index before unmapping
+        for f, m in self._maps:
+            m.close()
+            f.close()
+        self._maps = []
+
+
+__all__ = ['CompactKeyStore', 'RECORD_SIZE', 'identity_hash']
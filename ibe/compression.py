@@ -0,0 +1,166 @@
+"""Optional pre-encryption compression for envelopes.
+
+Mail bodies (HTML, plain text, CSV attachments) compress well, and whatever
+is saved before encryption is also saved again after base64. Compression is
+chosen per message:
+
+- payloads smaller than `COMPRESS_MIN_SIZE` are left alone,
+- payloads that already look compressed (gzip/zip/png/jpeg/zstd/... magic
+  bytes, or a sample that zlib cannot shrink) are left alone,
+- otherwise the best available codec is used: zstd (if `zstandard` is
+  installed), then zlib. lz4 (if `lz4` is installed) is preferred for very
+  large non-text payloads where speed matters more than ratio.
+
+Decompression is streamed in bounded chunks and aborts once the output
+exceeds `MAX_RATIO` times the compressed size (or `MAX_OUTPUT_BYTES`), so a
+crafted envelope cannot be used as a decompression bomb. Senders check the
+same limits (`within_limits`) and send a message uncompressed when the
+receiver would refuse to expand it, e.g. very repetitive CSV or logs.
+
+Configuration via environment variables:
+- IBE_COMPRESS_MIN_SIZE (default 512)
+- IBE_DECOMPRESS_MAX_RATIO (default 100)
+- IBE_DECOMPRESS_MAX_BYTES (default 256 MiB)
+"""
+from __future__ import annotations
+import os
+import zlib
+from typing import Dict, Optional
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+try:
+    import lz4.frame as _lz4
+except ImportError:
+    _lz4 = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('IBE_COMPRESS_MIN_SIZE', '512'))
+MAX_RATIO = int(os.environ.get('IBE_DECOMPRESS_MAX_RATIO', '100'))
+MAX_OUTPUT_BYTES = int(os.environ.get('IBE_DECOMPRESS_MAX_BYTES', str(256 * 1024 * 1024)))
+LARGE_BINARY_SIZE = 4 * 1024 * 1024
+_CHUNK = 64 * 1024
+_SAMPLE = 4096
+
+# Leading bytes of formats that are already compressed
+_COMPRESSED_MAGIC = (
+    b'\x1f\x8b',              # gzip
+    b'PK\x03\x04',            # zip, docx, xlsx, jar
+    b'\x89PNG',               # png
+    b'\xff\xd8\xff',          # jpeg
+    b'GIF8',                  # gif
+    b'\x28\xb5\x2f\xfd',      # zstd
+    b'\x04\x22\x4d\x18',      # lz4 frame
+    b'BZh',                   # bzip2
+    b'\xfd7zXZ\x00',          # xz
+    b'7z\xbc\xaf\x27\x1c',    # 7z
+    b'Rar!',                  # rar
+    b'OggS',                  # ogg
+    b'ID3',                   # mp3
+)
+
+
+class DecompressionBombError(ValueError):
+    """Raised when decompressed output exceeds the configured limits."""
+
+
+def available_codecs() -> Dict[str, bool]:
+    return {'zlib': True, 'zstd': _zstd is not None, 'lz4': _lz4 is not None}
+
+
+def _looks_compressed(data: bytes) -> bool:
+    if data.startswith(_COMPRESSED_MAGIC) or data[4:8] == b'ftyp':  # mp4/mov
+        return True
+    sample = data[:_SAMPLE]
+    return len(zlib.compress(sample, 1)) > 0.9 * len(sample)
+
+
+def _looks_text(data: bytes) -> bool:
+    sample = data[:_SAMPLE]
+    return b'\x00' not in sample
+
+
+def choose_codec(data: bytes, min_size: int = None) -> Optional[str]:
+    """Pick a codec for `data`, or None when compression is not worthwhile."""
+    min_size = COMPRESS_MIN_SIZE if min_size is None else min_size
+    if len(data) < min_size or _looks_compressed(data):
+        return None
+    if _lz4 is not None and len(data) >= LARGE_BINARY_SIZE and not _looks_text(data):
+        return 'lz4'
+    if _zstd is not None:
+        return 'zstd'
+    return 'zlib'
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    if codec == 'zlib':
+        return zlib.compress(data, 6)
+    if codec == 'zstd' and _zstd is not None:
+        return _zstd.ZstdCompressor(level=3).compress(data)
+    if codec == 'lz4' and _lz4 is not None:
+        return _lz4.compress(data)
+    raise ValueError('unsupported codec: %s' % codec)
+
+
+def _limit(compressed_len: int, max_ratio: int, max_output: int) -> int:
+    return min(max_output, max(compressed_len, 1) * max_ratio)
+
+
+def within_limits(original_len: int, compressed_len: int) -> bool:
+    """Whether `decompress` (default limits) accepts `original_len` bytes expanded from `compressed_len`."""
+    return original_len <= _limit(compressed_len, MAX_RATIO, MAX_OUTPUT_BYTES)
+
+
+def decompress(codec: str, data: bytes, max_ratio: int = None, max_output: int = None) -> bytes:
+    """Decompress `data` in bounded chunks, refusing to expand past the limits."""
+    limit = _limit(len(data), MAX_RATIO if max_ratio is None else max_ratio,
+                   MAX_OUTPUT_BYTES if max_output is None else max_output)
+    out = bytearray()
+    if codec == 'zlib':
+        d = zlib.decompressobj()
+        buf = data
+        while not d.eof:
+            chunk = d.decompress(buf, _CHUNK)
+            buf = d.unconsumed_tail
+            out += chunk
+            if len(out) > limit:
+                raise DecompressionBombError('decompressed size exceeds limit')
+            if not chunk and not buf:
+                break
+        if not d.eof:
+            raise ValueError('truncated zlib stream')
+    elif codec == 'zstd' and _zstd is not None:
+        reader = _zstd.ZstdDecompressor().stream_reader(data)
+        while True:
+            chunk = reader.read(_CHUNK)
+            if not chunk:
+                break
+            out += chunk
+            if len(out) > limit:
+                raise DecompressionBombError('decompressed size exceeds limit')
+    elif codec == 'lz4' and _lz4 is not None:
+        d = _lz4.LZ4FrameDecompressor()
+        buf = data
+        while not d.eof:
+            out += d.decompress(buf, max_length=_CHUNK)
+            buf = b''
+            if len(out) > limit:
+                raise DecompressionBombError('decompressed size exceeds limit')
+            if d.needs_input and not d.eof:
+                raise ValueError('truncated lz4 frame')
+    else:
+        raise ValueError('unsupported codec: %s' % codec)
+    if len(out) > limit:
+        raise DecompressionBombError('decompressed size exceeds limit')
+    return bytes(out)
+
+
+def codec_aad(codec: Optional[str]) -> Optional[bytes]:
+    """Associated data binding the codec name into the AEAD tag (None when uncompressed)."""
+    return None if codec is None else b'codec=' + codec.encode('ascii')
+
+
+__all__ = ['choose_codec', 'compress', 'decompress', 'within_limits', 'available_codecs', 'codec_aad',
+           'DecompressionBombError']
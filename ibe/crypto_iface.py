@@ -7,32 +7,30 @@ without charm-crypto. Replace `DemoIBE` with a real IBE implementation later.
 """
 from __future__ import annotations
 import os
-import base64
+import bisect
+import hashlib
+import itertools
 import json
-import unicodedata
-from typing import Tuple, Dict, Any
+import threading
+from typing import Tuple, Dict, Any, Iterable, Iterator, List, Optional
 
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
 
+from ibe.bloom import PKG_BLOOM_CAPACITY, BloomFilter
+from ibe import tracing
+from ibe.compact_store import CompactKeyStore
+from ibe.epochs import EpochError, EpochKeyStore, split_epoch, with_epoch
+from ibe.eph_pool import EphemeralKeyPool, default_pool, new_ephemeral
+from ibe.identity import canonicalize_identity, canonicalize_many
+from ibe.snapshot import Snapshot, sorted_by_seq, write_snapshot
+from ibe.sender import (IBE_COMPRESSION, _derive_key, _open_payload, _seal_payload, b64,
+                        decrypt_with_privkey, encrypt_to_pubkey, load_private_key, ub64)
 
-def b64(b: bytes) -> str:
-    return base64.b64encode(b).decode('ascii')
-
-
-def ub64(s: str) -> bytes:
-    return base64.b64decode(s)
-
-
-def canonicalize_identity(identity: str) -> str:
-    """Canonicalize an identity string (email) for consistent usage.
-    
-    Applies: strip whitespace, lowercase, Unicode NFC normalization.
-    Use this in Extract, Encrypt, and all identity lookups to prevent mismatches.
-    """
-    return unicodedata.normalize('NFC', identity.strip().lower())
+# Keystore layout: 'json' (everything in the store file) or 'compact' (keys in ibe.compact_store)
+IBE_KEYSTORE = os.environ.get('IBE_KEYSTORE', 'json')
 
 
 class IBEInterface:
@@ -71,9 +69,91 @@ class DemoIBE(IBEInterface):
     real IBE, replace this with a charm-crypto based algorithm.
     """
 
-    def __init__(self, store_path: str = None):
+    def __init__(self, store_path: str = None, compression: str = None,
+                 eph_pool: EphemeralKeyPool = None, aead_suite: int = None, keystore: str = None,
+                 snapshot: str = None, lazy: bool = False):
         self.store_path = store_path or os.path.join(os.path.dirname(__file__), '..', 'pkg_data.json')
-        self._load()
+        keystore = keystore or IBE_KEYSTORE
+        if keystore not in ('json', 'compact'):
+            raise ValueError('unknown keystore %r' % keystore)
+        self._keystore = keystore
+        self._snapshot = snapshot
+        self.compression = compression or IBE_COMPRESSION
+        # AEAD suite for new envelopes; None follows aead.preferred_suite() (IBE_AEAD_SUITE)
+        self.aead_suite = aead_suite
+        # Optional pool of pre-generated ephemeral keys (IBE_EPH_POOL_SIZE enables a shared one)
+        self.eph_pool = eph_pool if eph_pool is not None else default_pool()
+        self._lock = threading.RLock()
+        self._bloom = None
+        self._ready = False
+        self._opening = False
+        self._pending_mpk = None
+        # lazy=True defers reading the keystore to first use (or an explicit `preload()`)
+        if not lazy:
+            self.preload()
+
+    def preload(self):
+        """Open the keystore now; with `lazy=True` the first operation needing it does this."""
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready or self._opening:  # the opening thread re-enters via the properties
+                return
+            self._opening = True
+            try:
+                # Compact mode keeps identities in packed buffers next to the store file; the
+                # store file then only holds the MPK and sequence metadata.
+                self._keys = CompactKeyStore(os.path.splitext(self.store_path)[0] + '.keys') \
+                    if self._keystore == 'compact' else None
+                # Optional read-only base layer: a memory-mapped ibe.snapshot file consulted for
+                # identities the store itself does not hold. New keys still go to the store.
+                self._base = Snapshot(self._snapshot, use_mmap=True) if self._snapshot else None
+                # Keys of epoch identities (`alice@example.com|202611`), one directory per epoch
+                self._epochs = EpochKeyStore(os.path.splitext(self.store_path)[0] + '.epochs')
+                self._load()
+                if self._pending_mpk is not None and self._store.get('mpk') != self._pending_mpk:
+                    self._store['mpk'] = self._pending_mpk
+                    self._save()
+                self._ready = True
+            finally:
+                self._opening = False
+
+    @property
+    def store(self) -> Dict[str, Any]:
+        if not self._ready:
+            self.preload()
+        return self._store
+
+    @store.setter
+    def store(self, value: Dict[str, Any]):
+        self._store = value
+
+    @property
+    def keys(self) -> CompactKeyStore:
+        if not self._ready:
+            self.preload()
+        return self._keys
+
+    @property
+    def base(self) -> Snapshot:
+        if not self._ready:
+            self.preload()
+        return self._base
+
+    @property
+    def epochs(self) -> EpochKeyStore:
+        if not self._ready:
+            self.preload()
+        return self._epochs
+
+    def close(self):
+        """Write the compact index and release keystore files (no-op if the keystore was never opened)."""
+        with self._lock:
+            if not self._ready:
+                return
+            for store in (self._keys, self._base, self._epochs):
+                if store is not None:
+                    store.close()
 
     def _load(self):
         try:
@@ -81,11 +161,93 @@ class DemoIBE(IBEInterface):
                 self.store = json.load(f)
         except Exception:
             self.store = {"identities": {}, "mpk": {}}
+        self._index_changes()
+
+    def _index_changes(self):
+        # Every keystore mutation gets a monotonic sequence number; `store_id` lets
+        # replicas notice that they are following a different (e.g. reset) store.
+        self.store.setdefault('store_id', os.urandom(8).hex())
+        self._bloom = None  # built on first identity_filter() call
+        seq = self.store.get('seq', 0)
+        if self.base is not None:
+            seq = max(seq, self.base.seq)
+        if self.keys is not None:
+            if self.store['identities'] and not len(self.keys):
+                self._migrate_to_compact()
+            self.store['identities'] = {}
+            self.store['seq'] = max(seq, self.keys.last_seq)
+            return
+        for ent in self.store['identities'].values():
+            if 'seq' not in ent:  # stores written before sequence numbers existed
+                seq += 1
+                ent['seq'] = seq
+        self.store['seq'] = seq
+        changes = sorted((ent['seq'], ident) for ident, ent in self.store['identities'].items())
+        self._change_seqs = [c[0] for c in changes]
+        self._change_ids = [c[1] for c in changes]
 
+    def _migrate_to_compact(self):
+        # One-off import of a JSON keystore; the identities then live only in the compact store
+        seq = self.store.get('seq', 0)
+        for ident, ent in sorted(self.store['identities'].items(), key=lambda kv: kv[1].get('seq', 0)):
+            seq = ent.get('seq') or seq + 1
+            self.keys.add(ident, ub64(ent['pub']), ub64(ent['priv']), seq)
+        self.keys.flush()
+        self.store['seq'] = seq
+        self.store['identities'] = {}
+        self._save()
+
+    @tracing.traced('keystore.save')
     def _save(self):
         with open(self.store_path, 'w', encoding='utf8') as f:
             json.dump(self.store, f, indent=2)
 
+    def _keypair(self, identity: str) -> Tuple[bytes, bytes]:
+        # Raw (pub, priv) of a canonical identity, or (None, None)
+        base, epoch = split_epoch(identity)
+        if epoch is not None:
+            return self._epoch_keypair(identity, base, epoch)
+        if self.keys is not None:
+            pub = self.keys.get_pub(identity)
+            if pub is not None:
+                return pub, self.keys.get_priv(identity)
+        else:
+            ent = self.store['identities'].get(identity)
+            if ent:
+                return ub64(ent['pub']), ub64(ent['priv'])
+        if self.base is not None:
+            found = self.base.get(identity)
+            if found:
+                return found[0], found[1]
+        return None, None
+
+    def _epoch_keypair(self, identity: str, base: str, epoch: str) -> Tuple[bytes, bytes]:
+        # Epoch keys live in the epoch store, or in the base snapshot while the epoch is retained
+        pub, priv = self.epochs.get(base, epoch)
+        if pub is None and self.base is not None and not self.epochs.expired(epoch):
+            found = self.base.get(identity)
+            if found:
+                pub, priv = found[0], found[1]
+        return pub, priv
+
+    def _own_pub(self, identity: str) -> bytes:
+        # Raw public key from the store itself (not the base snapshot), or None
+        if self.keys is not None:
+            return self.keys.get_pub(identity)
+        ent = self.store['identities'].get(identity)
+        return ub64(ent['pub']) if ent else None
+
+    def _pub(self, identity: str) -> bytes:
+        # Raw public key of a canonical identity, or None
+        base, epoch = split_epoch(identity)
+        if epoch is not None:
+            return self._epoch_keypair(identity, base, epoch)[0]
+        pub = self._own_pub(identity)
+        if pub is None and self.base is not None:
+            found = self.base.get(identity)
+            pub = found[0] if found else None
+        return pub
+
     def setup(self) -> Tuple[Dict[str, Any], bytes]:
         # For demo, mpk contains a random public salt; msk is random bytes kept by server
         msk = os.urandom(32)
@@ -95,63 +257,337 @@ class DemoIBE(IBEInterface):
         self._save()
         return mpk, msk
 
+    def restore_master(self, mpk: Dict[str, Any], msk: bytes):
+        """Reuse master keys from an earlier `setup()` (see pkg/master_keys.py) instead of generating new ones.
+
+        Does not touch the keystore file unless its MPK differs; with `lazy=True`
+        that check waits until the keystore is opened.
+        """
+        with self._lock:
+            self._pending_mpk = mpk
+            if self._ready and self._store.get('mpk') != mpk:
+                self._store['mpk'] = mpk
+                self._save()
+
+    @tracing.traced('keystore.extract')
     def extract(self, msk: bytes, identity: str) -> bytes:
         # Demo: generate an X25519 keypair for this identity and store public key
         identity = canonicalize_identity(identity)
-        if identity in self.store['identities']:
-            priv_b64 = self.store['identities'][identity]['priv']
-            return ub64(priv_b64)
-
-        private = x25519.X25519PrivateKey.generate()
-        public = private.public_key()
-        priv_bytes = private.private_bytes(encoding=serialization.Encoding.Raw,
-                                           format=serialization.PrivateFormat.Raw,
-                                           encryption_algorithm=serialization.NoEncryption())
-        pub_bytes = public.public_bytes(encoding=serialization.Encoding.Raw,
-                                        format=serialization.PublicFormat.Raw)
-        self.store['identities'][identity] = {"pub": b64(pub_bytes), "priv": b64(priv_bytes)}
-        self._save()
-        return priv_bytes
+        base, epoch = split_epoch(identity)
+        if epoch is not None:
+            if self.base is not None:
+                self.epochs.check(epoch)
+                _, priv_bytes = self._epoch_keypair(identity, base, epoch)
+                if priv_bytes is not None:
+                    return priv_bytes
+            # Rotating per-epoch key; raises EpochError outside the issuable epochs
+            _, priv_bytes, created = self.epochs.extract(base, epoch)
+            if created:
+                with self._lock:  # not while identity_filter() is building a replacement
+                    if self._bloom is not None:
+                        self._bloom.add(identity)
+            return priv_bytes
+        # One writer at a time: concurrent extracts would interleave store updates and rewrites
+        with self._lock:
+            _, priv_bytes = self._keypair(identity)
+            if priv_bytes is not None:
+                return priv_bytes
+
+            private = x25519.X25519PrivateKey.generate()
+            public = private.public_key()
+            priv_bytes = private.private_bytes(encoding=serialization.Encoding.Raw,
+                                               format=serialization.PrivateFormat.Raw,
+                                               encryption_algorithm=serialization.NoEncryption())
+            pub_bytes = public.public_bytes(encoding=serialization.Encoding.Raw,
+                                            format=serialization.PublicFormat.Raw)
+            seq = self.store['seq'] = self.store['seq'] + 1
+            if self.keys is not None:
+                # Appends one record; the small metadata file is rewritten, the keys are not
+                self.keys.add(identity, pub_bytes, priv_bytes, seq)
+            else:
+                self.store['identities'][identity] = {"pub": b64(pub_bytes), "priv": b64(priv_bytes), "seq": seq}
+                self._change_seqs.append(seq)
+                self._change_ids.append(identity)
+            if self._bloom is not None:
+                self._bloom.add(identity)
+            self._save()
+            return priv_bytes
 
     def get_pubkey_for_identity(self, identity: str) -> bytes:
-        identity = canonicalize_identity(identity)
-        ent = self.store['identities'].get(identity)
-        if not ent:
-            return None
-        return ub64(ent['pub'])
+        return self._pub(canonicalize_identity(identity))
+
+    def export_keys(self, identities: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        """Keypairs of known identities as {identity: {"pub", "priv"}} (base64).
+
+        Used to move keys between PKG shards; unknown identities are omitted.
+        """
+        out = {}
+        for identity in canonicalize_many(identities):
+            pub, priv = self._keypair(identity)
+            if pub is not None:
+                out[identity] = {"pub": b64(pub), "priv": b64(priv)}
+        return out
+
+    def import_keys(self, keys: Dict[str, Dict[str, str]], conflicts: Optional[List[str]] = None) -> int:
+        """Add keypairs from `export_keys`; identities already present keep their key. Returns the number added.
+
+        Identities present here with a different public key are appended to
+        `conflicts` if given: this node issued its own key for them.
+        """
+        added = 0
+        with self._lock:
+            for identity, ent in keys.items():
+                identity = canonicalize_identity(identity)
+                pub = self._pub(identity)
+                if pub is not None:
+                    if conflicts is not None and pub != ub64(ent['pub']):
+                        conflicts.append(identity)
+                    continue
+                base, epoch = split_epoch(identity)
+                if epoch is not None:
+                    try:
+                        added += len(self.add_epoch_keys(epoch, [(base, ub64(ent['pub']), ub64(ent['priv']))]))
+                    except EpochError:
+                        pass  # expired on this node; nothing to keep
+                    continue
+                seq = self.store['seq'] = self.store['seq'] + 1
+                if self.keys is not None:
+                    self.keys.add(identity, ub64(ent['pub']), ub64(ent['priv']), seq)
+                else:
+                    self.store['identities'][identity] = {"pub": ent['pub'], "priv": ent['priv'], "seq": seq}
+                    self._change_seqs.append(seq)
+                    self._change_ids.append(identity)
+                if self._bloom is not None:
+                    self._bloom.add(identity)
+                added += 1
+            if added:
+                self._save()
+        return added
+
+    def add_epoch_keys(self, epoch: str, entries: Iterable[Tuple[str, bytes, bytes]]) -> List[str]:
+        """Store precomputed (identity, pub, priv) for `epoch` (see pkg/epoch_scheduler.py); returns identities added."""
+        added = self.epochs.add_many(epoch, entries)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.update(with_epoch(i, epoch) for i in added)
+        return added
+
+    def _epoch_entries(self) -> Iterator[Tuple[str, bytes, bytes, int]]:
+        # Retained epoch keys under their epoch identities; seq counts within each epoch
+        for epoch in self._epoch_labels():
+            for identity, pub, priv, seq in self.epochs.records(epoch):
+                yield with_epoch(identity, epoch), pub, priv, seq
+
+    def _epoch_labels(self) -> List[str]:
+        return [e for e in self.epochs.epochs() if not self.epochs.expired(e)]
+
+    def _shadowed(self, identity: str) -> bool:
+        # Whether a base snapshot entry is superseded by the store (or belongs to an expired epoch)
+        base, epoch = split_epoch(identity)
+        if epoch is None:
+            return self._own_pub(identity) is not None
+        return self.epochs.expired(epoch) or self.epochs.get(base, epoch)[0] is not None
+
+    def _entries(self) -> Iterable[Tuple[str, bytes, bytes, int]]:
+        # (identity, pub, priv, seq) for every identity, base snapshot and epoch keys included
+        if self.keys is not None:
+            own = self.keys.records()
+        else:
+            own = ((i, ub64(e['pub']), ub64(e['priv']), e['seq']) for i, e in self.store['identities'].items())
+        if self.base is None:
+            return itertools.chain(own, self._epoch_entries())
+        return itertools.chain(((i, pub, priv, seq) for i, pub, priv, seq in self.base
+                                if not self._shadowed(i)), own, self._epoch_entries())
+
+    def export_snapshot(self, path: str) -> int:
+        """Write every keypair to an `ibe.snapshot` file at `path`; returns the identity count.
+
+        Extracts wait until the export finishes.
+        """
+        with self._lock:
+            return write_snapshot(path, self._entries(), self.store['seq'], self.store['store_id'],
+                                  self.store.get('mpk'))
+
+    def load_snapshot(self, path: str) -> int:
+        """Restore an `ibe.snapshot` file into this (empty) keystore, keeping sequence numbers and store_id."""
+        with self._lock, Snapshot(path, use_mmap=True) as snap:
+            if self.store['identities'] or (self.keys is not None and len(self.keys)):
+                raise ValueError('load_snapshot needs an empty keystore')
+            # A flipped bit would otherwise become a corrupt key in the live store
+            if not snap.verify():
+                raise ValueError('snapshot %s fails its checksums' % path)
+            epoch_keys: Dict[str, List[Tuple[str, bytes, bytes]]] = {}
+
+            def plain(entries):
+                # Epoch identities go to the epoch store (numbered apart from the main sequence)
+                for identity, pub, priv, seq in entries:
+                    base, epoch = split_epoch(identity)
+                    if epoch is None:
+                        yield identity, pub, priv, seq
+                    elif not self.epochs.expired(epoch):
+                        epoch_keys.setdefault(epoch, []).append((base, pub, priv))
+            if self.keys is not None:
+                # The compact store is append-only in sequence order; re-sort in bounded memory
+                tmpdir = os.path.dirname(os.path.abspath(path))
+                for identity, pub, priv, seq in plain(sorted_by_seq(snap, tmpdir=tmpdir)):
+                    self.keys.add(identity, pub, priv, seq)
+                self.keys.flush()
+            else:
+                idents = self.store['identities']
+                for identity, pub, priv, seq in plain(snap):
+                    idents[identity] = {"pub": b64(pub), "priv": b64(priv), "seq": seq}
+            for epoch, entries in epoch_keys.items():
+                try:
+                    self.epochs.add_many(epoch, entries)
+                except EpochError:
+                    pass  # not issuable on this node's clock; nothing to keep
+            self.store.update(mpk=snap.mpk or self.store.get('mpk', {}), store_id=snap.store_id,
+                              seq=max(self.store.get('seq', 0), snap.seq))
+            self._index_changes()
+            self._save()
+            return len(snap)
+
+    def changes_since(self, since: int, limit: int = 1000, epoch: Optional[str] = None) -> Dict[str, Any]:
+        """Public-key changes with sequence number > `since`, oldest first, at most `limit`.
+
+        Returns {"store_id", "changes": [{"seq", "identity", "pub_b64"}], "next", "latest", "more",
+        "epochs"}; pass `next` back as `since` to fetch the following page. Epoch keys are
+        numbered per epoch: `epochs` lists the retained ones, and `epoch=` pages through one.
+        """
+        if epoch is not None:
+            entries = self.epochs.entries_after(epoch, since, limit) if not self.epochs.expired(epoch) else []
+            changes = [{"seq": seq, "identity": with_epoch(i, epoch), "pub_b64": b64(pub)} for seq, i, pub in entries]
+            latest = self.epochs.last_seq(epoch)
+            return {"store_id": self.store['store_id'], "epoch": epoch, "changes": changes,
+                    "next": changes[-1]['seq'] if changes else since, "latest": latest,
+                    "more": bool(changes) and changes[-1]['seq'] < latest, "epochs": self._epoch_labels()}
+        if self.keys is not None:
+            entries = self.keys.entries_after(since, limit)
+            changes = [{"seq": seq, "identity": i, "pub_b64": b64(pub)} for seq, i, pub in entries]
+            return {"store_id": self.store['store_id'], "changes": changes,
+                    "next": changes[-1]['seq'] if changes else since, "latest": self.store['seq'],
+                    "more": bool(changes) and changes[-1]['seq'] < self.keys.last_seq,
+                    "epochs": self._epoch_labels()}
+        start = bisect.bisect_right(self._change_seqs, since)
+        ids = self._change_ids[start:start + limit]
+        idents = self.store['identities']
+        changes = [{"seq": idents[i]['seq'], "identity": i, "pub_b64": idents[i]['pub']} for i in ids]
+        return {"store_id": self.store['store_id'], "changes": changes,
+                "next": changes[-1]['seq'] if changes else since, "latest": self.store['seq'],
+                "more": start + limit < len(self._change_ids), "epochs": self._epoch_labels()}
+
+    def identity_filter(self) -> BloomFilter:
+        """Bloom filter of all issued identities, kept current by `extract`.
+
+        Rebuilt with twice the capacity once it holds more identities than it
+        was sized for, so the false-positive rate stays near PKG_BLOOM_FP_RATE.
+        The rebuild holds the keystore lock, so no key issued meanwhile can be
+        missed (a filter must never give false negatives).
+        """
+        bloom = self._bloom
+        if bloom is not None and not bloom.full:
+            return bloom
+        with self._lock:
+            if self._bloom is None or self._bloom.full:
+                identities = self.keys if self.keys is not None else self.store['identities']
+                epochs = self.epochs.epochs()
+                count = len(identities) + (len(self.base) if self.base is not None else 0) \
+                    + sum(self.epochs.count(e) for e in epochs)
+                bloom = BloomFilter(max(PKG_BLOOM_CAPACITY, 2 * count))
+                bloom.update(identities)
+                if self.base is not None:
+                    bloom.update(identity for identity, _, _, _ in self.base)
+                for epoch in epochs:
+                    bloom.update(with_epoch(i, epoch) for i in self.epochs.identities(epoch))
+                self._bloom = bloom  # published with one reference swap
+            return self._bloom
 
     def _derive_key(self, shared: bytes) -> bytes:
-        # HKDF to derive a 32-byte AEAD key
-        hk = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'demo-ibe')
-        return hk.derive(shared)
+        return _derive_key(shared)
 
     def encrypt(self, identity: str, message: bytes) -> Dict[str, Any]:
         identity = canonicalize_identity(identity)
         pub = self.get_pubkey_for_identity(identity)
         if pub is None:
             raise ValueError("unknown identity/public key")
-        # Ephemeral X25519 key
-        eph_priv = x25519.X25519PrivateKey.generate()
-        eph_pub = eph_priv.public_key().public_bytes(encoding=serialization.Encoding.Raw,
-                                                     format=serialization.PublicFormat.Raw)
-        peer_pub = x25519.X25519PublicKey.from_public_bytes(pub)
-        shared = eph_priv.exchange(peer_pub)
-        key = self._derive_key(shared)
-        aead = ChaCha20Poly1305(key)
-        nonce = os.urandom(12)
-        ct = aead.encrypt(nonce, message, None)
-        return {"ephemeral_pub": b64(eph_pub), "nonce": b64(nonce), "ciphertext": b64(ct)}
+        # Ephemeral key is single use, drawn from the pool when one is configured
+        return encrypt_to_pubkey(pub, message, self.aead_suite, self.compression, self.eph_pool)
+
+    def get_pubkeys_for_identities(self, identities: List[str]) -> Dict[str, bytes]:
+        """Batch lookup; unknown identities are omitted from the result."""
+        out = {}
+        for identity in canonicalize_many(identities):
+            pub = self._pub(identity)
+            if pub is not None:
+                out[identity] = pub
+        return out
+
+    def encrypt_multi(self, pubkeys: Dict[str, bytes], message: bytes) -> Dict[str, Any]:
+        """Encrypt message once for several recipients (see module-level `encrypt_multi`)."""
+        return encrypt_multi(pubkeys.values(), message, self.compression, self.eph_pool, self.aead_suite)
 
     def decrypt(self, private_key_bytes: bytes, envelope: Dict[str, Any]) -> bytes:
-        priv = x25519.X25519PrivateKey.from_private_bytes(private_key_bytes)
-        eph_pub = ub64(envelope['ephemeral_pub'])
-        peer = x25519.X25519PublicKey.from_public_bytes(eph_pub)
-        shared = priv.exchange(peer)
-        key = self._derive_key(shared)
-        aead = ChaCha20Poly1305(key)
-        nonce = ub64(envelope['nonce'])
-        ct = ub64(envelope['ciphertext'])
-        return aead.decrypt(nonce, ct, None)
-
-
-__all__ = ["IBEInterface", "DemoIBE", "b64", "ub64", "canonicalize_identity"]
+        # Accepts raw key bytes or an already parsed key from `load_private_key`
+        return decrypt_envelope(private_key_bytes, envelope)
+
+
+def decrypt_envelope(private_key, envelope: Dict[str, Any]) -> bytes:
+    """Decrypt a single-recipient, multi-recipient or session envelope; needs no keystore."""
+    priv = load_private_key(private_key)
+    if 'recipients' in envelope:
+        return decrypt_multi(priv, envelope)
+    if 'session_id' in envelope:
+        from ibe.session import decrypt_session_envelope  # ibe.session imports this module
+        return decrypt_session_envelope(priv, envelope)
+    return decrypt_with_privkey(priv, envelope)
+
+
+def key_id(pub_bytes: bytes) -> str:
+    """Short identifier of a recipient public key used to find its slot in a multi-recipient envelope."""
+    return b64(hashlib.sha256(pub_bytes).digest()[:8])
+
+
+def _wrap_key(shared: bytes) -> ChaCha20Poly1305:
+    hk = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'demo-ibe-wrap')
+    return ChaCha20Poly1305(hk.derive(shared))
+
+
+def encrypt_multi(pubkeys, message: bytes, compression_mode: str = None,
+                  eph_pool: EphemeralKeyPool = None, suite: int = None) -> Dict[str, Any]:
+    """Encrypt `message` once under a random content key and wrap that key per recipient.
+
+    The body is encrypted a single time no matter how many recipients there
+    are; each recipient gets a small slot holding the content key wrapped with
+    an X25519 exchange against one shared ephemeral key.
+    """
+    content_key = os.urandom(32)
+    payload = _seal_payload(content_key, message, suite, compression_mode)
+    eph_priv, eph_pub = new_ephemeral(eph_pool)
+    recipients = []
+    for pub in pubkeys:
+        shared = eph_priv.exchange(x25519.X25519PublicKey.from_public_bytes(pub))
+        wrap_nonce = os.urandom(12)
+        wrapped = _wrap_key(shared).encrypt(wrap_nonce, content_key, eph_pub)
+        recipients.append({"kid": key_id(pub), "nonce": b64(wrap_nonce), "wrapped_key": b64(wrapped)})
+    env = {"ephemeral_pub": b64(eph_pub), "recipients": recipients}
+    env.update(payload)
+    return env
+
+
+def decrypt_multi(private_key, envelope: Dict[str, Any]) -> bytes:
+    """Decrypt a multi-recipient envelope produced by `encrypt_multi`."""
+    priv = load_private_key(private_key)
+    own_pub = priv.public_key().public_bytes(encoding=serialization.Encoding.Raw,
+                                             format=serialization.PublicFormat.Raw)
+    kid = key_id(own_pub)
+    slot = next((r for r in envelope['recipients'] if r['kid'] == kid), None)
+    if slot is None:
+        raise ValueError("envelope is not addressed to this key")
+    eph_pub = ub64(envelope['ephemeral_pub'])
+    shared = priv.exchange(x25519.X25519PublicKey.from_public_bytes(eph_pub))
+    content_key = _wrap_key(shared).decrypt(ub64(slot['nonce']), ub64(slot['wrapped_key']), eph_pub)
+    return _open_payload(content_key, envelope)
+
+
+__all__ = ["IBEInterface", "DemoIBE", "b64", "ub64", "canonicalize_identity", "canonicalize_many",
+           "load_private_key", "encrypt_multi", "decrypt_multi", "decrypt_envelope", "key_id"]
@@ -0,0 +1,154 @@
+"""Pool of pre-generated single-use ephemeral X25519 keypairs.
+
+Every envelope needs a fresh ephemeral keypair. Generating it (and deriving
+its public key) sits on the encrypt critical path; with this pool a
+background thread does that work ahead of time, so a burst of sends only pays
+for the exchange, HKDF and AEAD.
+
+Guarantees:
+- each keypair is handed out at most once (removed from the pool under a lock
+  before it is returned, and never re-inserted),
+- the pool keeps no reference after handing a key out, so once the caller
+  drops it the key is freed by the OpenSSL backend, which zeroes the private
+  scalar on free (`OPENSSL_clear_free`). `DemoIBE.encrypt` deletes its
+  reference right after the exchange. Keys still pooled are dropped the same
+  way by `stop()`.
+
+Keys are kept as parsed key objects: re-loading a raw scalar costs as much as
+generating a new key, which would defeat the purpose of the pool.
+
+The refill thread defers to the hot path: while keys are being taken it waits
+for a short idle gap before generating more, unless the pool is empty, so
+refilling does not compete with a burst for the CPU.
+
+When the pool runs dry `take()` falls back to generating a key inline and
+counts the event in `exhausted`.
+
+Configuration via environment variables:
+- IBE_EPH_POOL_SIZE (default 0 = no pool)
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from cryptography.hazmat.primitives.asymmetric import x25519
+
+IBE_EPH_POOL_SIZE = int(os.environ.get('IBE_EPH_POOL_SIZE', '0'))
+
+
+def _generate() -> Tuple[x25519.X25519PrivateKey, bytes]:
+    priv = x25519.X25519PrivateKey.generate()
+    pub = priv.public_key().public_bytes_raw()
+    return priv, pub
+
+
+class EphemeralKeyPool:
+    """Background-refilled pool of single-use ephemeral keypairs.
+
+    Usage:
+        pool = EphemeralKeyPool(size=512)
+        demo = DemoIBE(eph_pool=pool)
+    """
+
+    def __init__(self, size: int = 256, low_water: Optional[int] = None, start: bool = True,
+                 idle_gap: float = 0.002):
+        if size <= 0:
+            raise ValueError('size must be positive')
+        self.size = size
+        self.low_water = size // 4 if low_water is None else low_water
+        self._keys: deque = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self.taken = 0
+        self.exhausted = 0
+        self.generated = 0
+        self.idle_gap = idle_gap
+        self._last_take = 0.0
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self._refill_loop, name='ibe-eph-pool', daemon=True)
+            self._thread.start()
+            self._wake.set()
+
+    def fill(self, defer: bool = False):
+        """Top the pool up to `size` in the calling thread.
+
+        With `defer=True` generation pauses while takes are in progress and the
+        pool still has keys, so the refill runs in the gaps between bursts.
+        """
+        while not self._stopped:
+            with self._lock:
+                available = len(self._keys)
+            if available >= self.size:
+                return
+            if defer and available and time.monotonic() - self._last_take < self.idle_gap:
+                time.sleep(self.idle_gap)
+                continue
+            item = _generate()
+            with self._lock:
+                self._keys.append(item)
+                self.generated += 1
+
+    def _refill_loop(self):
+        while not self._stopped:
+            self._wake.wait()
+            self._wake.clear()
+            self.fill(defer=True)
+
+    def take(self) -> Tuple[x25519.X25519PrivateKey, bytes]:
+        """Remove one keypair from the pool and return (private key object, public bytes)."""
+        with self._lock:
+            item = self._keys.popleft() if self._keys else None
+            remaining = len(self._keys)
+            self.taken += 1
+            self._last_take = time.monotonic()
+            if item is None:
+                self.exhausted += 1
+        if remaining <= self.low_water:
+            self._wake.set()
+        if item is None:
+            item = _generate()
+        return item
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'available': len(self._keys), 'size': self.size, 'taken': self.taken,
+                    'exhausted': self.exhausted, 'generated': self.generated}
+
+
+def new_ephemeral(pool: Optional[EphemeralKeyPool] = None) -> Tuple[x25519.X25519PrivateKey, bytes]:
+    """Return a fresh ephemeral (private key, public bytes), from `pool` when given."""
+    if pool is not None:
+        return pool.take()
+    return _generate()
+
+
+_default_pool: Optional[EphemeralKeyPool] = None
+_default_lock = threading.Lock()
+
+
+def default_pool() -> Optional[EphemeralKeyPool]:
+    """Process-wide pool sized by IBE_EPH_POOL_SIZE, or None when disabled."""
+    global _default_pool
+    if IBE_EPH_POOL_SIZE <= 0:
+        return None
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = EphemeralKeyPool(IBE_EPH_POOL_SIZE)
+    return _default_pool
+
+
+__all__ = ['EphemeralKeyPool', 'new_ephemeral', 'default_pool']
@@ -0,0 +1,246 @@
+"""Time-epoch identities and per-epoch key storage.
+
+An epoch identity is a canonical identity with the epoch appended,
+`alice@example.com|202611`. Senders encrypt to the current epoch's identity.
+Keys then rotate at every epoch boundary without revocation lists: a lost
+key stops mattering once its epoch is over.
+
+Epochs are calendar months (labels `YYYYMM`, the default) or fixed periods
+of N seconds (labels are the period number since the Unix epoch). The PKG
+issues keys for past epochs still within the retention window, the current
+epoch and the next one. Later epochs are refused, so a compromised mailbox
+cannot be used to stock up on future keys.
+
+`EpochKeyStore` keeps each epoch's keys in its own `CompactKeyStore`
+directory, keyed by the plain identity. Garbage-collecting an expired epoch
+is then just removing its directory. Each epoch numbers its keys from 1, so
+`entries_after` gives a per-epoch change feed (used for shard migration).
+
+Configuration via environment variables:
+- IBE_EPOCH_PERIOD (default `month`) — `month` or a period length in seconds
+- IBE_EPOCH_RETAIN (default 2) — past epochs whose keys the PKG keeps
+"""
+from __future__ import annotations
+import calendar
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ibe.compact_store import CompactKeyStore
+
+IBE_EPOCH_PERIOD = os.environ.get('IBE_EPOCH_PERIOD', 'month')
+IBE_EPOCH_RETAIN = int(os.environ.get('IBE_EPOCH_RETAIN', '2'))
+SEPARATOR = '|'
+_MONTH_LABEL = re.compile(r'\d{4}(0[1-9]|1[0-2])')
+
+
+def _period(period: str = None) -> str:
+    return period or IBE_EPOCH_PERIOD
+
+
+def epoch_index(label: str, period: str = None) -> int:
+    """Position of an epoch label on the timeline (consecutive epochs differ by 1)."""
+    if _period(period) == 'month':
+        return int(label[:4]) * 12 + int(label[4:]) - 1
+    return int(label)
+
+
+def epoch_label(index: int, period: str = None) -> str:
+    if _period(period) == 'month':
+        return '%04d%02d' % (index // 12, index % 12 + 1)
+    return str(index)
+
+
+def epoch_at(t: float = None, period: str = None) -> str:
+    """Label of the epoch containing Unix time `t` (default: now, UTC)."""
+    t = time.time() if t is None else t
+    if _period(period) == 'month':
+        tm = time.gmtime(t)
+        return '%04d%02d' % (tm.tm_year, tm.tm_mon)
+    return str(int(t // int(_period(period))))
+
+
+def epoch_start(label: str, period: str = None) -> float:
+    """Unix time at which an epoch begins."""
+    if _period(period) == 'month':
+        return float(calendar.timegm((int(label[:4]), int(label[4:]), 1, 0, 0, 0)))
+    return float(int(label) * int(_period(period)))
+
+
+def next_epoch(label: str, period: str = None) -> str:
+    return epoch_label(epoch_index(label, period) + 1, period)
+
+
+def is_epoch_label(label: str, period: str = None) -> bool:
+    if _period(period) == 'month':
+        return bool(_MONTH_LABEL.fullmatch(label))
+    return label.isdigit()
+
+
+def with_epoch(identity: str, epoch: str) -> str:
+    """Epoch identity for a canonical identity."""
+    return identity + SEPARATOR + epoch
+
+
+def split_epoch(identity: str, period: str = None) -> Tuple[str, Optional[str]]:
+    """(identity, epoch) of an epoch identity, or (identity, None) for a plain one."""
+    base, sep, label = identity.rpartition(SEPARATOR)
+    if sep and base and is_epoch_label(label, period):
+        return base, label
+    return identity, None
+
+
+class EpochError(ValueError):
+    """The epoch is outside the range the PKG issues keys for."""
+
+
+def generate_keypair() -> Tuple[bytes, bytes]:
+    """Fresh raw X25519 (pub, priv); module-level so worker processes can run it."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import x25519
+    private = x25519.X25519PrivateKey.generate()
+    priv = private.private_bytes(encoding=serialization.Encoding.Raw, format=serialization.PrivateFormat.Raw,
+                                 encryption_algorithm=serialization.NoEncryption())
+    pub = private.public_key().public_bytes(encoding=serialization.Encoding.Raw,
+                                            format=serialization.PublicFormat.Raw)
+    return pub, priv
+
+
+class EpochKeyStore:
+    """Per-epoch keypairs, one `CompactKeyStore` directory per epoch.
+
+    Usage:
+        epochs = EpochKeyStore('pkg_data.epochs')
+        priv = epochs.extract('alice@example.com', epoch_at())
+        epochs.gc()
+    """
+
+    def __init__(self, directory: str, retain: int = None, period: str = None, clock=time.time):
+        self.directory = directory
+        self.retain = IBE_EPOCH_RETAIN if retain is None else retain
+        self.period = _period(period)
+        self._clock = clock
+        self._stores: Dict[str, CompactKeyStore] = {}
+        self._lock = threading.RLock()
+
+    def current(self) -> str:
+        return epoch_at(self._clock(), self.period)
+
+    def check(self, epoch: str):
+        """Raise EpochError unless keys for `epoch` may be issued now."""
+        now = epoch_index(self.current(), self.period)
+        at = epoch_index(epoch, self.period)
+        if at > now + 1:
+            raise EpochError('epoch %s is not open yet' % epoch)
+        if at < now - self.retain:
+            raise EpochError('epoch %s has expired' % epoch)
+
+    def expired(self, epoch: str) -> bool:
+        """True once `epoch` is past the retention window (its keys are no longer served)."""
+        return epoch_index(epoch, self.period) < epoch_index(self.current(), self.period) - self.retain
+
+    def seconds_left(self, epoch: str) -> float:
+        """Time until `epoch` leaves the retention window (<= 0 once it has)."""
+        ends = epoch_label(epoch_index(epoch, self.period) + self.retain + 1, self.period)
+        return epoch_start(ends, self.period) - self._clock()
+
+    def epochs(self) -> List[str]:
+        """Epochs with keys on disk, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        labels = [d for d in os.listdir(self.directory) if is_epoch_label(d, self.period)]
+        return sorted(labels, key=lambda d: epoch_index(d, self.period))
+
+    def _store(self, epoch: str, create: bool = False) -> Optional[CompactKeyStore]:
+        with self._lock:
+            store = self._stores.get(epoch)
+            if store is None:
+                path = os.path.join(self.directory, epoch)
+                if not create and not os.path.isdir(path):
+                    return None
+                store = self._stores[epoch] = CompactKeyStore(path)
+            return store
+
+    def get(self, identity: str, epoch: str) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """(pub, priv) of `identity` in `epoch`, or (None, None)."""
+        store = self._store(epoch)
+        if store is None:
+            return None, None
+        pub = store.get_pub(identity)
+        return (pub, store.get_priv(identity)) if pub is not None else (None, None)
+
+    def extract(self, identity: str, epoch: str) -> Tuple[bytes, bytes, bool]:
+        """(pub, priv, created) for `identity` in `epoch`, generating the keypair on first use."""
+        self.check(epoch)
+        with self._lock:
+            pub, priv = self.get(identity, epoch)
+            if pub is not None:
+                return pub, priv, False
+            pub, priv = generate_keypair()
+            store = self._store(epoch, create=True)
+            # The record is appended to the store's files now; the index is written periodically and on close
+            store.add(identity, pub, priv, len(store) + 1)
+            return pub, priv, True
+
+    def add_many(self, epoch: str, entries: Iterable[Tuple[str, bytes, bytes]]) -> List[str]:
+        """Store precomputed keypairs; identities that already have one keep it. Returns those added."""
+        self.check(epoch)
+        added = []
+        with self._lock:
+            store = self._store(epoch, create=True)
+            for identity, pub, priv in entries:
+                if identity not in store:
+                    store.add(identity, pub, priv, len(store) + 1)
+                    added.append(identity)
+            store.flush()
+        return added
+
+    def identities(self, epoch: str) -> Iterator[str]:
+        store = self._store(epoch)
+        return iter(store) if store is not None else iter(())
+
+    def records(self, epoch: str) -> Iterator[Tuple[str, bytes, bytes, int]]:
+        """(identity, pub, priv, seq) of every key in `epoch`, in the order they were added."""
+        store = self._store(epoch)
+        return store.records() if store is not None else iter(())
+
+    def entries_after(self, epoch: str, seq: int, limit: int) -> List[Tuple[int, str, bytes]]:
+        """Up to `limit` (seq, identity, pub) of `epoch` with sequence number > `seq`."""
+        store = self._store(epoch)
+        return store.entries_after(seq, limit) if store is not None else []
+
+    def last_seq(self, epoch: str) -> int:
+        store = self._store(epoch)
+        return store.last_seq if store is not None else 0
+
+    def count(self, epoch: str) -> int:
+        store = self._store(epoch)
+        return len(store) if store is not None else 0
+
+    def gc(self) -> List[str]:
+        """Delete epochs older than the retention window; returns their labels."""
+        oldest = epoch_index(self.current(), self.period) - self.retain
+        removed = []
+        with self._lock:
+            for epoch in self.epochs():
+                if epoch_index(epoch, self.period) >= oldest:
+                    break
+                store = self._stores.pop(epoch, None)
+                if store is not None:
+                    store.close()
+                shutil.rmtree(os.path.join(self.directory, epoch), ignore_errors=True)
+                removed.append(epoch)
+        return removed
+
+    def close(self):
+        with self._lock:
+            for store in self._stores.values():
+                store.close()
+            self._stores.clear()
+
+
+__all__ = ['EpochKeyStore', 'EpochError', 'epoch_at', 'epoch_start', 'next_epoch', 'epoch_index',
+           'epoch_label', 'is_epoch_label', 'split_epoch', 'with_epoch', 'generate_keypair', 'SEPARATOR']
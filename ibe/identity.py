@@ -0,0 +1,77 @@
+"""Identity canonicalization, shared by the PKG and its clients.
+
+Every component compares identities in canonical form: stripped, lowercased,
+NFC-normalized, with IDNA domains in their Unicode form. This module needs
+only the standard library (and `ibe/epochs.py` for epoch identities), so
+clients can canonicalize recipients without importing the keystore and
+crypto modules behind `ibe/crypto_iface.py`, which re-exports these names.
+
+Configuration via environment variables:
+- IBE_IDENTITY_CACHE_SIZE (default 65536) — memoized slow-path results
+"""
+from __future__ import annotations
+import functools
+import os
+import unicodedata
+from typing import Iterable, List
+
+from ibe.epochs import SEPARATOR, split_epoch
+
+# Memoized canonical identities (bounded; the same addresses recur across extract/lookup/encrypt)
+IBE_IDENTITY_CACHE_SIZE = int(os.environ.get('IBE_IDENTITY_CACHE_SIZE', '65536'))
+
+# Full stops that IDNA (RFC 3490) treats as label separators
+_IDNA_DOTS = dict.fromkeys(map(ord, '\u3002\uff0e\uff61'), '.')
+
+
+def _idna_to_unicode(domain: str) -> str:
+    """Decode punycode (`xn--`) labels so A-label and U-label domains compare equal."""
+    labels = domain.translate(_IDNA_DOTS).split('.')
+    for i, label in enumerate(labels):
+        if label.startswith('xn--'):
+            try:
+                decoded = label[4:].encode('ascii').decode('punycode')
+            except (UnicodeError, ValueError):
+                continue  # not valid punycode: keep the label verbatim
+            if not decoded.isascii():  # a real A-label always encodes non-ASCII
+                labels[i] = decoded
+    return '.'.join(labels)
+
+
+@functools.lru_cache(maxsize=IBE_IDENTITY_CACHE_SIZE)
+def _canonicalize_unicode(identity: str) -> str:
+    # Slow path (non-ASCII or punycode), memoized on the raw input: IDNA decoding plus NFC
+    base, epoch = split_epoch(identity.strip())
+    if epoch is not None:  # epoch identity (ibe/epochs.py): canonicalize the address part only
+        return _canonicalize_unicode(base) + SEPARATOR + epoch
+    local, at, domain = identity.strip().lower().rpartition('@')
+    if at:
+        ident = local + '@' + _idna_to_unicode(domain)
+    else:
+        ident = _idna_to_unicode(domain)
+    return unicodedata.normalize('NFC', ident.lower())
+
+
+def canonicalize_identity(identity: str) -> str:
+    """Canonicalize an identity string (email) for consistent usage.
+    
+    Applies: strip whitespace, lowercase, Unicode NFC normalization, and maps
+    IDNA domains to their Unicode form (`xn--` labels decoded, ideographic
+    full stops treated as dots), so `user@xn--bcher-kva.example` and
+    `user@bücher.example` are the same identity.
+    Use this in Extract, Encrypt, and all identity lookups to prevent mismatches.
+    """
+    # ASCII fast path: NFC is a no-op on ASCII, only punycode domains need more work
+    if identity.isascii():
+        ident = identity.strip().lower()
+        if 'xn--' not in ident:
+            return ident
+    return _canonicalize_unicode(identity)
+
+
+def canonicalize_many(identities: Iterable[str]) -> List[str]:
+    """Canonicalize a recipient list or bulk provisioning batch, preserving order."""
+    return [canonicalize_identity(identity) for identity in identities]
+
+
+__all__ = ['canonicalize_identity', 'canonicalize_many', 'IBE_IDENTITY_CACHE_SIZE']
@@ -0,0 +1,242 @@
+"""Seekable encrypted container for large attachments.
+
+`DemoIBE.encrypt` produces one AEAD ciphertext, so reading any byte means
+decrypting all of them. This container splits the plaintext into fixed-size
+blocks that are encrypted and authenticated independently, so a reader can
+decrypt just the blocks covering a requested range (preview the first page of
+a PDF, pull one member out of an archive).
+
+Layout (all integers big-endian):
+
+    header  magic 'IBESEEK1' | version u8 | suite u8 | reserved 2 | block_size u32
+            | ephemeral_pub 32 | salt 16
+    blocks  AEAD(block_key, nonce=0^4||block_no u64, block, aad=header||block_no||last)
+    index   AEAD(index_key, nonce=0xff^4||0^8, index, aad=header)
+    footer  index_offset u64 | index_len u32 | 'SIDX'
+
+`suite` is the AEAD cipher suite id from `ibe.aead` (0 is read as the
+original ChaCha20-Poly1305). The index is encrypted and lists, per block, its
+ciphertext offset and length and its plaintext length, plus the total
+plaintext size. Keys come from an
+X25519 exchange with the recipient key (same as `DemoIBE.encrypt`) run
+through HKDF. Binding the block number and a last-block flag into the AAD
+stops blocks from being reordered, swapped between files or truncated.
+
+Readers work over `mmap`, so random access costs O(bytes requested) rather
+than O(file size).
+"""
+from __future__ import annotations
+import mmap
+import os
+import struct
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ibe import aead
+from ibe.cache import LRUTTLCache
+from ibe.sender import load_private_key
+
+MAGIC = b'IBESEEK1'
+VERSION = 1
+DEFAULT_BLOCK_SIZE = 64 * 1024
+TAG_SIZE = 16
+_HEADER = struct.Struct('>8sBB2sI32s16s')
+_FOOTER = struct.Struct('>QI4s')
+_FOOTER_MAGIC = b'SIDX'
+_INDEX_HEAD = struct.Struct('>QQ')   # plaintext_size, block_count
+_INDEX_ENTRY = struct.Struct('>QII')  # ciphertext offset, ciphertext length, plaintext length
+_INDEX_NONCE = b'\xff' * 4 + b'\x00' * 8
+
+
+def _derive_keys(shared: bytes, salt: bytes) -> Tuple[bytes, bytes]:
+    okm = HKDF(algorithm=hashes.SHA256(), length=64, salt=salt, info=b'demo-ibe-seekable').derive(shared)
+    return okm[:32], okm[32:]
+
+
+def _block_nonce(block_no: int) -> bytes:
+    return b'\x00' * 4 + block_no.to_bytes(8, 'big')
+
+
+def _block_aad(header: bytes, block_no: int, last: bool) -> bytes:
+    return header + block_no.to_bytes(8, 'big') + (b'\x01' if last else b'\x00')
+
+
+class SeekableWriter:
+    """Streams plaintext into a seekable container written to `fileobj`.
+
+    Usage:
+        with open('report.pdf.ibe', 'wb') as f, SeekableWriter(f, recipient_pub) as w:
+            for chunk in chunks:
+                w.write(chunk)
+    """
+
+    def __init__(self, fileobj: BinaryIO, recipient_pub: bytes, block_size: int = DEFAULT_BLOCK_SIZE,
+                 suite: int = None):
+        if block_size <= 0 or block_size > 0xffffffff:
+            raise ValueError('invalid block_size')
+        self._f = fileobj
+        self.block_size = block_size
+        eph_priv = x25519.X25519PrivateKey.generate()
+        eph_pub = eph_priv.public_key().public_bytes(encoding=serialization.Encoding.Raw,
+                                                     format=serialization.PublicFormat.Raw)
+        salt = os.urandom(16)
+        shared = eph_priv.exchange(x25519.X25519PublicKey.from_public_bytes(recipient_pub))
+        block_key, index_key = _derive_keys(shared, salt)
+        suite = suite or aead.preferred_suite()
+        self._block_aead = aead.cipher(suite, block_key)
+        self._index_aead = aead.cipher(suite, index_key)
+        self._header = _HEADER.pack(MAGIC, VERSION, suite, b'\x00' * 2, block_size, eph_pub, salt)
+        self._f.write(self._header)
+        self._offset = len(self._header)
+        self._pending = bytearray()
+        self._entries: List[Tuple[int, int, int]] = []
+        self._size = 0
+        self._closed = False
+
+    def _emit(self, block: bytes, last: bool):
+        block_no = len(self._entries)
+        ct = self._block_aead.encrypt(_block_nonce(block_no), block, _block_aad(self._header, block_no, last))
+        self._f.write(ct)
+        self._entries.append((self._offset, len(ct), len(block)))
+        self._offset += len(ct)
+
+    def write(self, data: bytes) -> int:
+        if self._closed:
+            raise ValueError('write to closed SeekableWriter')
+        self._pending += data
+        self._size += len(data)
+        # Always keep at least one byte back so the final block can be flagged as last
+        while len(self._pending) > self.block_size:
+            self._emit(bytes(self._pending[:self.block_size]), last=False)
+            del self._pending[:self.block_size]
+        return len(data)
+
+    def close(self):
+        if self._closed:
+            return
+        self._emit(bytes(self._pending), last=True)
+        self._pending.clear()
+        index = bytearray(_INDEX_HEAD.pack(self._size, len(self._entries)))
+        for entry in self._entries:
+            index += _INDEX_ENTRY.pack(*entry)
+        sealed = self._index_aead.encrypt(_INDEX_NONCE, bytes(index), self._header)
+        self._f.write(sealed)
+        self._f.write(_FOOTER.pack(self._offset, len(sealed), _FOOTER_MAGIC))
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class SeekableReader:
+    """Random-access reader for a seekable container.
+
+    `source` is a path (opened and memory-mapped) or any bytes-like object.
+    Decrypted blocks are kept in a small LRU so sequential small reads do not
+    decrypt the same block twice.
+    """
+
+    def __init__(self, source: Union[str, bytes, bytearray, memoryview], private_key,
+                 cached_blocks: int = 8):
+        self._file = None
+        self._mmap = None
+        if isinstance(source, (str, os.PathLike)):
+            self._file = open(source, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            buf = memoryview(self._mmap)
+        else:
+            buf = memoryview(source)
+        self._buf = buf
+        if len(buf) < _HEADER.size + _FOOTER.size:
+            raise ValueError('not a seekable IBE container')
+        magic, version, suite, _, block_size, eph_pub, salt = _HEADER.unpack(buf[:_HEADER.size])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a seekable IBE container')
+        self._header = bytes(buf[:_HEADER.size])
+        self.block_size = block_size
+        self.suite = suite or aead.DEFAULT_SUITE
+        priv = load_private_key(private_key)
+        shared = priv.exchange(x25519.X25519PublicKey.from_public_bytes(eph_pub))
+        block_key, index_key = _derive_keys(shared, salt)
+        self._block_aead = aead.cipher(self.suite, block_key)
+        index_offset, index_len, footer_magic = _FOOTER.unpack(buf[len(buf) - _FOOTER.size:])
+        if footer_magic != _FOOTER_MAGIC or index_offset + index_len + _FOOTER.size != len(buf):
+            raise ValueError('corrupt seekable container footer')
+        index = aead.cipher(self.suite, index_key).decrypt(
+            _INDEX_NONCE, bytes(buf[index_offset:index_offset + index_len]), self._header)
+        self.size, count = _INDEX_HEAD.unpack_from(index, 0)
+        self._entries = [_INDEX_ENTRY.unpack_from(index, _INDEX_HEAD.size + i * _INDEX_ENTRY.size)
+                         for i in range(count)]
+        self._blocks = LRUTTLCache(max_entries=max(1, cached_blocks), ttl=None)
+        self.blocks_decrypted = 0
+
+    @property
+    def block_count(self) -> int:
+        return len(self._entries)
+
+    def _block(self, block_no: int) -> bytes:
+        cached = self._blocks.get(block_no)
+        if cached is not None:
+            return cached
+        offset, ct_len, _ = self._entries[block_no]
+        last = block_no == len(self._entries) - 1
+        pt = self._block_aead.decrypt(_block_nonce(block_no), self._buf[offset:offset + ct_len],
+                                      _block_aad(self._header, block_no, last))
+        self.blocks_decrypted += 1
+        self._blocks.set(block_no, pt)
+        return pt
+
+    def read(self, offset: int, length: int) -> bytes:
+        """Return plaintext bytes [offset, offset+length), decrypting only the blocks touched."""
+        if offset < 0 or length < 0:
+            raise ValueError('offset and length must be non-negative')
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b''
+        first, last = offset // self.block_size, (end - 1) // self.block_size
+        out = bytearray()
+        for block_no in range(first, last + 1):
+            block = self._block(block_no)
+            start = block_no * self.block_size
+            out += block[max(offset - start, 0):end - start]
+        return bytes(out)
+
+    def close(self):
+        self._buf.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def encrypt_file(recipient_pub: bytes, src_path: str, dst_path: str,
+                 block_size: int = DEFAULT_BLOCK_SIZE, chunk_size: int = 1 << 20, suite: int = None):
+    """Encrypt `src_path` into a seekable container at `dst_path` in constant memory."""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        with SeekableWriter(dst, recipient_pub, block_size, suite) as w:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                w.write(chunk)
+
+
+def open_container(path: str, private_key, cached_blocks: int = 8) -> SeekableReader:
+    """Memory-map the container at `path` for random-access reads."""
+    return SeekableReader(path, private_key, cached_blocks=cached_blocks)
+
+
+__all__ = ['SeekableWriter', 'SeekableReader', 'encrypt_file', 'open_container', 'DEFAULT_BLOCK_SIZE']
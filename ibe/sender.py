@@ -0,0 +1,112 @@
+"""Stateless envelope primitives: encrypt to a public key, decrypt with a private key.
+
+Senders only need the recipient's public key (fetched from the PKG's
+`/get_pubkey`), so this module has no keystore and keeps its imports to the
+X25519/HKDF/AEAD primitives. `DemoIBE` builds on these functions; client
+CLIs use them directly so their startup time and memory do not depend on the
+size of the PKG's store.
+
+Usage:
+    env = encrypt_to_pubkey(ub64(pub_b64), b'hello')
+    plaintext = decrypt_with_privkey(priv_bytes, env)
+"""
+from __future__ import annotations
+import base64
+import os
+from typing import Any, Dict
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ibe import aead, compression
+from ibe.eph_pool import EphemeralKeyPool, new_ephemeral
+
+# Pre-encryption compression: 'off', 'auto' (adaptive codec choice) or a codec name
+IBE_COMPRESSION = os.environ.get('IBE_COMPRESSION', 'off')
+
+
+def b64(b: bytes) -> str:
+    return base64.b64encode(b).decode('ascii')
+
+
+def ub64(s: str) -> bytes:
+    return base64.b64decode(s)
+
+
+def load_private_key(private_key) -> x25519.X25519PrivateKey:
+    """Return an X25519 private key object from raw bytes (or pass one through).
+
+    Callers that decrypt repeatedly with the same key should parse it once with
+    this helper and hand the object to `decrypt` instead of the raw bytes.
+    """
+    if isinstance(private_key, x25519.X25519PrivateKey):
+        return private_key
+    return x25519.X25519PrivateKey.from_private_bytes(bytes(private_key))
+
+
+def _derive_key(shared: bytes) -> bytes:
+    # HKDF to derive a 32-byte AEAD key
+    hk = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b'demo-ibe')
+    return hk.derive(shared)
+
+
+def _maybe_compress(mode: str, message: bytes):
+    """Return (codec or None, payload) according to the compression mode."""
+    if not mode or mode == 'off':
+        return None, message
+    codec = compression.choose_codec(message) if mode == 'auto' else mode
+    if codec is None:
+        return None, message
+    packed = compression.compress(codec, message)
+    # Past the receiver's ratio/size limits the envelope could never be opened
+    if len(packed) >= len(message) or not compression.within_limits(len(message), len(packed)):
+        return None, message
+    return codec, packed
+
+
+def _seal_payload(key: bytes, message: bytes, suite: int = None, compression_mode: str = None) -> Dict[str, Any]:
+    """Compress (optionally) and AEAD-encrypt `message`; returns the envelope body fields."""
+    suite = suite or aead.preferred_suite()
+    nonce = os.urandom(12)
+    codec, message = _maybe_compress(compression_mode or IBE_COMPRESSION, message)
+    ct = aead.cipher(suite, key).encrypt(nonce, message, compression.codec_aad(codec))
+    fields = {"suite": suite, "nonce": b64(nonce), "ciphertext": b64(ct)}
+    if codec:
+        fields["codec"] = codec
+    return fields
+
+
+def _open_payload(key: bytes, envelope: Dict[str, Any]) -> bytes:
+    # Dispatch on the envelope's suite (absent = original ChaCha20-Poly1305 envelopes).
+    # The codec name is bound into the AEAD tag so it cannot be stripped or swapped.
+    cipher = aead.cipher(envelope.get('suite', aead.DEFAULT_SUITE), key)
+    codec = envelope.get('codec')
+    pt = cipher.decrypt(ub64(envelope['nonce']), ub64(envelope['ciphertext']), compression.codec_aad(codec))
+    return compression.decompress(codec, pt) if codec else pt
+
+
+def encrypt_to_pubkey(pub_bytes: bytes, message: bytes, suite: int = None, compression_mode: str = None,
+                      eph_pool: EphemeralKeyPool = None) -> Dict[str, Any]:
+    """Encrypt `message` to a raw 32-byte X25519 public key; returns a JSON-serializable envelope."""
+    peer_pub = x25519.X25519PublicKey.from_public_bytes(pub_bytes)
+    eph_priv, eph_pub = new_ephemeral(eph_pool)
+    shared = eph_priv.exchange(peer_pub)
+    del eph_priv
+    env = {"ephemeral_pub": b64(eph_pub)}
+    env.update(_seal_payload(_derive_key(shared), message, suite, compression_mode))
+    return env
+
+
+def decrypt_with_privkey(private_key, envelope: Dict[str, Any]) -> bytes:
+    """Decrypt an envelope with raw private key bytes (or a key from `load_private_key`)."""
+    priv = load_private_key(private_key)
+    if 'recipients' in envelope or 'session_id' in envelope:
+        # Multi-recipient and session envelopes are rarer; load their code on demand
+        from ibe.crypto_iface import decrypt_envelope
+        return decrypt_envelope(priv, envelope)
+    shared = priv.exchange(x25519.X25519PublicKey.from_public_bytes(ub64(envelope['ephemeral_pub'])))
+    return _open_payload(_derive_key(shared), envelope)
+
+
+__all__ = ['encrypt_to_pubkey', 'decrypt_with_privkey', 'load_private_key', 'b64', 'ub64']
@@ -0,0 +1,211 @@
+"""Per-recipient session keys for high-volume sender -> recipient streams.
+
+`DemoIBE.encrypt` pays for an ephemeral keygen, an X25519 exchange and HKDF
+on every message. For a sender that pushes thousands of small messages to the
+same recipient (alerting, notifications) that setup dominates the cost.
+
+In session mode the sender runs the exchange once per recipient, derives a
+session key from it and then seals each message with that key and a nonce
+built from a per-session message counter:
+
+    session_key = HKDF(shared, salt=session_id, info='demo-ibe-session')
+    nonce       = 0^4 || seq u64
+    aad         = 'ibe-session' || session_id || seq u64 [|| codec aad]
+
+Every envelope carries `ephemeral_pub`, `session_id` and `seq`, so it can
+still be decrypted on its own (`decrypt_envelope` understands it); a
+`SessionDecryptor` caches the derived key per session so the recipient's
+per-message cost is just the AEAD as well.
+
+A session is replaced (new ephemeral key, new session id, counter back to 0)
+when any limit of its `RekeyPolicy` is reached, or when the recipient's public
+key changes. Counters never repeat within a session, so nonces are unique per
+key.
+
+Configuration via environment variables (defaults for `RekeyPolicy()`):
+- IBE_SESSION_MAX_MESSAGES (default 10000)
+- IBE_SESSION_MAX_BYTES (default 67108864 = 64 MiB)
+- IBE_SESSION_MAX_AGE_SECONDS (default 3600)
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ibe import aead, compression
+from ibe.cache import LRUTTLCache
+from ibe.crypto_iface import canonicalize_identity, decrypt_envelope
+from ibe.sender import IBE_COMPRESSION, _maybe_compress, b64, load_private_key, ub64
+from ibe.eph_pool import EphemeralKeyPool, new_ephemeral
+
+IBE_SESSION_MAX_MESSAGES = int(os.environ.get('IBE_SESSION_MAX_MESSAGES', '10000'))
+IBE_SESSION_MAX_BYTES = int(os.environ.get('IBE_SESSION_MAX_BYTES', str(64 * 1024 * 1024)))
+IBE_SESSION_MAX_AGE_SECONDS = float(os.environ.get('IBE_SESSION_MAX_AGE_SECONDS', '3600'))
+
+_AAD_PREFIX = b'ibe-session'
+
+
+def _session_key(shared: bytes, session_id: bytes) -> bytes:
+    hk = HKDF(algorithm=hashes.SHA256(), length=32, salt=session_id, info=b'demo-ibe-session')
+    return hk.derive(shared)
+
+
+def _nonce(seq: int) -> bytes:
+    return b'\x00' * 4 + seq.to_bytes(8, 'big')
+
+
+def _aad(session_id: bytes, seq: int, codec: Optional[str]) -> bytes:
+    return _AAD_PREFIX + session_id + seq.to_bytes(8, 'big') + (compression.codec_aad(codec) or b'')
+
+
+class RekeyPolicy:
+    """Limits after which a sender session is replaced; None disables a limit."""
+
+    def __init__(self, max_messages: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_age: Optional[float] = None):
+        self.max_messages = IBE_SESSION_MAX_MESSAGES if max_messages is None else max_messages
+        self.max_bytes = IBE_SESSION_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = IBE_SESSION_MAX_AGE_SECONDS if max_age is None else max_age
+
+    def expired(self, session: '_SenderSession', size: int, now: float) -> bool:
+        """True if `session` must not carry a further message of `size` bytes."""
+        return bool((self.max_messages and session.seq >= self.max_messages)
+                    or (self.max_bytes and session.bytes and session.bytes + size > self.max_bytes)
+                    or (self.max_age and now - session.created >= self.max_age))
+
+
+class _SenderSession:
+    __slots__ = ('recipient_pub', 'session_id', 'eph_pub', 'suite', 'cipher', 'seq', 'bytes', 'created')
+
+    def __init__(self, recipient_pub: bytes, suite: int, eph_pool: Optional[EphemeralKeyPool], now: float):
+        eph_priv, eph_pub = new_ephemeral(eph_pool)
+        shared = eph_priv.exchange(x25519.X25519PublicKey.from_public_bytes(recipient_pub))
+        del eph_priv
+        self.recipient_pub = recipient_pub
+        self.session_id = os.urandom(16)
+        self.eph_pub = b64(eph_pub)
+        self.suite = suite
+        self.cipher = aead.cipher(suite, _session_key(shared, self.session_id))
+        self.seq = 0
+        self.bytes = 0
+        self.created = now
+
+
+class SessionEncryptor:
+    """Sender side of session mode.
+
+    `lookup` maps an identity to its public key bytes (e.g.
+    `DemoIBE.get_pubkey_for_identity`, or a PKG client).
+
+    Usage:
+        sessions = SessionEncryptor(demo.get_pubkey_for_identity, RekeyPolicy(max_messages=1000))
+        env = sessions.encrypt('alice@example.com', b'disk usage above 90%')
+    """
+
+    def __init__(self, lookup: Callable[[str], Optional[bytes]], policy: Optional[RekeyPolicy] = None,
+                 suite: Optional[int] = None, compression_mode: Optional[str] = None,
+                 eph_pool: Optional[EphemeralKeyPool] = None, max_sessions: int = 4096,
+                 clock: Callable[[], float] = time.monotonic):
+        self.lookup = lookup
+        self.policy = policy or RekeyPolicy()
+        self.suite = suite
+        self.compression = compression_mode or IBE_COMPRESSION
+        self.eph_pool = eph_pool
+        self._clock = clock
+        self._sessions = LRUTTLCache(max_entries=max_sessions, ttl=None)
+        self._lock = threading.Lock()
+        self.established = 0
+
+    def _reserve(self, identity: str, pub: bytes, size: int):
+        """Return (session, seq) for the next message, rekeying when the policy says so."""
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(identity)
+            if (session is None or session.recipient_pub != pub
+                    or self.policy.expired(session, size, now)):
+                session = _SenderSession(pub, self.suite or aead.preferred_suite(), self.eph_pool, now)
+                self._sessions.set(identity, session)
+                self.established += 1
+            seq = session.seq
+            session.seq += 1
+            session.bytes += size
+        return session, seq
+
+    def encrypt(self, identity: str, message: bytes) -> Dict[str, Any]:
+        identity = canonicalize_identity(identity)
+        pub = self.lookup(identity)
+        if pub is None:
+            raise ValueError('Recipient public key not found; ask PKG to extract first')
+        session, seq = self._reserve(identity, pub, len(message))
+        codec, message = _maybe_compress(self.compression, message)
+        ct = session.cipher.encrypt(_nonce(seq), message, _aad(session.session_id, seq, codec))
+        env = {"ephemeral_pub": session.eph_pub, "session_id": b64(session.session_id), "seq": seq,
+               "suite": session.suite, "ciphertext": b64(ct)}
+        if codec:
+            env["codec"] = codec
+        return env
+
+    def forget(self, identity: str):
+        """Drop the session for `identity`; the next message starts a new one."""
+        self._sessions.pop(canonicalize_identity(identity))
+
+    def stats(self) -> Dict[str, int]:
+        return {'sessions': len(self._sessions), 'established': self.established}
+
+
+def _open(cipher, envelope: Dict[str, Any], session_id: bytes) -> bytes:
+    seq = int(envelope['seq'])
+    codec = envelope.get('codec')
+    pt = cipher.decrypt(_nonce(seq), ub64(envelope['ciphertext']), _aad(session_id, seq, codec))
+    return compression.decompress(codec, pt) if codec else pt
+
+
+def _derive_cipher(priv, envelope: Dict[str, Any], session_id: bytes):
+    shared = priv.exchange(x25519.X25519PublicKey.from_public_bytes(ub64(envelope['ephemeral_pub'])))
+    return aead.cipher(envelope.get('suite', aead.DEFAULT_SUITE), _session_key(shared, session_id))
+
+
+def decrypt_session_envelope(private_key, envelope: Dict[str, Any]) -> bytes:
+    """Decrypt one session envelope without any cached state."""
+    session_id = ub64(envelope['session_id'])
+    return _open(_derive_cipher(load_private_key(private_key), envelope, session_id), envelope, session_id)
+
+
+class SessionDecryptor:
+    """Recipient side: caches the derived session cipher so each message costs one AEAD open.
+
+    Cache entries are keyed by (session_id, ephemeral_pub, suite), so a forged
+    envelope reusing a known session id cannot displace the real session key.
+    Envelopes without a session id are passed to `decrypt_envelope`.
+    """
+
+    def __init__(self, private_key, max_sessions: int = 1024, ttl: Optional[float] = None):
+        self._priv = load_private_key(private_key)
+        if ttl is None:
+            ttl = IBE_SESSION_MAX_AGE_SECONDS or None
+        self._sessions = LRUTTLCache(max_entries=max_sessions, ttl=ttl)
+
+    def decrypt(self, envelope: Dict[str, Any]) -> bytes:
+        if 'session_id' not in envelope:
+            return decrypt_envelope(self._priv, envelope)
+        session_id = ub64(envelope['session_id'])
+        cache_key = (session_id, envelope['ephemeral_pub'], envelope.get('suite', aead.DEFAULT_SUITE))
+        cipher = self._sessions.get(cache_key)
+        if cipher is None:
+            cipher = _derive_cipher(self._priv, envelope, session_id)
+            pt = _open(cipher, envelope, session_id)
+            # Cache only once the derived key has authenticated a message
+            self._sessions.set(cache_key, cipher)
+            return pt
+        return _open(cipher, envelope, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._sessions.stats()
+
+
+__all__ = ['RekeyPolicy', 'SessionEncryptor', 'SessionDecryptor', 'decrypt_session_envelope']
@@ -0,0 +1,254 @@
+"""Lightweight request tracing: spans, W3C `traceparent` propagation, exporters.
+
+A span records one timed operation (name, start, duration, attributes) and
+belongs to a trace; the current span lives in a `contextvars.ContextVar`, so
+nested `span()` blocks form a tree in threads and asyncio tasks alike.
+Clients send the current context in a `traceparent` header (`inject`) and the
+PKG continues the trace from it (`continue_trace`), so one end-to-end send is
+a single trace across processes.
+
+Finished spans go to an exporter:
+- `RingExporter` keeps the last N spans in memory (`recent()`, `dump(path)`),
+- `FileExporter` appends one JSON object per span to a file.
+
+`scripts/trace_view.py` renders waterfalls and critical paths from such files.
+
+While tracing is off, `span()` and `traced` functions cost one global check.
+
+Configuration via environment variables:
+- IBE_TRACE — `off` (default), `ring` or `file`
+- IBE_TRACE_FILE (default `traces.jsonl`) — output of the `file` exporter
+- IBE_TRACE_RING_SIZE (default 10000) — spans kept by the `ring` exporter
+
+Usage:
+    with tracing.span('relay.deliver', recipients=3):
+        ...
+    requests.get(url, headers=tracing.inject({}))
+"""
+from __future__ import annotations
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+IBE_TRACE = os.environ.get('IBE_TRACE', 'off')
+IBE_TRACE_FILE = os.environ.get('IBE_TRACE_FILE', 'traces.jsonl')
+IBE_TRACE_RING_SIZE = int(os.environ.get('IBE_TRACE_RING_SIZE', '10000'))
+
+TRACEPARENT = 'traceparent'
+
+
+class Span:
+    """One timed operation; `parent_id` is None for the root of a trace."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'duration', 'attrs', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+             'name': self.name, 'start': self.start, 'duration': self.duration}
+        if self.attrs:
+            d['attrs'] = self.attrs
+        if self.error:
+            d['error'] = self.error
+        return d
+
+
+class _Remote:
+    # Parent context received from another process (no local span object)
+    __slots__ = ('trace_id', 'span_id')
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class RingExporter:
+    """Keep the most recent `size` finished spans in memory."""
+
+    def __init__(self, size: int = None):
+        self._spans = deque(maxlen=size or IBE_TRACE_RING_SIZE)
+
+    def export(self, span: Span):
+        self._spans.append(span.to_dict())
+
+    def recent(self, trace_id: str = None) -> List[Dict[str, Any]]:
+        spans = list(self._spans)
+        return [s for s in spans if s['trace_id'] == trace_id] if trace_id else spans
+
+    def dump(self, path: str):
+        """Write the buffered spans as JSON lines (readable by scripts/trace_view.py)."""
+        with open(path, 'w', encoding='utf8') as f:
+            for s in list(self._spans):
+                f.write(json.dumps(s) + '\n')
+
+
+class FileExporter:
+    """Append finished spans to `path`, one JSON object per line."""
+
+    def __init__(self, path: str = None):
+        self.path = path or IBE_TRACE_FILE
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf8', buffering=1)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict()) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        self._file.close()
+
+
+def _default_exporter():
+    if IBE_TRACE == 'ring':
+        return RingExporter()
+    if IBE_TRACE == 'file':
+        return FileExporter()
+    return None
+
+
+_exporter = _default_exporter()
+_current: contextvars.ContextVar = contextvars.ContextVar('ibe_trace_span', default=None)
+
+
+def set_exporter(exporter) -> None:
+    """Enable tracing with `exporter` (anything with `export(span)`), or disable it with None."""
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    return _exporter
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanScope:
+    __slots__ = ('span', '_token')
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.duration = time.time() - span.start
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        _current.reset(self._token)
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(span)
+        return False
+
+
+def _start(name: str, parent, attrs: Dict[str, Any]) -> _SpanScope:
+    if parent is None:
+        return _SpanScope(Span(name, os.urandom(16).hex(), None, attrs))
+    return _SpanScope(Span(name, parent.trace_id, parent.span_id, attrs))
+
+
+def span(name: str, **attrs):
+    """Context manager timing a child of the current span (or a new trace's root)."""
+    if _exporter is None:
+        return _NOOP
+    return _start(name, _current.get(), attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator form of `span(name)`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if _exporter is None:
+                return fn(*args, **kwargs)
+            with _start(name, _current.get(), {}):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def bind(fn: Callable) -> Callable:
+    """Make `fn` run in (a copy of) the caller's trace context, e.g. on an executor thread."""
+    if _exporter is None:
+        return fn
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def current_span() -> Optional[Span]:
+    s = _current.get()
+    return s if isinstance(s, Span) else None
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """Add a W3C `traceparent` header for the current span (if any) to `headers`."""
+    s = _current.get()
+    if s is not None and _exporter is not None:
+        headers[TRACEPARENT] = '00-%s-%s-01' % (s.trace_id, s.span_id)
+    return headers
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[_Remote]:
+    if not value:
+        return None
+    parts = value.strip().split('-')
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == '0' * 32 or parts[2] == '0' * 16:
+        return None
+    return _Remote(parts[1], parts[2])
+
+
+def continue_trace(name: str, headers, **attrs):
+    """Server side: span `name` as a child of the caller's `traceparent` (or a new root)."""
+    if _exporter is None:
+        return _NOOP
+    return _start(name, parse_traceparent(headers.get(TRACEPARENT)) or _current.get(), attrs)
+
+
+__all__ = ['Span', 'RingExporter', 'FileExporter', 'set_exporter', 'get_exporter', 'enabled', 'span',
+           'traced', 'bind', 'current_span', 'inject', 'parse_traceparent', 'continue_trace']
@@ -0,0 +1,248 @@
+"""Decrypting inbound mail gateway.
+
+Receiving-side counterpart of `mail/relay.py`, built on the same aiosmtpd
+handler pattern as `scripts/debug_smtp_server.py`. For every accepted message
+and local recipient the gateway:
+
+1. looks for an IBE envelope part (see `mail/ibe_mime.py`),
+2. decrypts it with the recipient's key from a local key directory,
+3. delivers the plaintext into `<maildir_root>/<recipient>/` using Maildir's
+   write-to-tmp-then-rename delivery, so readers never see partial files.
+
+Only recipients with a key in the local key directory are accepted at RCPT
+TO (550 otherwise). Identities that are not a single safe path component
+(path separators, `..`, NUL, a leading dot) are refused, and every key and
+Maildir path is checked to resolve inside its root.
+
+Key lookup, decryption and delivery run in a worker pool (processes by
+default) so the SMTP event loop never blocks on CPU or disk. Messages without
+an envelope are delivered unchanged; messages whose key disappeared after
+RCPT TO are delivered still encrypted and tagged with `X-IBE-Status: no-key`,
+and envelopes that fail to decrypt (wrong key, tampered or malformed) are
+delivered as received, tagged `X-IBE-Status: error`.
+
+Each recipient is delivered on its own. Once any recipient has its copy the
+message is accepted (failures are logged and counted), so a retry by the
+sending MTA never duplicates mail. Only when no recipient was delivered is it
+refused: 451 if every failure was transient (disk, worker pool), else 554.
+
+The key directory holds one file per identity named `<identity>.key`
+containing the base64 private key returned by the PKG's `/extract`.
+
+Usage:
+    python -m mail.inbound --port 2526 --keys ./keys --maildir ./Maildir
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import mailbox
+import os
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from ibe.cache import LRUTTLCache
+from ibe.crypto_iface import canonicalize_identity, decrypt_envelope, ub64
+from mail.ibe_mime import find_envelope, parse_message
+from mail.relay import RelayStats
+
+
+def safe_path(root: str, identity: str, suffix: str = '') -> Optional[str]:
+    """`<root>/<identity><suffix>` if the identity is one safe path component, else None."""
+    if not identity or identity.startswith('.') or '..' in identity or '\0' in identity:
+        return None
+    if os.sep in identity or (os.altsep and os.altsep in identity):
+        return None
+    path = os.path.join(root, identity + suffix)
+    # Belt and braces: symlinks or platform quirks must not lead outside the root
+    real_root = os.path.realpath(root)
+    if os.path.commonpath([real_root, os.path.realpath(path)]) != real_root:
+        return None
+    return path
+
+
+class KeyDirectory:
+    """Loads per-identity private keys from disk on demand and caches them."""
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 300.0):
+        self.path = path
+        self.cache = LRUTTLCache(max_entries=max_entries, ttl=ttl)
+
+    def _load(self, identity: str) -> Optional[bytes]:
+        fn = safe_path(self.path, identity, '.key')
+        if fn is None:
+            return None
+        try:
+            with open(fn, 'r', encoding='ascii') as f:
+                return ub64(f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def get(self, identity: str) -> Optional[bytes]:
+        identity = canonicalize_identity(identity)
+        if safe_path(self.path, identity, '.key') is None:
+            return None
+        # Negative results are cached too (as b'') so unknown senders stay cheap
+        key = self.cache.get_or_set(identity, lambda: self._load(identity) or b'')
+        return key or None
+
+
+_maildirs: Dict[str, mailbox.Maildir] = {}
+_key_dirs: Dict[str, KeyDirectory] = {}
+
+
+def _key_directory(path: str) -> KeyDirectory:
+    # One cached KeyDirectory per worker process (or per gateway, for thread pools)
+    keys = _key_dirs.get(path)
+    if keys is None:
+        keys = _key_dirs[path] = KeyDirectory(path)
+    return keys
+
+
+def _maildir(root: str, identity: str) -> mailbox.Maildir:
+    path = safe_path(root, identity)
+    if path is None:
+        raise ValueError('unsafe recipient %r' % identity)
+    md = _maildirs.get(path)
+    if md is None:
+        # Create the layout ourselves: Maildir(create=True) races between workers
+        for sub in ('tmp', 'new', 'cur'):
+            os.makedirs(os.path.join(path, sub), mode=0o700, exist_ok=True)
+        md = _maildirs[path] = mailbox.Maildir(path, factory=None, create=False)
+    return md
+
+
+def decrypt_and_deliver(maildir_root: str, identity: str, raw: bytes,
+                        private_key: Optional[bytes] = None, key_dir: Optional[str] = None) -> str:
+    """Worker-side job: decrypt `raw` for `identity` if possible and deliver it.
+
+    The key is `private_key`, or read from `key_dir` here in the worker.
+    Module-level so it can run in a process pool. Returns the delivery status
+    ('decrypted', 'passthrough', 'no-key' or 'error').
+    """
+    envelope = find_envelope(parse_message(raw, fast=True))
+    if envelope is not None and private_key is None and key_dir is not None:
+        private_key = _key_directory(key_dir).get(identity)
+    if envelope is None:
+        status, data = 'passthrough', raw
+    elif private_key is None:
+        status, data = 'no-key', b'X-IBE-Status: no-key\r\n' + raw
+    else:
+        try:
+            plaintext = decrypt_envelope(private_key, envelope)
+            status, data = 'decrypted', b'X-IBE-Status: decrypted\r\n' + plaintext
+        except Exception:
+            # Retrying cannot fix a bad envelope; hand it over as received
+            status, data = 'error', b'X-IBE-Status: error\r\n' + raw
+    # Maildir.add writes into tmp/ and renames into new/ atomically
+    _maildir(maildir_root, identity).add(data)
+    return status
+
+
+class InboundGatewayHandler:
+    """aiosmtpd handler that decrypts IBE mail and delivers it to Maildirs."""
+
+    def __init__(self, keys: KeyDirectory, maildir_root: str, executor: Optional[Executor] = None,
+                 max_concurrency: int = 64):
+        self.keys = keys
+        self.maildir_root = maildir_root
+        self.executor = executor or ProcessPoolExecutor()
+        self.max_concurrency = max_concurrency
+        self.stats = RelayStats()
+        self.delivered: Dict[str, int] = {'decrypted': 0, 'passthrough': 0, 'no-key': 0, 'error': 0}
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        # Accept only local recipients we hold a key for; the lookup reads disk, so keep it off the loop
+        identity = canonicalize_identity(address)
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.keys.get, identity) is None:
+            return '550 5.1.1 Unknown recipient'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        started = time.perf_counter()
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.stats.enter()
+        loop = asyncio.get_running_loop()
+        raw = envelope.original_content or envelope.content
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+        try:
+            async with self._sem:
+                jobs = []
+                for rcpt in envelope.rcpt_tos:
+                    identity = canonicalize_identity(rcpt)
+                    jobs.append(loop.run_in_executor(self.executor, decrypt_and_deliver,
+                                                     self.maildir_root, identity, raw, None, self.keys.path))
+                # Recipients succeed or fail on their own; one failure must not undo the others
+                results = await asyncio.gather(*jobs, return_exceptions=True)
+        finally:
+            self.stats.leave(started)
+        failed = {}
+        for rcpt, result in zip(envelope.rcpt_tos, results):
+            if isinstance(result, BaseException):
+                failed[rcpt] = result
+            else:
+                self.delivered[result] += 1
+        if failed:
+            self.stats.failed += 1
+            print(f'Inbound delivery failed for {sorted(failed)}: {list(failed.values())}')
+            if len(failed) == len(results):
+                if all(isinstance(e, (OSError, BrokenExecutor)) for e in failed.values()):
+                    return '451 4.3.0 Temporary delivery failure'
+                return '554 5.3.0 Delivery failed'
+        self.stats.relayed += 1
+        return '250 Message accepted for delivery'
+
+    def snapshot(self):
+        snap = self.stats.snapshot()
+        snap.update(self.delivered)
+        return snap
+
+
+def make_executor(kind: str, workers: Optional[int]) -> Executor:
+    if kind == 'thread':
+        return ThreadPoolExecutor(max_workers=workers or 8, thread_name_prefix='ibe-inbound')
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def main():
+    from aiosmtpd.controller import Controller
+
+    parser = argparse.ArgumentParser(description='Decrypting IBE inbound gateway (Maildir delivery)')
+    parser.add_argument('--host', default='localhost', help='Host to bind to (default: localhost)')
+    parser.add_argument('--port', type=int, default=2526, help='Port to bind to (default: 2526)')
+    parser.add_argument('--keys', required=True, help='Directory of <identity>.key files')
+    parser.add_argument('--maildir', required=True, help='Root directory for per-recipient Maildirs')
+    parser.add_argument('--pool', choices=('process', 'thread'), default='process')
+    parser.add_argument('--workers', type=int, default=None, help='Worker count (default: CPU count)')
+    parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between stats lines')
+    args = parser.parse_args()
+
+    handler = InboundGatewayHandler(KeyDirectory(args.keys), args.maildir,
+                                    make_executor(args.pool, args.workers))
+    controller = Controller(handler, hostname=args.host, port=args.port)
+    controller.start()
+    print(f'Inbound gateway on {args.host}:{args.port}, delivering to {args.maildir}')
+    print('Press Ctrl+C to stop')
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print('[inbound]', handler.snapshot())
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(report())
+    except KeyboardInterrupt:
+        print('\nShutting down gateway...')
+    finally:
+        controller.stop()
+        handler.executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
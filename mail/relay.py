@@ -0,0 +1,193 @@
+"""Encrypting SMTP relay.
+
+Mail clients submit ordinary messages to this relay (an aiosmtpd server, like
+`scripts/debug_smtp_server.py`). For every message the relay:
+
+1. parses the MIME message,
+2. resolves all recipients' public keys with one batch PKG lookup,
+3. encrypts the full message once for all recipients (`encrypt_multi`),
+4. forwards the wrapped message to the upstream SMTP server over pooled
+   connections.
+
+Encryption and upstream delivery run on a thread pool so the SMTP event loop
+stays responsive; a semaphore bounds how many messages are processed at once.
+Per-message latency and queue depth are tracked in `RelayStats`.
+
+Usage:
+    python -m mail.relay --port 2525 --upstream-host smtp.example.com --upstream-port 587 --pkg http://127.0.0.1:5000
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ibe import tracing
+from ibe.crypto_iface import canonicalize_many, encrypt_multi
+from ibe.eph_pool import EphemeralKeyPool, default_pool
+from mail.ibe_mime import parse_message, wrap_encrypted
+from mail.smtp_pool import SMTPConnectionPool
+
+
+class RelayStats:
+    """Counters plus a rolling window of per-message latencies (seconds)."""
+
+    def __init__(self, window: int = 1024):
+        self.accepted = 0
+        self.relayed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=window)
+
+    def enter(self):
+        self.accepted += 1
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def leave(self, started: float):
+        self.queue_depth -= 1
+        self.latencies.append(time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, float]:
+        lat = sorted(self.latencies)
+
+        def pct(p):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 3) if lat else None
+
+        return {
+            'accepted': self.accepted,
+            'relayed': self.relayed,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'latency_ms_p50': pct(0.50),
+            'latency_ms_p95': pct(0.95),
+            'latency_ms_max': pct(1.0),
+        }
+
+
+class PKGResolver:
+    """Resolve recipient public keys with the PKG's batch `/get_pubkeys` endpoint.
+
+    Uses the pooled, retrying `clients.pkg_client.PKGClient`.
+    """
+
+    def __init__(self, pkg_url: str, timeout: float = 10.0):
+        from clients.pkg_client import PKGClient
+        self.pkg_url = pkg_url.rstrip('/')
+        self.client = PKGClient(self.pkg_url, timeout=timeout)
+
+    def __call__(self, identities: List[str]) -> Dict[str, bytes]:
+        return self.client.get_pubkeys(identities)
+
+
+class EncryptingRelayHandler:
+    """aiosmtpd handler that encrypts each message and relays it upstream."""
+
+    def __init__(self, resolver: Callable[[List[str]], Dict[str, bytes]],
+                 upstream: SMTPConnectionPool, max_concurrency: int = 16,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 eph_pool: Optional[EphemeralKeyPool] = None):
+        self.resolver = resolver
+        self.eph_pool = eph_pool if eph_pool is not None else default_pool()
+        self.upstream = upstream
+        self.max_concurrency = max_concurrency
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency,
+                                                       thread_name_prefix='ibe-relay')
+        self.stats = RelayStats()
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    @tracing.traced('relay.encrypt')
+    def _encrypt(self, raw: bytes, pubkeys: Iterable[bytes]) -> bytes:
+        original = parse_message(raw, fast=True)
+        envelope = encrypt_multi(pubkeys, raw, eph_pool=self.eph_pool)
+        return wrap_encrypted(original, envelope).as_bytes()
+
+    async def handle_DATA(self, server, session, envelope):
+        started = time.perf_counter()
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.stats.enter()
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._sem:
+                with tracing.span('relay.message', recipients=len(envelope.rcpt_tos)):
+                    recipients = canonicalize_many(envelope.rcpt_tos)
+                    pubkeys = await loop.run_in_executor(self.executor, tracing.bind(self.resolver), recipients)
+                    missing = [r for r in recipients if r not in pubkeys]
+                    if missing:
+                        self.stats.rejected += 1
+                        return '550 5.1.1 No IBE key for: %s' % ', '.join(missing)
+                    raw = envelope.original_content or envelope.content
+                    if isinstance(raw, str):
+                        raw = raw.encode('utf-8')
+                    wrapped = await loop.run_in_executor(
+                        self.executor, tracing.bind(self._encrypt), raw, [pubkeys[r] for r in recipients])
+                    await loop.run_in_executor(
+                        self.executor, tracing.bind(self.upstream.send),
+                        envelope.mail_from, envelope.rcpt_tos, wrapped)
+        except Exception as e:
+            self.stats.failed += 1
+            print(f'Relay failed for {envelope.mail_from} -> {envelope.rcpt_tos}: {e}')
+            return '451 4.3.0 Temporary relay failure'
+        finally:
+            self.stats.leave(started)
+        self.stats.relayed += 1
+        return '250 Message accepted for delivery'
+
+
+async def _report(handler: EncryptingRelayHandler, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        snap = handler.stats.snapshot()
+        if handler.eph_pool is not None:
+            snap['eph_pool'] = handler.eph_pool.stats()
+        print('[relay]', snap)
+
+
+def main():
+    from aiosmtpd.controller import Controller
+
+    parser = argparse.ArgumentParser(description='Encrypting IBE SMTP relay')
+    parser.add_argument('--host', default='localhost', help='Host to bind to (default: localhost)')
+    parser.add_argument('--port', type=int, default=2525, help='Port to bind to (default: 2525)')
+    parser.add_argument('--upstream-host', default=os.environ.get('SMTP_HOST', 'localhost'))
+    parser.add_argument('--upstream-port', type=int, default=int(os.environ.get('SMTP_PORT', '1025')))
+    parser.add_argument('--starttls', action='store_true', help='Use STARTTLS to the upstream server')
+    parser.add_argument('--pkg', default='http://127.0.0.1:5000', help='PKG base URL for key lookups')
+    parser.add_argument('--pool-size', type=int, default=4, help='Pooled upstream SMTP connections')
+    parser.add_argument('--max-concurrency', type=int, default=16, help='Messages processed at once')
+    parser.add_argument('--eph-pool-size', type=int, default=0,
+                        help='Pre-generated ephemeral keys (default: 0, or IBE_EPH_POOL_SIZE)')
+    parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between stats lines')
+    args = parser.parse_args()
+
+    upstream = SMTPConnectionPool(args.upstream_host, args.upstream_port, size=args.pool_size,
+                                  starttls=args.starttls, user=os.environ.get('SMTP_USER', ''),
+                                  password=os.environ.get('SMTP_PASS', ''))
+    eph_pool = EphemeralKeyPool(args.eph_pool_size) if args.eph_pool_size > 0 else None
+    handler = EncryptingRelayHandler(PKGResolver(args.pkg), upstream, max_concurrency=args.max_concurrency,
+                                     eph_pool=eph_pool)
+    controller = Controller(handler, hostname=args.host, port=args.port)
+    controller.start()
+    print(f'Encrypting relay on {args.host}:{args.port} -> {args.upstream_host}:{args.upstream_port}')
+    print('Press Ctrl+C to stop')
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(_report(handler, args.stats_interval))
+    except KeyboardInterrupt:
+        print('\nShutting down relay...')
+    finally:
+        controller.stop()
+        upstream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Small pool of persistent SMTP client connections to one upstream server.
+
+Opening an SMTP session (TCP connect, EHLO, optional STARTTLS and AUTH) costs
+several round trips, so the relay keeps a handful of sessions open and reuses
+them. Connections that fail are discarded and a fresh one is opened once
+before the error is reported.
+"""
+from __future__ import annotations
+import queue
+import smtplib
+import threading
+from typing import Iterable, Optional
+
+from ibe import tracing
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of `smtplib.SMTP` sessions.
+
+    Usage:
+        pool = SMTPConnectionPool('mail.example.com', 587, size=4, starttls=True)
+        pool.send('alice@example.com', ['bob@example.com'], raw_bytes)
+    """
+
+    def __init__(self, host: str, port: int, size: int = 4, timeout: float = 30.0,
+                 starttls: bool = False, user: str = '', password: str = ''):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self._idle: 'queue.LifoQueue[smtplib.SMTP]' = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user and self.password:
+            conn.login(self.user, self.password)
+        self.opened += 1
+        return conn
+
+    def _checkout(self) -> smtplib.SMTP:
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+            return conn
+        except queue.Empty:
+            return self._connect()
+
+    @staticmethod
+    def _discard(conn: Optional[smtplib.SMTP]):
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @tracing.traced('smtp.send')
+    def send(self, mail_from: str, rcpt_tos: Iterable[str], data: bytes):
+        """Deliver one message, retrying once on a stale pooled connection."""
+        rcpt_tos = list(rcpt_tos)
+        with self._slots:
+            conn = None
+            for attempt in range(2):
+                try:
+                    conn = self._checkout()
+                    conn.sendmail(mail_from, rcpt_tos, data)
+                    self._idle.put(conn)
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    self._discard(conn)
+                    conn = None
+                    if attempt == 1:
+                        raise
+                except smtplib.SMTPException:
+                    # Protocol-level rejection: the session itself is still usable
+                    try:
+                        conn.rset()
+                        self._idle.put(conn)
+                    except Exception:
+                        self._discard(conn)
+                    raise
+                except OSError:
+                    self._discard(conn)
+                    conn = None
+                    if attempt == 1:
+                        raise
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except Exception:
+                self._discard(conn)
+
+
+__all__ = ['SMTPConnectionPool']
@@ -0,0 +1,198 @@
+"""Admission control and load shedding for the PKG.
+
+Requests are grouped into route classes with separate in-flight limits, so a
+burst of slow `/request_extract_code` calls (SMTP sends) or `/extract` calls
+(keystore writes) cannot use up the capacity for cheap public-key reads:
+
+- `read`     — /mpk, /get_pubkey, /get_pubkeys, /pubkeys/*  (highest limits)
+- `extract`  — /extract
+- `otp`      — /request_extract_code
+
+A request that finds its class at the limit waits in a bounded queue. Queue
+delay is measured CoDel-style: if every request admitted during one
+`interval` waited longer than `target`, the class is overloaded, and new
+arrivals that would have to queue are shed immediately instead of waiting.
+The class recovers as soon as one request is admitted under the target.
+Requests that wait longer than `max_wait`, or find the queue full, are also
+shed. Shed requests get `503` and a `Retry-After` header.
+
+Configuration via environment variables:
+- PKG_ADMISSION (default 1) — set to 0 to admit everything
+- PKG_ADMISSION_LIMITS (default `read=64,extract=8,otp=4`) — in-flight limit per class;
+  each class queues at most 4x its limit
+- PKG_ADMISSION_TARGET_MS (default 50), PKG_ADMISSION_INTERVAL_MS (default 500) — CoDel target and interval
+- PKG_ADMISSION_MAX_WAIT_MS (default 1000) — longest a request may queue
+"""
+from __future__ import annotations
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+PKG_ADMISSION = os.environ.get('PKG_ADMISSION', '1') not in ('0', 'false', 'no')
+PKG_ADMISSION_LIMITS = os.environ.get('PKG_ADMISSION_LIMITS', 'read=64,extract=8,otp=4')
+PKG_ADMISSION_TARGET_MS = float(os.environ.get('PKG_ADMISSION_TARGET_MS', '50'))
+PKG_ADMISSION_INTERVAL_MS = float(os.environ.get('PKG_ADMISSION_INTERVAL_MS', '500'))
+PKG_ADMISSION_MAX_WAIT_MS = float(os.environ.get('PKG_ADMISSION_MAX_WAIT_MS', '1000'))
+
+ROUTE_CLASSES = {
+    '/extract': 'extract',
+    '/request_extract_code': 'otp',
+}
+
+
+def route_class(path: str) -> str:
+    """Admission class of a request path; everything not listed is a cheap read."""
+    return ROUTE_CLASSES.get(path, 'read')
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for part in spec.split(','):
+        if part.strip():
+            name, _, value = part.partition('=')
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class Overloaded(Exception):
+    """Raised by `AdmissionController.admit` when a request is shed."""
+
+    def __init__(self, cls: str, reason: str, retry_after: int):
+        super().__init__('%s overloaded (%s)' % (cls, reason))
+        self.cls = cls
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Class:
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.inflight = 0
+        self.waiting = 0
+        self.cond = None  # set by the controller (shares its lock)
+        # CoDel state
+        self.first_above: Optional[float] = None
+        self.dropping = False
+        self.last_delay = 0.0
+        # counters
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+
+class AdmissionController:
+    """Per-class in-flight limits with CoDel-style queue-delay shedding.
+
+    Usage:
+        ac = AdmissionController({'read': 64, 'extract': 8, 'otp': 4})
+        with ac.admit('extract'):   # raises Overloaded when shed
+            handle()
+    """
+
+    def __init__(self, limits: Dict[str, int] = None, target: float = None, interval: float = None,
+                 max_wait: float = None, queue_factor: int = 4, clock: Callable[[], float] = time.monotonic):
+        limits = limits or parse_limits(PKG_ADMISSION_LIMITS)
+        self.target = PKG_ADMISSION_TARGET_MS / 1000 if target is None else target
+        self.interval = PKG_ADMISSION_INTERVAL_MS / 1000 if interval is None else interval
+        self.max_wait = PKG_ADMISSION_MAX_WAIT_MS / 1000 if max_wait is None else max_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.classes: Dict[str, _Class] = {}
+        for name, limit in limits.items():
+            c = _Class(name, limit, queue_factor * limit)
+            c.cond = threading.Condition(self._lock)
+            self.classes[name] = c
+
+    def _retry_after(self, c: _Class) -> int:
+        # Roughly how long the current backlog needs to drain, at least one second
+        return max(1, math.ceil(c.last_delay * 2 + self.target))
+
+    def _shed(self, c: _Class, reason: str):
+        c.shed += 1
+        raise Overloaded(c.name, reason, self._retry_after(c))
+
+    def _observe(self, c: _Class, delay: float, now: float):
+        # CoDel: overloaded once the queue delay stayed above target for a whole interval
+        c.last_delay = delay
+        if delay < self.target:
+            c.first_above = None
+            c.dropping = False
+        elif c.first_above is None:
+            c.first_above = now + self.interval
+        elif now >= c.first_above:
+            c.dropping = True
+
+    def acquire(self, cls: str):
+        """Admit one request of class `cls` (waiting if needed) or raise `Overloaded`."""
+        c = self.classes.get(cls)
+        if c is None:
+            return
+        with self._lock:
+            if c.inflight < c.limit and not c.waiting:
+                c.inflight += 1
+                c.admitted += 1
+                self._observe(c, 0.0, self._clock())
+                return
+            if c.dropping:
+                self._shed(c, 'queue delay above target')
+            if c.waiting >= c.max_queue:
+                self._shed(c, 'queue full')
+            enqueued = self._clock()
+            deadline = enqueued + self.max_wait
+            c.waiting += 1
+            c.queued += 1
+            try:
+                while c.inflight >= c.limit:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0 or c.dropping:
+                        self._observe(c, self._clock() - enqueued, self._clock())
+                        self._shed(c, 'waited too long')
+                    c.cond.wait(remaining)
+            finally:
+                c.waiting -= 1
+            now = self._clock()
+            c.inflight += 1
+            c.admitted += 1
+            self._observe(c, now - enqueued, now)
+
+    def release(self, cls: str):
+        c = self.classes.get(cls)
+        if c is None:
+            return
+        with self._lock:
+            c.inflight -= 1
+            c.cond.notify()
+
+    def admit(self, cls: str):
+        """Context manager around `acquire`/`release`."""
+        return _Admission(self, cls)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: {'limit': c.limit, 'inflight': c.inflight, 'waiting': c.waiting,
+                           'admitted': c.admitted, 'queued': c.queued, 'shed': c.shed,
+                           'dropping': c.dropping, 'last_delay_ms': round(c.last_delay * 1000, 2)}
+                    for name, c in self.classes.items()}
+
+
+class _Admission:
+    __slots__ = ('controller', 'cls')
+
+    def __init__(self, controller: AdmissionController, cls: str):
+        self.controller = controller
+        self.cls = cls
+
+    def __enter__(self):
+        self.controller.acquire(self.cls)
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release(self.cls)
+        return False
+
+
+__all__ = ['AdmissionController', 'Overloaded', 'route_class', 'parse_limits', 'PKG_ADMISSION']
@@ -0,0 +1,293 @@
+"""Append-only audit log of private-key extraction.
+
+Every `/extract` outcome is recorded as one JSON line: timestamp, SHA-256 of
+the canonical identity, client IP and result (`issued`, or why it was
+refused). Request threads only append the event to a bounded in-memory
+buffer. A background writer drains the buffer in group commits: it writes
+all events that arrived during the durability window (or a full batch) and
+then makes a single fsync for all of them. The cost of an fsync is thus
+shared by every extraction in the window rather than paid per request.
+A crash can lose at most the events of the last window. With
+PKG_AUDIT_SYNC=1, `/extract` instead waits until its event is committed
+before returning the key.
+
+If the writer falls behind, the buffer fills and requests block (for at most
+PKG_AUDIT_BLOCK_SECONDS, then `AuditUnavailable`) instead of issuing keys
+that are not recorded.
+
+The active file is rotated by size or age to `<path>.<UTC time>` and
+compressed in the background to `<path>.<UTC time>.gz`. Each rotated file
+holds the events up to its timestamp, so time-range queries can skip older
+files without opening them (`iter_events`, `scripts/audit_query.py`).
+
+Configuration via environment variables:
+- PKG_AUDIT_LOG — path of the active log file; enables auditing in `pkg/server.py`
+- PKG_AUDIT_WINDOW_MS (default 10) — durability window: longest an event waits for others to
+  share its commit (0: commit as soon as the writer is free)
+- PKG_AUDIT_BATCH (default 1000) — most events per commit
+- PKG_AUDIT_BUFFER (default 10000) — events buffered before requests block
+- PKG_AUDIT_BLOCK_SECONDS (default 5) — longest a request waits for buffer space or its commit
+- PKG_AUDIT_SYNC (default 0) — `/extract` returns only after its event is committed
+- PKG_AUDIT_ROTATE_MB (default 64), PKG_AUDIT_ROTATE_HOURS (default 24)
+"""
+from __future__ import annotations
+import calendar
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ibe.crypto_iface import canonicalize_identity
+
+PKG_AUDIT_LOG = os.environ.get('PKG_AUDIT_LOG') or None
+PKG_AUDIT_WINDOW_MS = float(os.environ.get('PKG_AUDIT_WINDOW_MS', '10'))
+PKG_AUDIT_BATCH = int(os.environ.get('PKG_AUDIT_BATCH', '1000'))
+PKG_AUDIT_BUFFER = int(os.environ.get('PKG_AUDIT_BUFFER', '10000'))
+PKG_AUDIT_BLOCK_SECONDS = float(os.environ.get('PKG_AUDIT_BLOCK_SECONDS', '5'))
+PKG_AUDIT_SYNC = os.environ.get('PKG_AUDIT_SYNC', '0') in ('1', 'true', 'yes')
+PKG_AUDIT_ROTATE_MB = float(os.environ.get('PKG_AUDIT_ROTATE_MB', '64'))
+PKG_AUDIT_ROTATE_HOURS = float(os.environ.get('PKG_AUDIT_ROTATE_HOURS', '24'))
+
+_STAMP = '%Y%m%dT%H%M%SZ'
+
+
+class AuditUnavailable(RuntimeError):
+    """The event could not be buffered or committed in time."""
+
+
+def identity_hash(identity: str) -> str:
+    """Hex SHA-256 of the canonical identity, as stored in the log."""
+    return hashlib.sha256(canonicalize_identity(identity).encode('utf8')).hexdigest()
+
+
+class AuditLog:
+    """Background group-commit writer for extraction events.
+
+    Usage:
+        audit = AuditLog('/var/log/pkg/extract.log').start()
+        seq = audit.record('alice@example.com', '203.0.113.7', 'issued')
+        audit.wait(seq)        # only if the caller needs the event on disk
+        audit.close()          # commits what is buffered
+    """
+
+    def __init__(self, path: str, window: float = None, batch: int = None, buffer: int = None,
+                 block: float = None, rotate_bytes: int = None, rotate_seconds: float = None):
+        self.path = path
+        self.window = PKG_AUDIT_WINDOW_MS / 1000 if window is None else window
+        self.batch = batch or PKG_AUDIT_BATCH
+        self.buffer = buffer or PKG_AUDIT_BUFFER
+        self.block = PKG_AUDIT_BLOCK_SECONDS if block is None else block
+        self.rotate_bytes = int(PKG_AUDIT_ROTATE_MB * 2**20) if rotate_bytes is None else rotate_bytes
+        self.rotate_seconds = PKG_AUDIT_ROTATE_HOURS * 3600 if rotate_seconds is None else rotate_seconds
+        self._pending: List[Tuple[float, str]] = []  # (enqueue time, line)
+        self._cond = threading.Condition()
+        self._seq = 0         # events accepted
+        self._committed = 0   # events fsynced
+        self._closing = False
+        self._thread = None
+        self._file = None
+        self._opened = 0.0
+        self._compressors: List[threading.Thread] = []
+        self.commits = 0
+        self.max_batch = 0
+        self.blocked = 0
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._open()
+        # A crash between rotation and compression leaves plain rotated files behind
+        for leftover in glob.glob(glob.escape(self.path) + '.*'):
+            if leftover.endswith('.gz.tmp'):
+                os.remove(leftover)
+            elif not leftover.endswith('.gz') and _rotated_end(self.path, leftover) is not None:
+                self._compress_later(leftover)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._opened = time.time()
+        if self._file.tell():
+            # Terminate a line torn by a crash so the next event starts cleanly
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write(b'\n')
+
+    def record(self, identity: str, ip: Optional[str], result: str, ts: float = None) -> int:
+        """Queue one event; returns its sequence number for `wait`.
+
+        Blocks while the buffer is full; raises AuditUnavailable after `block` seconds.
+        """
+        ts = time.time() if ts is None else ts
+        line = json.dumps({'ts': round(ts, 3), 'id': identity_hash(identity), 'ip': ip, 'result': result},
+                          separators=(',', ':')) + '\n'
+        deadline = time.monotonic() + self.block
+        with self._cond:
+            if len(self._pending) >= self.buffer:
+                self.blocked += 1
+                while len(self._pending) >= self.buffer and not self._closing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AuditUnavailable('audit buffer full')
+                    self._cond.wait(remaining)
+            if self._closing:
+                raise AuditUnavailable('audit log closed')
+            self._pending.append((time.monotonic(), line))
+            self._seq += 1
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq: int, timeout: float = None) -> bool:
+        """Wait until event `seq` is committed; False on timeout."""
+        deadline = time.monotonic() + (self.block if timeout is None else timeout)
+        with self._cond:
+            while self._committed < seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def _take(self) -> Optional[List[Tuple[float, str]]]:
+        # Next group: everything that arrived within the window of the oldest event, up to `batch`
+        with self._cond:
+            while not self._pending and not self._closing:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            due = self._pending[0][0] + self.window
+            while len(self._pending) < self.batch and not self._closing:
+                remaining = due - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._pending[:self.batch]
+
+    def _run(self):
+        while True:
+            group = self._take()
+            if group is None:
+                break
+            try:
+                self._file.write(''.join(line for _, line in group).encode('utf8'))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                # Keep the events buffered; requests block once the buffer fills
+                print('audit log write failed:', e)
+                if self._closing:
+                    break
+                time.sleep(1)
+                continue
+            with self._cond:
+                del self._pending[:len(group)]
+                self._committed += len(group)
+                self.commits += 1
+                self.max_batch = max(self.max_batch, len(group))
+                self._cond.notify_all()
+            if self._file.tell() >= self.rotate_bytes or time.time() - self._opened >= self.rotate_seconds:
+                self._rotate()
+        self._file.close()
+
+    def _rotate(self):
+        self._file.close()
+        stamp = time.strftime(_STAMP, time.gmtime())
+        target, n = '%s.%s' % (self.path, stamp), 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            n += 1
+            target = '%s.%s-%d' % (self.path, stamp, n)
+        os.replace(self.path, target)
+        self._open()
+        self._compress_later(target)
+
+    def _compress_later(self, path: str):
+        thread = threading.Thread(target=_compress, args=(path,), name='audit-gzip', daemon=True)
+        self._compressors = [t for t in self._compressors if t.is_alive()] + [thread]
+        thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {'accepted': self._seq, 'committed': self._committed, 'buffered': len(self._pending),
+                    'commits': self.commits, 'max_batch': self.max_batch, 'blocked': self.blocked}
+
+    def close(self):
+        """Commit buffered events, stop the writer and finish pending compression."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        for thread in self._compressors:
+            thread.join()
+
+
+def _compress(path: str):
+    with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(path + '.gz.tmp', path + '.gz')
+    os.remove(path)
+
+
+def _rotated_key(path: str, name: str) -> Tuple[str, int]:
+    # ('YYYYmmddTHHMMSSZ', n) of a rotated file name
+    stamp, _, n = name[len(path) + 1:].split('.')[0].partition('-')
+    return stamp, int(n) if n.isdigit() else 1
+
+
+def _rotated_end(path: str, name: str) -> Optional[float]:
+    # UTC time a rotated file was closed, from its name; None if it is not a rotated file
+    try:
+        return float(calendar.timegm(time.strptime(_rotated_key(path, name)[0], _STAMP)))
+    except ValueError:
+        return None
+
+
+def log_files(path: str, since: float = None, until: float = None) -> List[str]:
+    """Rotated files (oldest first) then the active one, skipping files entirely outside [since, until]."""
+    rotated = [f for f in glob.glob(glob.escape(path) + '.*.gz') if _rotated_end(path, f) is not None]
+    files, start = [], None  # a file starts where the previous one ended
+    for name in sorted(rotated, key=lambda f: _rotated_key(path, f)):
+        end = _rotated_end(path, name)
+        if (since is None or end >= since) and (until is None or start is None or start <= until):
+            files.append(name)
+        start = end
+    if os.path.exists(path) and (until is None or start is None or start <= until):
+        files.append(path)
+    return files
+
+
+def iter_events(path: str, identities: Iterable[str] = None, since: float = None, until: float = None,
+                results: Iterable[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream events matching all given filters, oldest first, one file and line at a time.
+
+    `identities` are plain identities (hashed here); torn or unparsable lines are skipped.
+    """
+    hashes = {identity_hash(i) for i in identities} if identities else None
+    results = set(results) if results else None
+    for name in log_files(path, since, until):
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(name, 'rt', encoding='utf8', errors='replace') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if hashes is not None and event.get('id') not in hashes:
+                    continue
+                ts = event.get('ts', 0)
+                if (since is not None and ts < since) or (until is not None and ts > until):
+                    continue
+                if results is not None and event.get('result') not in results:
+                    continue
+                yield event
+
+
+__all__ = ['AuditLog', 'AuditUnavailable', 'identity_hash', 'iter_events', 'log_files', 'PKG_AUDIT_LOG',
+           'PKG_AUDIT_SYNC']
@@ -4,11 +4,17 @@ This module provides:
 - OTP generation and storage (in-memory for demo; use Redis in production).
 - Email sending via SMTP (supports debug SMTP server for local testing).
 - Rate limiting and expiry logic.
+- Coalescing of repeated requests: while an identity's OTP was requested less
+  than OTP_RESEND_WINDOW_SECONDS ago and is still usable, further requests
+  send nothing and keep that code valid; requests arriving while its email is
+  being sent wait for that send instead of starting another. `otp_counters`
+  counts accepted (new code, one email) and coalesced requests separately.
 
 Configuration via environment variables:
 - SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM_EMAIL
 - OTP_TTL_SECONDS (default 600 = 10 minutes)
 - OTP_MAX_ATTEMPTS (default 3)
+- OTP_RESEND_WINDOW_SECONDS (default 60; 0 sends a new code on every request)
 """
 from __future__ import annotations
 import os
@@ -16,10 +22,11 @@ import secrets
 import time
 import hashlib
 import hmac
-from smtplib import SMTP
-from email.message import EmailMessage
+import threading
 from typing import Optional
 
+from ibe import tracing
+
 # Configuration from env
 SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '1025'))
@@ -28,10 +35,24 @@ SMTP_PASS = os.environ.get('SMTP_PASS', '')
 SMTP_FROM_EMAIL = os.environ.get('SMTP_FROM_EMAIL', 'noreply@ibe-pkg.local')
 OTP_TTL_SECONDS = int(os.environ.get('OTP_TTL_SECONDS', '600'))
 OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', '3'))
+OTP_RESEND_WINDOW_SECONDS = float(os.environ.get('OTP_RESEND_WINDOW_SECONDS', '60'))
 
-# In-memory OTP store: {identity: {otp_hash, salt, expiry, attempts}}
+# In-memory OTP store: {identity: {otp_hash, salt, expiry, attempts, requested_at, sent}}
 # Production: use Redis or a DB with TTL
 otp_store = {}
+# accepted: new code generated and emailed; coalesced: answered by a pending code
+otp_counters = {'accepted': 0, 'coalesced': 0, 'send_failed': 0}
+_otp_lock = threading.Lock()
+# identity -> in-flight email send that concurrent requests wait on
+_sending = {}
+
+
+class _Send:
+    __slots__ = ('done', 'ok')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
 
 
 def generate_otp(length: int = 6) -> str:
@@ -39,29 +60,63 @@ def generate_otp(length: int = 6) -> str:
     return '{:0{}d}'.format(secrets.randbelow(10**length), length)
 
 
+@tracing.traced('otp.request')
 def request_otp(identity: str) -> bool:
     """Generate and email an OTP for the given identity.
     
     Returns True if OTP was sent successfully, False otherwise.
-    Stores hashed OTP in the otp_store with expiry.
+    Stores hashed OTP in the otp_store with expiry. Repeated requests within
+    the resend window reuse the pending OTP (and its in-flight send) instead.
     """
-    otp = generate_otp(6)
-    salt = secrets.token_bytes(16)
-    otp_hash = hashlib.sha256(salt + otp.encode('utf8')).hexdigest()
-    expiry = time.time() + OTP_TTL_SECONDS
-    otp_store[identity] = {
-        'otp_hash': otp_hash,
-        'salt': salt.hex(),
-        'expiry': expiry,
-        'attempts': 0
-    }
+    with _otp_lock:
+        now = time.time()
+        inflight = _sending.get(identity)
+        rec = otp_store.get(identity)
+        if inflight is None and not _coalescible(rec, now):
+            otp = generate_otp(6)
+            salt = secrets.token_bytes(16)
+            otp_hash = hashlib.sha256(salt + otp.encode('utf8')).hexdigest()
+            expiry = now + OTP_TTL_SECONDS
+            rec = otp_store[identity] = {
+                'otp_hash': otp_hash,
+                'salt': salt.hex(),
+                'expiry': expiry,
+                'attempts': 0,
+                'requested_at': now,
+                'sent': False
+            }
+            send = _sending[identity] = _Send()
+            otp_counters['accepted'] += 1
+        else:
+            otp_counters['coalesced'] += 1
+            send = None
+    if send is None:
+        span = tracing.current_span()
+        if span is not None:
+            span.set(coalesced=True)
+        if inflight is not None:
+            inflight.done.wait()
+            return inflight.ok
+        return True
     # Send email
     try:
         send_otp_email(identity, otp)
-        return True
+        send.ok = True
     except Exception as e:
         print(f'Failed to send OTP email to {identity}: {e}')
-        return False
+    with _otp_lock:
+        rec['sent'] = send.ok
+        if not send.ok:
+            otp_counters['send_failed'] += 1
+        del _sending[identity]
+    send.done.set()
+    return send.ok
+
+
+def _coalescible(rec: Optional[dict], now: float) -> bool:
+    # A pending code is reused while it was sent recently and can still be entered
+    return bool(rec) and rec.get('sent', False) and now < rec.get('requested_at', 0) + OTP_RESEND_WINDOW_SECONDS \
+        and now <= rec['expiry'] and rec['attempts'] < OTP_MAX_ATTEMPTS
 
 
 def verify_otp(identity: str, otp: str) -> Optional[str]:
@@ -88,8 +143,12 @@ def verify_otp(identity: str, otp: str) -> Optional[str]:
     return None
 
 
+@tracing.traced('otp.send_email')
 def send_otp_email(to_email: str, otp: str):
     """Send an OTP via email using configured SMTP server."""
+    # Deferred: smtplib pulls in ssl and the email package, which PKG startup does not need
+    from smtplib import SMTP
+    from email.message import EmailMessage
     msg = EmailMessage()
     msg['Subject'] = 'Your IBE PKG verification code'
     msg['From'] = SMTP_FROM_EMAIL
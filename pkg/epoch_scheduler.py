@@ -0,0 +1,151 @@
+"""Background precomputation of next-epoch keys (see `ibe/epochs.py`).
+
+Without it, every active user extracts a new key in the first minutes of
+an epoch: an extract storm at the boundary. The scheduler issues those keys
+ahead of time instead. Within `lead` of the next boundary, and only during
+off-peak hours if configured, it takes the identities active in the current
+or previous epoch that have no next-epoch key yet. It generates their
+keypairs in batches on a pool of worker processes running at the lowest
+CPU priority (`nice 19`), and stores them with `DemoIBE.add_epoch_keys`. When
+users extract at the boundary, the key is already there. Each pass also
+garbage-collects epochs past the retention window and reports them to
+`on_gc` (the server drops its cached responses for them).
+
+DemoIBE keys are random rather than derived from the MSK, so the workers
+only need the batch size. A real IBE backend would send the identities and
+derive each key there.
+
+Configuration via environment variables:
+- PKG_EPOCH_PRECOMPUTE (default 0) — run the scheduler inside `pkg/server.py`
+- PKG_EPOCH_LEAD_HOURS (default 72) — how long before the boundary to start
+- PKG_EPOCH_OFFPEAK_HOURS (e.g. `1-5`, local time; default: any hour)
+- PKG_EPOCH_WORKERS (default: CPUs - 1, at least 1), PKG_EPOCH_BATCH (default 1000)
+- PKG_EPOCH_INTERVAL_SECONDS (default 600) — time between passes
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ibe.epochs import epoch_index, epoch_label, epoch_start, generate_keypair, next_epoch
+
+PKG_EPOCH_PRECOMPUTE = os.environ.get('PKG_EPOCH_PRECOMPUTE', '0') in ('1', 'true', 'yes')
+PKG_EPOCH_LEAD_HOURS = float(os.environ.get('PKG_EPOCH_LEAD_HOURS', '72'))
+PKG_EPOCH_OFFPEAK_HOURS = os.environ.get('PKG_EPOCH_OFFPEAK_HOURS', '')
+PKG_EPOCH_WORKERS = int(os.environ.get('PKG_EPOCH_WORKERS', '0')) or max(1, (os.cpu_count() or 2) - 1)
+PKG_EPOCH_BATCH = int(os.environ.get('PKG_EPOCH_BATCH', '1000'))
+PKG_EPOCH_INTERVAL_SECONDS = float(os.environ.get('PKG_EPOCH_INTERVAL_SECONDS', '600'))
+
+
+def _low_priority():
+    # Worker initializer: leave the CPU to request handling
+    if hasattr(os, 'nice'):
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+
+
+def _generate(count: int) -> List[Tuple[bytes, bytes]]:
+    return [generate_keypair() for _ in range(count)]
+
+
+def parse_hours(spec: str) -> Optional[Tuple[int, int]]:
+    """`'1-5'` -> (1, 5): hours 1:00 to 5:59. Ranges may wrap midnight (`'22-4'`)."""
+    if not spec.strip():
+        return None
+    start, _, end = spec.partition('-')
+    return int(start), int(end or start)
+
+
+class EpochScheduler:
+    """Precomputes next-epoch keys for active identities of a DemoIBE.
+
+    Usage:
+        sched = EpochScheduler(pkg)
+        sched.start()          # background thread, one pass per interval
+        sched.run_once()       # or drive it yourself
+    """
+
+    def __init__(self, pkg, lead: float = None, offpeak: str = None, workers: int = None, batch: int = None,
+                 interval: float = None, clock: Callable[[], float] = time.time,
+                 on_gc: Optional[Callable[[List[str]], Any]] = None):
+        self.pkg = pkg
+        self.on_gc = on_gc
+        self.lead = PKG_EPOCH_LEAD_HOURS * 3600 if lead is None else lead
+        self.offpeak = parse_hours(PKG_EPOCH_OFFPEAK_HOURS if offpeak is None else offpeak)
+        self.workers = workers or PKG_EPOCH_WORKERS
+        self.batch = batch or PKG_EPOCH_BATCH
+        self.interval = PKG_EPOCH_INTERVAL_SECONDS if interval is None else interval
+        self._clock = clock
+        self._executor = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.precomputed = 0
+
+    def _off_peak(self, now: float) -> bool:
+        if self.offpeak is None:
+            return True
+        hour = time.localtime(now).tm_hour
+        start, end = self.offpeak
+        return start <= hour <= end if start <= end else hour >= start or hour <= end
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_low_priority)
+        return self._executor
+
+    def pending(self, epoch: str) -> List[str]:
+        """Identities active in the two epochs before `epoch` that have no key for it yet."""
+        epochs = self.pkg.epochs
+        at = epoch_index(epoch, epochs.period)
+        active = {}
+        for prev in (epoch_label(at - 2, epochs.period), epoch_label(at - 1, epochs.period)):
+            active.update(dict.fromkeys(epochs.identities(prev)))
+        return [i for i in active if epochs.get(i, epoch)[0] is None]
+
+    def run_once(self) -> Dict[str, Any]:
+        """One pass: precompute if the next boundary is near (and off-peak), then GC old epochs."""
+        now = self._clock()
+        epochs = self.pkg.epochs
+        upcoming = next_epoch(epochs.current(), epochs.period)
+        result = {'epoch': upcoming, 'precomputed': 0, 'removed': epochs.gc()}
+        if result['removed'] and self.on_gc is not None:
+            self.on_gc(result['removed'])
+        if epoch_start(upcoming, epochs.period) - now > self.lead or not self._off_peak(now):
+            return result
+        pending = self.pending(upcoming)
+        chunks = [pending[i:i + self.batch] for i in range(0, len(pending), self.batch)]
+        for chunk, keys in zip(chunks, self._pool().map(_generate, map(len, chunks))):
+            if self._stop.is_set():
+                break
+            added = self.pkg.add_epoch_keys(upcoming, ((i, pub, priv) for i, (pub, priv) in zip(chunk, keys)))
+            result['precomputed'] += len(added)
+        self.precomputed += result['precomputed']
+        return result
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:  # keep the scheduler alive; the next pass retries
+                print('epoch precomputation failed:', e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='epoch-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+__all__ = ['EpochScheduler', 'parse_hours', 'PKG_EPOCH_PRECOMPUTE']
@@ -0,0 +1,177 @@
+"""In-process background job queue for large encrypt/decrypt requests.
+
+Large payloads are handed to a small worker pool instead of being processed
+inline in the HTTP request. Each job reports coarse progress that callers can
+follow (the web interface streams it as Server-Sent Events). Results can
+hold plaintexts and private keys, so they are dropped as soon as the client
+has fetched them, and finished jobs are purged once they expire, also on an
+idle server.
+
+Configuration via environment variables:
+- JOB_WORKERS (default 2)
+- JOB_RESULT_TTL_SECONDS (default 600)
+"""
+from __future__ import annotations
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_RESULT_TTL_SECONDS = int(os.environ.get('JOB_RESULT_TTL_SECONDS', '600'))
+
+
+class Job:
+    """State of one submitted job. Updated by the worker, read by request threads."""
+
+    def __init__(self, job_id: str, kind: str, owner: Optional[str] = None):
+        self.id = job_id
+        self.kind = kind
+        self.owner = owner
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result: Optional[bytes] = None
+        self.content_type = 'application/octet-stream'
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.fetched = False
+        self.version = 0
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def _update(self, **fields):
+        with self._cond:
+            for k, v in fields.items():
+                setattr(self, k, v)
+            self.version += 1
+            self._cond.notify_all()
+
+    def report(self, progress: float, stage: str):
+        """Progress callback handed to job functions."""
+        self._update(progress=max(0.0, min(1.0, progress)), stage=stage)
+
+    def take_result(self) -> Tuple[Optional[bytes], str]:
+        """Hand out the result once: (result, content_type), then (None, ...) after the first call."""
+        with self._cond:
+            result, self.result = self.result, None
+            if result is not None:
+                self.fetched = True
+                self.version += 1
+                self._cond.notify_all()
+            return result, self.content_type
+
+    def wait_for_change(self, seen_version: int, timeout: float) -> int:
+        """Block until the job changes past `seen_version` or `timeout` elapses."""
+        with self._cond:
+            if self.version == seen_version and not self.done:
+                self._cond.wait(timeout)
+            return self.version
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'result_size': len(self.result) if self.result is not None else None,
+            'fetched': self.fetched,
+        }
+
+
+class JobQueue:
+    """Runs job functions on a bounded thread pool and tracks their state.
+
+    A job function is called as `fn(job, *args)`; it may call
+    `job.report(fraction, stage)` and must return `(result_bytes, content_type)`.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, result_ttl: float = JOB_RESULT_TTL_SECONDS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ibe-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.result_ttl = result_ttl
+        self._stop = threading.Event()
+        # Expired results are purged on a timer too, so an idle server does not keep them
+        threading.Thread(target=self._reap, name='ibe-job-reaper', daemon=True).start()
+
+    def _reap(self):
+        while not self._stop.wait(max(1.0, min(self.result_ttl, 60.0))):
+            self.purge_expired()
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, owner: Optional[str] = None) -> Job:
+        self.purge_expired()
+        job = Job(secrets.token_urlsafe(16), kind, owner)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple):
+        job._update(status='running', stage='running')
+        try:
+            result, content_type = fn(job, *args)
+        except Exception as e:
+            job._update(status='failed', stage='failed', error=str(e), finished=time.time())
+            return
+        job._update(status='done', stage='done', progress=1.0, result=result,
+                    content_type=content_type, finished=time.time())
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        self.purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (job.owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def events(self, job: Job, heartbeat: float = 15.0) -> Iterator[Dict[str, Any]]:
+        """Yield a state snapshot whenever the job changes, ending once it is finished."""
+        seen = -1
+        while True:
+            version = job.wait_for_change(seen, heartbeat)
+            if version != seen:
+                seen = version
+                yield job.to_dict()
+                if job.done:
+                    return
+            else:
+                yield {}  # heartbeat keeps idle connections open
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            doomed = [jid for jid, j in self._jobs.items() if j.finished is not None and j.finished < cutoff]
+            for jid in doomed:
+                del self._jobs[jid]
+        return len(doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        for j in jobs:
+            counts[j.status] += 1
+        return counts
+
+    def close(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_chunks(data: bytes, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield `data` in fixed-size slices for streamed downloads."""
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_size):
+        yield bytes(view[i:i + chunk_size])
+
+
+__all__ = ['Job', 'JobQueue', 'iter_chunks']
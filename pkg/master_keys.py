@@ -0,0 +1,116 @@
+"""Sealed on-disk persistence of the PKG master keys (MPK/MSK).
+
+Without it, every boot calls `setup()`: new master keys, and for DemoIBE a
+rewrite of the whole keystore to record the new MPK. With a sealing secret
+configured, the first boot seals the keys from `setup()` into a small file
+and later boots unseal them instead. Startup then no longer depends on the
+keystore size, which (with `DemoIBE(lazy=True)`) is opened in the background
+or on first use.
+
+The file holds JSON with a ChaCha20-Poly1305 ciphertext of {"mpk", "msk"}.
+The sealing key is either PKG_MASTER_SEAL_KEY (32 bytes, hex) directly, or
+derived from PKG_MASTER_PASSPHRASE with scrypt (salt stored in the file).
+Without either secret nothing is persisted and `setup()` runs on every boot,
+as before. Backends must implement `restore_master(mpk, msk)` to be restored
+(DemoIBE does); others fall back to `setup()`.
+
+Configuration via environment variables:
+- PKG_MASTER_KEY_PATH — sealed file (default: the keystore path with `.master`)
+- PKG_MASTER_SEAL_KEY — 64 hex characters
+- PKG_MASTER_PASSPHRASE — used when PKG_MASTER_SEAL_KEY is not set
+"""
+from __future__ import annotations
+import base64
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+PKG_MASTER_KEY_PATH = os.environ.get('PKG_MASTER_KEY_PATH') or None
+PKG_MASTER_SEAL_KEY = os.environ.get('PKG_MASTER_SEAL_KEY', '')
+PKG_MASTER_PASSPHRASE = os.environ.get('PKG_MASTER_PASSPHRASE', '')
+
+_AAD = b'ibe-pkg-master-keys-v1'
+_SCRYPT = {'n': 2**15, 'r': 8, 'p': 1}
+
+
+class SealError(Exception):
+    """The sealed file is corrupt or was sealed with a different secret."""
+
+
+def _seal_key(secret: Dict[str, str], salt: bytes) -> bytes:
+    if secret.get('key'):
+        key = bytes.fromhex(secret['key'])
+        if len(key) != 32:
+            raise ValueError('PKG_MASTER_SEAL_KEY must be 32 bytes (64 hex characters)')
+        return key
+    # Deferred: only passphrase sealing needs the KDF
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+    return Scrypt(salt=salt, length=32, **_SCRYPT).derive(secret['passphrase'].encode('utf8'))
+
+
+def default_secret() -> Optional[Dict[str, str]]:
+    """Sealing secret from the environment, or None when persistence is off."""
+    if PKG_MASTER_SEAL_KEY:
+        return {'key': PKG_MASTER_SEAL_KEY}
+    if PKG_MASTER_PASSPHRASE:
+        return {'passphrase': PKG_MASTER_PASSPHRASE}
+    return None
+
+
+def seal(path: str, mpk: Dict[str, Any], msk: bytes, secret: Dict[str, str]):
+    """Write `mpk`/`msk` sealed under `secret` to `path` (atomically, mode 0600)."""
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    salt, nonce = os.urandom(16), os.urandom(12)
+    plain = json.dumps({'mpk': mpk, 'msk': base64.b64encode(msk).decode('ascii')}).encode('utf8')
+    ct = ChaCha20Poly1305(_seal_key(secret, salt)).encrypt(nonce, plain, _AAD)
+    doc = {'version': 1, 'kdf': 'raw' if secret.get('key') else 'scrypt',
+           'salt': salt.hex(), 'nonce': nonce.hex(), 'ct': base64.b64encode(ct).decode('ascii')}
+    tmp = path + '.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf8') as f:
+        json.dump(doc, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def unseal(path: str, secret: Dict[str, str]) -> Tuple[Dict[str, Any], bytes]:
+    """Read (mpk, msk) from a file written by `seal`; raises SealError if it cannot be opened."""
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    with open(path, 'r', encoding='utf8') as f:
+        doc = json.load(f)
+    if doc.get('version') != 1 or doc.get('kdf') != ('raw' if secret.get('key') else 'scrypt'):
+        raise SealError('%s: unsupported format or sealing method' % path)
+    try:
+        key = _seal_key(secret, bytes.fromhex(doc['salt']))
+        plain = ChaCha20Poly1305(key).decrypt(bytes.fromhex(doc['nonce']), base64.b64decode(doc['ct']), _AAD)
+    except (InvalidTag, KeyError, ValueError) as e:
+        raise SealError('%s: cannot unseal master keys (wrong secret or corrupt file)' % path) from e
+    keys = json.loads(plain)
+    return keys['mpk'], base64.b64decode(keys['msk'])
+
+
+def master_key_path(store_path: str) -> str:
+    return PKG_MASTER_KEY_PATH or os.path.splitext(store_path)[0] + '.master'
+
+
+def load_or_setup(backend, path: Optional[str], secret: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], bytes]:
+    """Master keys for `backend`: unsealed from `path` if present, else from `setup()` (then sealed).
+
+    Returns (mpk, msk). With no secret (and none in the environment), or a
+    backend without `restore_master`, this is just `backend.setup()`.
+    """
+    secret = secret or default_secret()
+    if secret is None or path is None or not hasattr(backend, 'restore_master'):
+        return backend.setup()
+    if os.path.exists(path):
+        mpk, msk = unseal(path, secret)
+        backend.restore_master(mpk, msk)
+        return mpk, msk
+    mpk, msk = backend.setup()
+    seal(path, mpk, msk, secret)
+    return mpk, msk
+
+
+__all__ = ['load_or_setup', 'seal', 'unseal', 'master_key_path', 'default_secret', 'SealError']
@@ -0,0 +1,347 @@
+"""Router for a sharded PKG: identities partitioned across nodes by consistent hashing.
+
+Each node is an ordinary `pkg/server.py` process with its own keystore
+(PKG_STORE_PATH). The router owns no keys. It hashes the canonical identity
+onto a ring of virtual nodes and forwards:
+
+- GET /get_pubkey, POST /request_extract_code, POST /extract — to the owning node,
+- POST /get_pubkeys — split by owner, sent to the nodes concurrently, merged,
+- GET /mpk — to the first node (DemoIBE's MPK is per node and informational).
+
+Adding a node moves only the identities whose ring position now falls on it,
+about 1/(N+1) of them. `add_node` copies their keypairs from the old owners
+through the nodes' admin endpoints, so already-issued keys stay the same
+(epoch keys included: each retained epoch's feed is walked too);
+`remove_node` hands a node's identities to their new owners the same way.
+Both need the nodes' PKG_ADMIN_TOKEN.
+
+While keys move, the router answers 503 (with Retry-After) to
+/request_extract_code and /extract for the moving identities, so neither the
+old nor the new owner issues a key the copy would miss. If a new owner still
+holds a different key for a moved identity (issued by another path), the
+migration raises `MigrationConflict` and the ring is left unchanged.
+Membership changes are serialized, so two /admin/nodes calls never rebalance
+at once; removing a node that is not in the ring answers 404, and a node
+failing during the migration answers 502.
+
+Configuration via environment variables:
+- PKG_SHARDS — comma-separated node URLs (for `python -m pkg.router`)
+- PKG_RING_VNODES (default 128) — virtual nodes per node
+- PKG_ADMIN_TOKEN — sent to nodes' /admin endpoints and required by the router's /admin/nodes
+- PKG_ROUTER_PORT (default 5000)
+
+Usage:
+    PKG_SHARDS=http://127.0.0.1:5001,http://127.0.0.1:5002 python -m pkg.router
+"""
+from __future__ import annotations
+import bisect
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from flask import Flask, Response, jsonify, request
+
+from clients.pkg_client import PKGClient, PKGError
+from ibe.crypto_iface import canonicalize_identity, canonicalize_many
+
+PKG_RING_VNODES = int(os.environ.get('PKG_RING_VNODES', '128'))
+PKG_ADMIN_TOKEN = os.environ.get('PKG_ADMIN_TOKEN', '')
+_FORWARD_HEADERS = ('ETag', 'Cache-Control', 'Retry-After')
+_MIGRATE_CHUNK = 500
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with `vnodes` points per node.
+
+    Usage:
+        ring = HashRing(['http://a', 'http://b'])
+        ring.node_for('alice@example.com')
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = None):
+        self.vnodes = vnodes or PKG_RING_VNODES
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            p = _point('%s#%d' % (node, i))
+            at = bisect.bisect(self._points, p)
+            self._points.insert(at, p)
+            self._owners.insert(at, node)
+
+    def remove(self, node: str):
+        self.nodes.remove(node)
+        keep = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in keep]
+        self._owners = [o for _, o in keep]
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing(vnodes=self.vnodes)
+        ring.nodes, ring._points, ring._owners = list(self.nodes), list(self._points), list(self._owners)
+        return ring
+
+    def node_for(self, identity: str) -> str:
+        """Owner of a canonical identity: the first ring point clockwise of its hash."""
+        if not self._points:
+            raise LookupError('hash ring has no nodes')
+        at = bisect.bisect(self._points, _point(identity))
+        return self._owners[at % len(self._owners)]
+
+
+class MigrationConflict(RuntimeError):
+    """A node already holds a different key for identities being moved to it."""
+
+    def __init__(self, node: str, identities: List[str]):
+        super().__init__('%s already holds different keys for %d identities (e.g. %s)'
+                         % (node, len(identities), identities[0]))
+        self.node = node
+        self.identities = identities
+
+
+class UnknownNode(LookupError):
+    """`remove_node` was given a node that is not in the ring."""
+
+
+class ShardRouter:
+    """Routes PKG requests to the node owning each identity."""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = None, admin_token: str = None, **client_kwargs):
+        self.ring = HashRing((n.rstrip('/') for n in nodes), vnodes)
+        self._pending: Optional[HashRing] = None
+        self.admin_token = PKG_ADMIN_TOKEN if admin_token is None else admin_token
+        self._client_kwargs = client_kwargs
+        self._clients: Dict[str, PKGClient] = {}
+        self._lock = threading.Lock()
+        self._membership = threading.Lock()  # held across a whole add_node/remove_node
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='pkg-router')
+
+    def client(self, node: str) -> PKGClient:
+        with self._lock:
+            c = self._clients.get(node)
+            if c is None:
+                c = self._clients[node] = PKGClient(node, **self._client_kwargs)
+            return c
+
+    def node_for(self, identity: str) -> str:
+        return self.ring.node_for(identity)
+
+    def moving(self, identity: str) -> bool:
+        """True while a membership change is copying `identity` to a new owner."""
+        pending = self._pending
+        return pending is not None and pending.node_for(identity) != self.ring.node_for(identity)
+
+    def lookup_many(self, identities: Iterable[str]) -> Dict[str, str]:
+        """Fan a batch lookup out to the owning nodes; returns {identity: pub_b64}."""
+        groups: Dict[str, List[str]] = {}
+        for identity in dict.fromkeys(canonicalize_many(identities)):
+            groups.setdefault(self.node_for(identity), []).append(identity)
+
+        def fetch(item):
+            node, idents = item
+            r = self.client(node)._request('POST', '/get_pubkeys', json={'identities': idents})
+            if r.status_code != 200:
+                raise PKGError(r.status_code, r.text)
+            return r.json()['pubkeys']
+        out: Dict[str, str] = {}
+        for part in self._executor.map(fetch, groups.items()):
+            out.update(part)
+        return out
+
+    # -- membership ----------------------------------------------------------
+
+    def _admin(self, node: str, path: str, payload: dict) -> dict:
+        r = self.client(node)._request('POST', path, json=payload, retries=0,
+                                       headers={'X-PKG-Admin-Token': self.admin_token})
+        if r.status_code != 200:
+            raise PKGError(r.status_code, r.text)
+        return r.json()
+
+    def _feed(self, node: str, epoch: str = None) -> Iterable[dict]:
+        since = 0
+        while True:
+            page = self.client(node).get_changes(since, epoch=epoch)
+            yield page
+            since = page['next']
+            if not page['more']:
+                return
+
+    def _identities(self, node: str) -> Iterable[str]:
+        # The main feed, then each retained epoch's feed (epoch keys are numbered per epoch)
+        epochs = []
+        for page in self._feed(node):
+            epochs = page.get('epochs', epochs)
+            for change in page['changes']:
+                yield change['identity']
+        for epoch in epochs:
+            for page in self._feed(node, epoch):
+                for change in page['changes']:
+                    yield change['identity']
+
+    def _migrate(self, source: str, ring: HashRing) -> int:
+        # Copy the keypairs `source` holds but no longer owns under `ring` to their new owners
+        moving: Dict[str, List[str]] = {}
+        for identity in self._identities(source):
+            owner = ring.node_for(identity)
+            if owner != source:
+                moving.setdefault(owner, []).append(identity)
+        moved = 0
+        for dest, idents in moving.items():
+            for i in range(0, len(idents), _MIGRATE_CHUNK):
+                keys = self._admin(source, '/admin/export_keys', {'identities': idents[i:i + _MIGRATE_CHUNK]})['keys']
+                result = self._admin(dest, '/admin/import_keys', {'keys': keys})
+                if result.get('conflicts'):
+                    raise MigrationConflict(dest, result['conflicts'])
+                moved += result['imported']
+        return moved
+
+    def _rebalance(self, ring: HashRing, sources: List[str]) -> int:
+        # Extracts of moving identities are refused until the new ring is in place
+        self._pending = ring
+        try:
+            moved = sum(self._migrate(src, ring) for src in sources)
+            # Second pass for keys from extracts that were already in flight when the first began
+            moved += sum(self._migrate(src, ring) for src in sources)
+            self.ring = ring
+            return moved
+        finally:
+            self._pending = None
+
+    def add_node(self, node: str) -> int:
+        """Add `node` to the ring, first copying over the identities it takes over. Returns how many moved."""
+        node = node.rstrip('/')
+        with self._membership:
+            ring = self.ring.copy()
+            ring.add(node)
+            return self._rebalance(ring, list(self.ring.nodes))
+
+    def remove_node(self, node: str) -> int:
+        """Hand `node`'s identities to their new owners, then drop it from the ring."""
+        node = node.rstrip('/')
+        with self._membership:
+            if node not in self.ring.nodes:
+                raise UnknownNode(node)
+            ring = self.ring.copy()
+            ring.remove(node)
+            return self._rebalance(ring, [node])
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for c in self._clients.values():
+            c.close()
+
+
+def _relay(r) -> Response:
+    headers = {k: r.headers[k] for k in _FORWARD_HEADERS if k in r.headers}
+    return Response(r.content, status=r.status_code, headers=headers,
+                    content_type=r.headers.get('Content-Type', 'application/json'))
+
+
+def create_app(router: ShardRouter) -> Flask:
+    app = Flask(__name__)
+
+    def forward(node: str, method: str, path: str, **kwargs):
+        # POSTs are not retried: /extract consumes the OTP on the node
+        retries = None if method == 'GET' else 0
+        try:
+            return _relay(router.client(node)._request(method, path, retries=retries, **kwargs))
+        except OSError as e:  # requests' connection errors and timeouts
+            return jsonify({"error": "shard unavailable", "detail": str(e)}), 502
+
+    def owner_request(method: str, path: str, identity: str, **kwargs):
+        return forward(router.node_for(identity), method, path, **kwargs)
+
+    @app.route('/mpk', methods=['GET'])
+    def get_mpk():
+        return forward(router.ring.nodes[0], 'GET', '/mpk')
+
+    @app.route('/get_pubkey', methods=['GET'])
+    def get_pubkey():
+        identity = canonicalize_identity(request.args.get('identity', ''))
+        if not identity:
+            return jsonify({"error": "missing identity"}), 400
+        headers = {'If-None-Match': request.headers['If-None-Match']} if 'If-None-Match' in request.headers else {}
+        return owner_request('GET', '/get_pubkey', identity, params={'identity': identity}, headers=headers)
+
+    @app.route('/get_pubkeys', methods=['POST'])
+    def get_pubkeys():
+        identities = request.get_json(force=True).get('identities')
+        if not isinstance(identities, list) or not identities:
+            return jsonify({"error": "missing identities"}), 400
+        canonical = canonicalize_many(str(i) for i in identities)
+        try:
+            pubkeys = router.lookup_many(canonical)
+        except (PKGError, OSError) as e:
+            return jsonify({"error": "shard unavailable", "detail": str(e)}), 502
+        return jsonify({"pubkeys": pubkeys, "unknown": [i for i in dict.fromkeys(canonical) if i not in pubkeys]})
+
+    def forward_identity_post(path: str):
+        data = request.get_json(force=True)
+        identity = canonicalize_identity(str(data.get('identity', '')))
+        if not identity:
+            return jsonify({"error": "missing identity"}), 400
+        if router.moving(identity):
+            return jsonify({"error": "identity is being moved between shards"}), 503, {'Retry-After': '1'}
+        return owner_request('POST', path, identity, json=data)
+
+    @app.route('/request_extract_code', methods=['POST'])
+    def request_extract_code():
+        return forward_identity_post('/request_extract_code')
+
+    @app.route('/extract', methods=['POST'])
+    def extract():
+        return forward_identity_post('/extract')
+
+    @app.route('/shards', methods=['GET'])
+    def shards():
+        return jsonify({"nodes": router.ring.nodes, "vnodes": router.ring.vnodes})
+
+    @app.route('/admin/nodes', methods=['POST', 'DELETE'])
+    def admin_nodes():
+        if not router.admin_token or not hmac.compare_digest(
+                request.headers.get('X-PKG-Admin-Token', ''), router.admin_token):
+            return jsonify({"error": "forbidden"}), 403
+        node = str(request.get_json(force=True).get('url', ''))
+        if not node:
+            return jsonify({"error": "missing url"}), 400
+        try:
+            moved = router.add_node(node) if request.method == 'POST' else router.remove_node(node)
+        except UnknownNode:
+            return jsonify({"error": "node is not in the ring", "url": node}), 404
+        except MigrationConflict as e:
+            return jsonify({"error": str(e), "node": e.node, "conflicts": e.identities}), 409
+        except (PKGError, OSError) as e:
+            return jsonify({"error": "migration failed", "detail": str(e)}), 502
+        return jsonify({"nodes": router.ring.nodes, "moved": moved})
+
+    return app
+
+
+__all__ = ['HashRing', 'MigrationConflict', 'ShardRouter', 'UnknownNode', 'create_app']
+
+
+def main():
+    nodes = [n for n in os.environ.get('PKG_SHARDS', '').split(',') if n.strip()]
+    if not nodes:
+        raise SystemExit('set PKG_SHARDS to a comma-separated list of PKG node URLs')
+    port = int(os.environ.get('PKG_ROUTER_PORT', '5000'))
+    print('Starting PKG router on http://127.0.0.1:%d for %d nodes' % (port, len(nodes)))
+    create_app(ShardRouter(nodes)).run(port=port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
+
@@ -3,21 +3,72 @@
 Endpoints:
 - GET /mpk -> returns MPK JSON
 - GET /get_pubkey?identity=... -> returns public key for identity (base64)
+    Both are served from pre-serialized bodies with strong ETags and
+    Cache-Control, and answer `If-None-Match` revalidation with 304
+- POST /get_pubkeys -> body: {"identities": [...]}
+    batch lookup; returns {"pubkeys": {identity: pub_b64}, "unknown": [...]}
+- GET /pubkeys/changes?since=N&limit=M -> public-key changes with sequence
+    number > N (paged); used by client-side replicas to sync incrementally.
+    Epoch keys are numbered per epoch: the response lists the retained
+    `epochs`, and `&epoch=E` pages through one of them
+- GET /pubkeys/filter -> Bloom filter of all known identities (binary, see
+    `ibe/bloom.py`) so clients can rule out unknown recipients locally
 - POST /request_extract_code -> body: {"identity": "alice@example.com"}
     sends OTP to email; returns 202 Accepted
 - POST /extract -> body: {"identity": "alice@example.com", "otp": "123456"}
-    verifies OTP and returns private_key (base64) on success
+    verifies OTP and returns private_key (base64) on success. Epoch identities
+    (`alice@example.com|202611`, see `ibe/epochs.py`) use the OTP of the
+    address; epochs the PKG does not issue get 400
+- POST /admin/export_keys, POST /admin/import_keys -> move keypairs between
+    shards (see `pkg/router.py`); import reports identities already holding a
+    different key as "conflicts". Only enabled when PKG_ADMIN_TOKEN is set and
+    callers send it in `X-PKG-Admin-Token`
+
+Requests pass through per-route-class admission control (`pkg/admission.py`):
+when a class is overloaded the PKG answers 503 with `Retry-After` instead of
+queueing without bound.
+
+Every request is traced as a span that continues the caller's `traceparent`
+header (see `ibe/tracing.py`; off unless IBE_TRACE is set).
+
+With PKG_TENANTS_DIR set, one process serves many domains, each with its own
+keystore, MPK and MSK (see `pkg/tenants.py`); `/mpk`, `/pubkeys/changes` and
+`/pubkeys/filter` then take `?domain=`.
+
+With PKG_SNAPSHOT set, the keystore starts from an `ibe/snapshot.py` file,
+either restored into the store or memory-mapped in place (PKG_SNAPSHOT_MODE).
+
+With PKG_EPOCH_PRECOMPUTE set, next-epoch keys of active identities are
+generated ahead of the boundary (see `pkg/epoch_scheduler.py`).
+
+With PKG_AUDIT_LOG set, every `/extract` outcome is appended to a
+group-committed audit log (see `pkg/audit.py`); if the log cannot take the
+event, `/extract` answers 503 instead of issuing the key.
 
 For demo purposes this uses the DemoIBE implementation in `ibe/crypto_iface.py`.
 Email OTP authentication is provided by `pkg/auth_otp.py`.
 """
 from __future__ import annotations
 import os
+import atexit
+import hashlib
+import hmac
 import json
-from flask import Flask, request, jsonify
+import threading
+from contextlib import nullcontext
+from flask import Flask, Response, g, request, jsonify
 
-from ibe.crypto_iface import DemoIBE, b64, canonicalize_identity
+from ibe import tracing
+from ibe.cache import LRUTTLCache
+from ibe.crypto_iface import DemoIBE, b64, canonicalize_identity, canonicalize_many
+from ibe.epochs import EpochError, is_epoch_label, split_epoch
+from ibe.snapshot import Snapshot
+from pkg.admission import PKG_ADMISSION, AdmissionController, Overloaded, route_class
+from pkg.audit import PKG_AUDIT_LOG, PKG_AUDIT_SYNC, AuditLog, AuditUnavailable
 from pkg.auth_otp import request_otp, verify_otp
+from pkg.epoch_scheduler import PKG_EPOCH_PRECOMPUTE, EpochScheduler
+from pkg.master_keys import default_secret, load_or_setup, master_key_path
+from pkg.tenants import PKG_TENANTS_DIR, Tenant, TenantRegistry, UnknownTenant, canonical_domain, domain_of
 import os
 # Optionally use charm-crypto backend if requested
 use_charm = os.environ.get('USE_CHARM') in ('1', 'true', 'yes')
@@ -33,48 +84,378 @@ if use_charm:
         print('Failed to import charm backend; falling back to DemoIBE:', _)
 
 app = Flask(__name__)
-if CharmBackend:
+MAX_BATCH_LOOKUP = int(os.environ.get('PKG_MAX_BATCH_LOOKUP', '1000'))
+MAX_CHANGES_PAGE = int(os.environ.get('PKG_MAX_CHANGES_PAGE', '5000'))
+# HTTP caching of the read endpoints (seconds clients/proxies may reuse a response)
+MPK_MAX_AGE = int(os.environ.get('PKG_MPK_MAX_AGE', '86400'))
+PUBKEY_MAX_AGE = int(os.environ.get('PKG_PUBKEY_MAX_AGE', '3600'))
+PUBKEY_CACHE_SIZE = int(os.environ.get('PKG_PUBKEY_CACHE_SIZE', '65536'))
+# Keystore file (default: pkg_data.json next to the code); one per node when sharded
+STORE_PATH = os.environ.get('PKG_STORE_PATH') or None
+ADMIN_TOKEN = os.environ.get('PKG_ADMIN_TOKEN', '')
+# Keystore snapshot (ibe.snapshot) to start from: 'load' restores it into an empty
+# keystore, 'mmap' serves it in place as a read-only base layer
+SNAPSHOT = os.environ.get('PKG_SNAPSHOT') or None
+SNAPSHOT_MODE = os.environ.get('PKG_SNAPSHOT_MODE', 'load')
+# Check an mmap snapshot's checksums before serving it ('load' always checks)
+SNAPSHOT_VERIFY = os.environ.get('PKG_SNAPSHOT_VERIFY', '1') not in ('0', 'false', 'no')
+# Open the keystore in the background after boot instead of before serving (requests needing it wait)
+LAZY_KEYSTORE = os.environ.get('PKG_LAZY_KEYSTORE', '1') not in ('0', 'false', 'no')
+
+
+def _demo_backend() -> DemoIBE:
+    if SNAPSHOT and SNAPSHOT_MODE == 'mmap':
+        if SNAPSHOT_VERIFY:
+            with Snapshot(SNAPSHOT, use_mmap=True) as snap:
+                if not snap.verify():
+                    raise SystemExit('PKG_SNAPSHOT %s fails its checksums' % SNAPSHOT)
+        return DemoIBE(store_path=STORE_PATH, snapshot=SNAPSHOT, lazy=LAZY_KEYSTORE)
+    if SNAPSHOT:
+        backend = DemoIBE(store_path=STORE_PATH)
+        if not backend.changes_since(0, 1)['changes']:
+            print('Loaded %d identities from snapshot %s' % (backend.load_snapshot(SNAPSHOT), SNAPSHOT))
+        return backend
+    return DemoIBE(store_path=STORE_PATH, lazy=LAZY_KEYSTORE)
+
+
+def _demo_master_keys(backend: DemoIBE) -> tuple:
+    # Sealed master keys from an earlier boot when PKG_MASTER_SEAL_KEY/PASSPHRASE is set,
+    # otherwise a fresh setup(); then open the keystore without holding up startup
+    mpk, msk = load_or_setup(backend, master_key_path(backend.store_path))
+    threading.Thread(target=backend.preload, name='keystore-preload', daemon=True).start()
+    return mpk, msk
+
+
+tenants = TenantRegistry(PKG_TENANTS_DIR) if PKG_TENANTS_DIR else None
+if tenants is not None:
+    # Multi-tenant: backend, MPK and MSK are per domain, see pkg/tenants.py
+    pkg = MPK = MSK = None
+    if default_secret() is None:
+        print('No PKG_MASTER_SEAL_KEY or PKG_MASTER_PASSPHRASE: tenants stay loaded, PKG_TENANT_MEMORY_MB is not enforced')
+elif CharmBackend:
     try:
         pkg = CharmBackend()
         MPK, MSK = pkg.setup()
         print('Using charm-crypto IBE backend')
     except Exception as e:
         print('Charm backend initialization failed, falling back to DemoIBE:', e)
-        pkg = DemoIBE()
-        MSK = os.urandom(32)
-        MPK, _ = pkg.setup()
+        pkg = _demo_backend()
+        MPK, MSK = _demo_master_keys(pkg)
 else:
-    pkg = DemoIBE()
-    # In a real deploy store MSK in a secure HSM; for demo we keep MSK in memory
-    MSK = os.urandom(32)
-    MPK, _ = pkg.setup()
+    pkg = _demo_backend()
+    # In a real deploy store MSK in a secure HSM; for demo it is kept in memory (and sealed on disk if configured)
+    MPK, MSK = _demo_master_keys(pkg)
+
+
+# Close the keystore(s) on shutdown: writes the compact index, so a restart does not re-insert records
+if tenants is not None:
+    atexit.register(tenants.close)
+elif isinstance(pkg, DemoIBE):
+    atexit.register(pkg.close)
+
+# Next-epoch key precomputation (pkg/epoch_scheduler.py); per-tenant backends are not scheduled
+def _forget_epochs(removed):
+    # Cached /get_pubkey responses must not outlive the garbage-collected epochs' keys
+    _pubkey_responses.discard_where(lambda raw: split_epoch(canonicalize_identity(raw))[1] in removed)
+
+
+epoch_scheduler = EpochScheduler(pkg, on_gc=_forget_epochs).start() \
+    if PKG_EPOCH_PRECOMPUTE and isinstance(pkg, DemoIBE) else None
+
+
+def _tenant(domain: str):
+    """Context manager yielding the Tenant serving `domain` (the only one unless multi-tenant)."""
+    if tenants is None:
+        return nullcontext(Tenant('', pkg, MPK, MSK))
+    return tenants.use(domain)
+
+
+def _domain_arg() -> str:
+    # Store-wide endpoints name their tenant with ?domain= (ignored when single-tenant)
+    return canonical_domain(request.args.get('domain', ''))
+
+
+@app.errorhandler(UnknownTenant)
+def _unknown_tenant(e):
+    return jsonify({"error": "unknown domain", "domain": str(e)}), 404
+
+
+# Group-committed record of every /extract outcome (pkg/audit.py)
+audit = AuditLog(PKG_AUDIT_LOG).start() if PKG_AUDIT_LOG else None
+
+
+def _audit(identity: str, result: str, sync: bool = False):
+    if audit is None:
+        return
+    with tracing.span('audit.record', result=result):
+        seq = audit.record(identity, request.remote_addr, result)
+        if sync and not audit.wait(seq):
+            raise AuditUnavailable('audit commit timed out')
+
+
+@app.errorhandler(AuditUnavailable)
+def _audit_unavailable(e):
+    # No key leaves the PKG unless its issuance is recorded
+    resp = jsonify({"error": "audit log unavailable"})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '1'
+    return resp
+
+
+@app.before_request
+def _start_span():
+    if tracing.enabled():
+        scope = tracing.continue_trace('pkg %s %s' % (request.method, request.path), request.headers)
+        scope.__enter__()
+        g.trace_scope = scope
+
+
+@app.after_request
+def _tag_span(response):
+    span = tracing.current_span()
+    if span is not None:
+        span.set(status=response.status_code)
+    return response
+
+
+admission = AdmissionController() if PKG_ADMISSION else None
+
+
+@app.before_request
+def _admit():
+    if admission is None:
+        return None
+    cls = route_class(request.path)
+    try:
+        admission.acquire(cls)
+    except Overloaded as e:
+        resp = jsonify({"error": "overloaded", "class": e.cls, "reason": e.reason})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp
+    g.admission_class = cls
+    return None
+
+
+@app.teardown_request
+def _end_request(exc):
+    cls = g.pop('admission_class', None)
+    if cls is not None:
+        admission.release(cls)
+    scope = g.pop('trace_scope', None)
+    if scope is not None:
+        scope.__exit__(type(exc) if exc else None, exc, None)
+
+
+def _canonical(raw: str) -> str:
+    with tracing.span('canonicalize_identity'):
+        return canonicalize_identity(raw)
+
+
+def _cached_body(obj) -> tuple:
+    """Serialize a JSON response once; returns (body, strong ETag)."""
+    body = json.dumps(obj, separators=(',', ':'), sort_keys=True).encode('utf8')
+    return body, '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def _etag_matches(etag: str) -> bool:
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+def _cacheable(entry: tuple, max_age: int) -> Response:
+    body, etag = entry
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=%d' % max_age}
+    if _etag_matches(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+# The MPK does not change while the server runs and issued public keys are
+# immutable, so both are serialized once and reused for every request.
+_mpk_response = _cached_body(MPK) if tenants is None else None
+# raw `identity` argument -> ((body, etag), lifetime); hits skip canonicalization and lookup.
+# `lifetime` is None for plain identities. For epoch identities it returns the seconds until
+# the epoch expires, which bounds both the cache entry and the response's max-age.
+_pubkey_responses = LRUTTLCache(max_entries=PUBKEY_CACHE_SIZE, ttl=None)
+
+
+def _epoch_lifetime(backend, identity: str):
+    epoch = split_epoch(identity)[1]
+    epochs = getattr(backend, 'epochs', None) if epoch else None
+    if epochs is None:
+        return None
+    return lambda: epochs.seconds_left(epoch)
 
 
 @app.route('/mpk', methods=['GET'])
 def get_mpk():
-    return jsonify(MPK)
+    if tenants is None:
+        return _cacheable(_mpk_response, MPK_MAX_AGE)
+    with tenants.use(_domain_arg()) as t:
+        return _cacheable(_cached_body(t.mpk), MPK_MAX_AGE)
 
 
 @app.route('/get_pubkey', methods=['GET'])
 def get_pubkey():
-    identity = canonicalize_identity(request.args.get('identity', ''))
-    if not identity:
-        return jsonify({"error": "missing identity"}), 400
-    pub = pkg.get_pubkey_for_identity(identity)
-    if pub is None:
-        return jsonify({"error": "unknown identity"}), 404
-    return jsonify({"identity": identity, "pub_b64": b64(pub)})
+    raw = request.args.get('identity', '')
+    cached = _pubkey_responses.get(raw)
+    if cached is None:
+        identity = _canonical(raw)
+        if not identity:
+            return jsonify({"error": "missing identity"}), 400
+        with _tenant(domain_of(identity)) as t:
+            pub = t.pkg.get_pubkey_for_identity(identity)
+            lifetime = _epoch_lifetime(t.pkg, identity)
+        if pub is None:
+            # Not cached: the identity may be issued a key later
+            return jsonify({"error": "unknown identity"}), 404
+        cached = (_cached_body({"identity": identity, "pub_b64": b64(pub)}), lifetime)
+        if lifetime is None:
+            _pubkey_responses.set(raw, cached)
+        elif lifetime() > 0:
+            _pubkey_responses.set(raw, cached, ttl=lifetime())
+    entry, lifetime = cached
+    max_age = PUBKEY_MAX_AGE if lifetime is None else max(0, min(PUBKEY_MAX_AGE, int(lifetime())))
+    return _cacheable(entry, max_age)
+
+
+@app.route('/get_pubkeys', methods=['POST'])
+def get_pubkeys():
+    """Resolve many identities in one round trip (used by the SMTP relay)."""
+    data = request.get_json(force=True)
+    identities = data.get('identities')
+    if not isinstance(identities, list) or not identities:
+        return jsonify({"error": "missing identities"}), 400
+    if len(identities) > MAX_BATCH_LOOKUP:
+        return jsonify({"error": "too many identities", "max": MAX_BATCH_LOOKUP}), 400
+    pubkeys = {}
+    with tracing.span('canonicalize_many', count=len(identities)):
+        canonical = canonicalize_many(str(raw) for raw in identities)
+    for domain, group in _by_domain(canonical).items():
+        try:
+            with _tenant(domain) as t:
+                for identity in group:
+                    pub = t.pkg.get_pubkey_for_identity(identity)
+                    if pub is not None:
+                        pubkeys[identity] = b64(pub)
+        except UnknownTenant:
+            pass  # all of its identities are reported unknown
+    return jsonify({"pubkeys": pubkeys, "unknown": [i for i in canonical if i not in pubkeys]})
+
+
+def _by_domain(identities) -> dict:
+    groups = {}
+    for identity in identities:
+        groups.setdefault(domain_of(identity) if tenants is not None else '', []).append(identity)
+    return groups
+
+
+@app.route('/pubkeys/changes', methods=['GET'])
+def pubkey_changes():
+    """Incremental public-key feed: changes after sequence number `since`, oldest first."""
+    try:
+        since = int(request.args.get('since', '0'))
+        limit = int(request.args.get('limit', str(MAX_CHANGES_PAGE)))
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    if since < 0 or limit <= 0:
+        return jsonify({"error": "since must be >= 0 and limit > 0"}), 400
+    epoch = request.args.get('epoch') or None
+    if epoch is not None and not is_epoch_label(epoch):
+        return jsonify({"error": "invalid epoch"}), 400
+    with _tenant(_domain_arg()) as t:
+        if not hasattr(t.pkg, 'changes_since'):
+            return jsonify({"error": "change feed not supported by this backend"}), 501
+        return jsonify(t.pkg.changes_since(since, min(limit, MAX_CHANGES_PAGE), epoch=epoch))
+
+
+# store_id -> (store seq, serialized filter)
+_filter_cache = LRUTTLCache(max_entries=256, ttl=None)
+
+
+@app.route('/pubkeys/filter', methods=['GET'])
+def pubkey_filter():
+    """Serialized Bloom filter of issued identities; `X-PKG-Seq` tells clients how fresh it is."""
+    with _tenant(_domain_arg()) as t:
+        if not hasattr(t.pkg, 'identity_filter'):
+            return jsonify({"error": "identity filter not supported by this backend"}), 501
+        seq, store_id = t.pkg.store['seq'], t.pkg.store['store_id']
+        cached_seq, body = _filter_cache.get(store_id, (None, b''))
+        if cached_seq != seq:
+            body = t.pkg.identity_filter().to_bytes()
+            _filter_cache.set(store_id, (seq, body))
+    etag = '"%s-%d"' % (store_id, seq)
+    if _etag_matches(etag):
+        return Response(status=304, headers={'ETag': etag, 'X-PKG-Seq': str(seq)})
+    return Response(body, mimetype='application/octet-stream',
+                    headers={'ETag': etag, 'X-PKG-Seq': str(seq), 'Cache-Control': 'no-cache'})
+
+
+def _admin_denied():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    if not hmac.compare_digest(request.headers.get('X-PKG-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({"error": "forbidden"}), 403
+    if tenants is None and not hasattr(pkg, 'export_keys'):
+        return jsonify({"error": "key transfer not supported by this backend"}), 501
+    return None
+
+
+@app.route('/admin/export_keys', methods=['POST'])
+def admin_export_keys():
+    """Keypairs for the given identities, for rebalancing shards."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    identities = request.get_json(force=True).get('identities')
+    if not isinstance(identities, list):
+        return jsonify({"error": "missing identities"}), 400
+    keys = {}
+    for domain, group in _by_domain(canonicalize_many(str(i) for i in identities)).items():
+        try:
+            with _tenant(domain) as t:
+                keys.update(t.pkg.export_keys(group))
+        except UnknownTenant:
+            pass
+    return jsonify({"keys": keys})
+
+
+@app.route('/admin/import_keys', methods=['POST'])
+def admin_import_keys():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    keys = request.get_json(force=True).get('keys')
+    if not isinstance(keys, dict):
+        return jsonify({"error": "missing keys"}), 400
+    imported, conflicts = 0, []
+    by_identity = {canonicalize_identity(str(i)): ent for i, ent in keys.items()}
+    for domain, group in _by_domain(by_identity).items():
+        with _tenant(domain) as t:
+            imported += t.pkg.import_keys({i: by_identity[i] for i in group}, conflicts)
+    # Identities this node already holds with a different key; the router aborts the migration
+    return jsonify({"imported": imported, "conflicts": conflicts})
 
 
 @app.route('/request_extract_code', methods=['POST'])
 def request_extract_code():
     """Request an OTP to be emailed to the identity (email address)."""
     data = request.get_json(force=True)
-    identity = canonicalize_identity(data.get('identity', ''))
-    if not identity or '@' not in identity:
+    identity = _canonical(data.get('identity', ''))
+    # Epoch identities (ibe/epochs.py) authenticate as the mailbox they belong to
+    address = split_epoch(identity)[0]
+    if not address or '@' not in address:
         return jsonify({"error": "invalid identity"}), 400
+    if tenants is not None and not tenants.serves(domain_of(identity)):
+        raise UnknownTenant(domain_of(identity))
     # TODO: add rate limiting per identity and per IP
-    success = request_otp(identity)
+    success = request_otp(address)
     if not success:
         return jsonify({"error": "failed to send OTP"}), 500
     return jsonify({"status": "otp_sent", "identity": identity}), 202
@@ -84,18 +465,25 @@ def request_extract_code():
 def extract():
     """Verify OTP and issue private key for the identity."""
     data = request.get_json(force=True)
-    identity = canonicalize_identity(data.get('identity', ''))
+    identity = _canonical(data.get('identity', ''))
     otp = data.get('otp', '')
     if not identity:
         return jsonify({"error": "missing identity"}), 400
     if not otp:
         return jsonify({"error": "missing otp"}), 400
     # Verify OTP
-    error = verify_otp(identity, otp)
+    error = verify_otp(split_epoch(identity)[0], otp)
     if error:
+        _audit(identity, error)
         return jsonify({"error": error}), 401
     # OTP verified; issue private key
-    priv = pkg.extract(MSK, identity)
+    try:
+        with _tenant(domain_of(identity)) as t:
+            priv = t.pkg.extract(t.msk, identity)
+    except EpochError as e:
+        _audit(identity, 'epoch_refused')
+        return jsonify({"error": str(e)}), 400
+    _audit(identity, 'issued', sync=PKG_AUDIT_SYNC)
     return jsonify({"identity": identity, "private_b64": b64(priv)})
 
 
@@ -0,0 +1,220 @@
+"""Multi-tenant PKG: one process serving many customer domains.
+
+Each domain has its own keystore, MPK and MSK. The tenant of a request is the
+domain part of its canonical identity (or the `domain` argument of the
+per-store endpoints). A tenant is loaded on first use and kept in an LRU
+list. Once the estimated resident size of all loaded tenants exceeds the
+memory budget, the least recently used idle tenants are unloaded. Their
+keystores stay on disk and are loaded again on the next request, so cold
+domains cost only disk. A tenant in use by a request is never unloaded.
+
+Keystores live in `<PKG_TENANTS_DIR>/<domain>/pkg_data.json`. Domains are
+stored under their ASCII (IDNA) name. As in the single-tenant server, a
+tenant's MSK is only held in memory. It is generated when the tenant loads,
+or unsealed from `pkg_data.master` next to its keystore when a sealing
+secret is configured (see `pkg/master_keys.py`). Without a sealing secret an
+unloaded tenant's MSK could not be restored, so tenants are then never
+unloaded and the memory budget is not enforced.
+
+Configuration via environment variables:
+- PKG_TENANTS_DIR — enables multi-tenant mode in `pkg/server.py`
+- PKG_TENANT_DOMAINS — comma-separated domains to serve (default: those with a
+  directory under PKG_TENANTS_DIR); `*` serves any domain, creating its keystore on first use
+- PKG_TENANT_MEMORY_MB (default 256) — budget for resident tenants
+"""
+from __future__ import annotations
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+from ibe.crypto_iface import DemoIBE, canonicalize_identity
+from ibe.epochs import split_epoch
+from pkg.master_keys import default_secret, load_or_setup
+
+PKG_TENANTS_DIR = os.environ.get('PKG_TENANTS_DIR') or None
+PKG_TENANT_DOMAINS = os.environ.get('PKG_TENANT_DOMAINS', '')
+PKG_TENANT_MEMORY_MB = float(os.environ.get('PKG_TENANT_MEMORY_MB', '256'))
+
+# Rough resident cost of a loaded tenant (see scripts/bench_compact_store.py)
+_TENANT_BASE_BYTES = 64 * 1024
+_JSON_BYTES_PER_IDENTITY = 440
+_COMPACT_BYTES_PER_IDENTITY = 140
+_SAFE_DIRNAME = re.compile(r'[a-z0-9][a-z0-9-]*(\.[a-z0-9-]+)*')
+
+
+def domain_of(identity: str) -> str:
+    """Domain part of a canonical (or epoch) identity ('' if it has none)."""
+    identity = split_epoch(identity)[0]
+    return identity.rpartition('@')[2] if '@' in identity else ''
+
+
+def canonical_domain(domain: str) -> str:
+    """Canonical form of a bare domain, matching `domain_of(canonicalize_identity(...))`."""
+    return domain_of(canonicalize_identity('@' + domain.strip()))
+
+
+def tenant_dirname(domain: str) -> str:
+    """Directory name for a domain: its IDNA ASCII form, or a hash if that is not a safe name."""
+    try:
+        name = domain.encode('idna').decode('ascii').lower()
+    except UnicodeError:
+        name = ''
+    if not _SAFE_DIRNAME.fullmatch(name):
+        name = 'h-' + hashlib.sha256(domain.encode('utf8')).hexdigest()[:32]
+    return name
+
+
+class UnknownTenant(LookupError):
+    """The domain is not served by this PKG."""
+
+
+class Tenant:
+    """A loaded domain: its backend (`pkg`), MPK and in-memory MSK.
+
+    `sealed` is False when the MSK exists only in memory and would be lost by unloading.
+    """
+
+    def __init__(self, domain: str, pkg, mpk: Dict[str, Any], msk: bytes, sealed: bool = True):
+        self.domain = domain
+        self.pkg = pkg
+        self.mpk = mpk
+        self.msk = msk
+        self.sealed = sealed
+        self.pins = 0
+
+    def memory_bytes(self) -> int:
+        # Estimated from the number of keys issued; exact accounting would cost more than it saves
+        per_identity = _COMPACT_BYTES_PER_IDENTITY if getattr(self.pkg, 'keys', None) is not None \
+            else _JSON_BYTES_PER_IDENTITY
+        return _TENANT_BASE_BYTES + self.pkg.store.get('seq', 0) * per_identity
+
+    def close(self):
+        close = getattr(self.pkg, 'close', None)
+        if close is not None:
+            close()
+
+
+def _demo_factory(store_path: str):
+    return DemoIBE(store_path=store_path)
+
+
+class TenantRegistry:
+    """Lazily loaded per-domain backends, unloaded LRU-first beyond a memory budget.
+
+    Usage:
+        tenants = TenantRegistry('/var/lib/pkg/tenants', domains=['example.com'])
+        with tenants.use('example.com') as t:
+            priv = t.pkg.extract(t.msk, 'alice@example.com')
+    """
+
+    def __init__(self, root: str, domains: Iterable[str] = None, memory_budget: int = None,
+                 factory: Callable[[str], Any] = _demo_factory):
+        self.root = root
+        if domains is None:
+            domains = PKG_TENANT_DOMAINS.split(',')
+        self.domains = {d if d.strip() == '*' else canonical_domain(d) for d in domains if d.strip()}
+        self.any_domain = '*' in self.domains
+        self.memory_budget = int(PKG_TENANT_MEMORY_MB * 2**20) if memory_budget is None else memory_budget
+        self.factory = factory
+        self._tenants: 'OrderedDict[str, Tenant]' = OrderedDict()  # least recently used first
+        self._loading = set()
+        self._cond = threading.Condition()
+        self.loads = 0
+        self.evictions = 0
+
+    def _path(self, domain: str) -> str:
+        return os.path.join(self.root, tenant_dirname(domain))
+
+    def serves(self, domain: str) -> bool:
+        if not domain:
+            return False
+        return self.any_domain or domain in self.domains or os.path.isdir(self._path(domain))
+
+    @contextmanager
+    def use(self, domain: str) -> Iterator[Tenant]:
+        """Pin the tenant for `domain` (loading it if needed) for the duration of the block.
+
+        Raises `UnknownTenant` if the domain is not served.
+        """
+        tenant = self._acquire(domain)
+        try:
+            yield tenant
+        finally:
+            with self._cond:
+                tenant.pins -= 1
+                self._evict()
+
+    def _acquire(self, domain: str) -> Tenant:
+        with self._cond:
+            while domain in self._loading:
+                self._cond.wait()
+            tenant = self._tenants.get(domain)
+            if tenant is not None:
+                self._tenants.move_to_end(domain)
+                tenant.pins += 1
+                return tenant
+            if not self.serves(domain):
+                raise UnknownTenant(domain)
+            self._loading.add(domain)
+        # Load outside the lock so requests for other tenants are not held up
+        try:
+            tenant = self._load(domain)
+        except BaseException:
+            with self._cond:
+                self._loading.discard(domain)
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._loading.discard(domain)
+            self._cond.notify_all()
+            tenant.pins += 1
+            self._tenants[domain] = tenant
+            self.loads += 1
+            self._evict()
+        return tenant
+
+    def _load(self, domain: str) -> Tenant:
+        path = self._path(domain)
+        os.makedirs(path, exist_ok=True)
+        pkg = self.factory(os.path.join(path, 'pkg_data.json'))
+        if default_secret() is not None:
+            # Sealed per-tenant master keys (pkg/master_keys.py) survive unloading
+            mpk, msk = load_or_setup(pkg, os.path.join(path, 'pkg_data.master'))
+            return Tenant(domain, pkg, mpk, msk)
+        mpk = pkg.store.get('mpk')
+        if not mpk:
+            mpk, _ = pkg.setup()
+        # Memory-only MSK: the tenant must stay loaded for its keys to keep matching the MPK
+        return Tenant(domain, pkg, mpk, os.urandom(32), sealed=False)
+
+    def _evict(self):
+        # Caller holds the lock
+        total = sum(t.memory_bytes() for t in self._tenants.values())
+        for domain, tenant in list(self._tenants.items()):
+            if total <= self.memory_budget:
+                break
+            if tenant.pins or not tenant.sealed:
+                continue
+            del self._tenants[domain]
+            total -= tenant.memory_bytes()
+            tenant.close()
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {"resident": list(self._tenants), "memory_bytes": sum(t.memory_bytes() for t in self._tenants.values()),
+                    "memory_budget": self.memory_budget, "loads": self.loads, "evictions": self.evictions}
+
+    def close(self):
+        with self._cond:
+            for tenant in self._tenants.values():
+                tenant.close()
+            self._tenants.clear()
+
+
+__all__ = ['TenantRegistry', 'Tenant', 'UnknownTenant', 'domain_of', 'canonical_domain', 'tenant_dirname',
+           'PKG_TENANTS_DIR']
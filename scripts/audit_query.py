@@ -0,0 +1,58 @@
+"""Search the PKG extraction audit log (see `pkg/audit.py`).
+
+Streams the rotated `.gz` files and the active file line by line, printing
+matching events as JSON lines (oldest first). Files entirely outside the
+time range are not opened. Identities are given in plain form and hashed
+the way the log stores them.
+
+Usage:
+    python scripts/audit_query.py /var/log/pkg/extract.log [--identity alice@example.com ...]
+        [--since 2026-10-01] [--until 2026-10-19T12:00:00] [--result issued ...] [--count]
+"""
+import sys
+import os
+import argparse
+import calendar
+import json
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pkg.audit import iter_events
+
+
+def parse_time(value: str) -> float:
+    """Unix seconds, or a UTC date / date-time (`2026-10-19`, `2026-10-19T12:00:00`)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return float(calendar.timegm(time.strptime(value.rstrip('Z'), fmt)))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError('not a time: %r' % value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filter the PKG extraction audit log')
+    parser.add_argument('log', help='active audit log path (PKG_AUDIT_LOG); rotated files are found next to it')
+    parser.add_argument('--identity', action='append', help='identity to match (repeatable)')
+    parser.add_argument('--since', type=parse_time, help='first time to include (UTC)')
+    parser.add_argument('--until', type=parse_time, help='last time to include (UTC)')
+    parser.add_argument('--result', action='append', help='result to match, e.g. issued, invalid (repeatable)')
+    parser.add_argument('--count', action='store_true', help='print only the number of matching events')
+    args = parser.parse_args()
+
+    events = iter_events(args.log, identities=args.identity, since=args.since, until=args.until,
+                         results=args.result)
+    if args.count:
+        print(sum(1 for _ in events))
+        return
+    out = sys.stdout
+    for event in events:
+        out.write(json.dumps(event) + '\n')
+
+
+if __name__ == '__main__':
+    main()
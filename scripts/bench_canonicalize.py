@@ -0,0 +1,81 @@
+"""Benchmark identity canonicalization on a large address list.
+
+Builds `--addresses` addresses drawn from `--distinct` mailboxes with a skewed
+(Zipf-like) distribution, a few percent of them with Unicode local parts or
+IDNA domains and random case/whitespace noise. It compares the original
+`unicodedata.normalize('NFC', s.strip().lower())` with `canonicalize_identity`
+and `canonicalize_many`, overall and on the international (non-ASCII or
+punycode) slice on its own.
+
+Usage:
+    python scripts/bench_canonicalize.py [--addresses N] [--distinct D]
+"""
+import sys
+import os
+import argparse
+import random
+import time
+import unicodedata
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.identity import _canonicalize_unicode, canonicalize_identity, canonicalize_many
+
+DOMAINS = ['example.com', 'corp.example.org', 'mail.example.net', 'xn--bcher-kva.example', 'bücher.example']
+
+
+def mailbox(rng, i):
+    local = f'user{i}'
+    if rng.random() < 0.03:
+        local = 'josé' + str(i) if rng.random() < 0.5 else 'zoë' + str(i)
+    return local + '@' + rng.choices(DOMAINS, weights=[50, 30, 15, 3, 2])[0]
+
+
+def noisy(rng, addr):
+    if rng.random() < 0.3:
+        addr = addr.capitalize()
+    if rng.random() < 0.1:
+        addr = ' ' + addr + ' '
+    return addr
+
+
+def original(identity):
+    return unicodedata.normalize('NFC', identity.strip().lower())
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    fn(items)
+    return time.perf_counter() - start
+
+
+def compare(label, items):
+    base = timed(lambda xs: [original(a) for a in xs], items)
+    _canonicalize_unicode.cache_clear()
+    cold = timed(lambda xs: [canonicalize_identity(a) for a in xs], items)
+    warm = timed(lambda xs: [canonicalize_identity(a) for a in xs], items)
+    batch = timed(canonicalize_many, items)
+    n = len(items) / 1e6
+    print(f'{label:>14} ({len(items):>8} addrs): original {n / base:5.2f} M/s | '
+          f'canonicalize_identity cold {n / cold:5.2f} M/s, warm {n / warm:5.2f} M/s | '
+          f'canonicalize_many {n / batch:5.2f} M/s | warm speedup {base / warm:4.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Identity canonicalization benchmark')
+    parser.add_argument('--addresses', type=int, default=1_000_000)
+    parser.add_argument('--distinct', type=int, default=50_000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    boxes = [mailbox(rng, i) for i in range(args.distinct)]
+    weights = [1 / (i + 1) for i in range(args.distinct)]
+    addresses = [noisy(rng, a) for a in rng.choices(boxes, weights=weights, k=args.addresses)]
+    international = [a for a in addresses if not a.isascii() or 'xn--' in a.lower()]
+
+    compare('all', addresses)
+    compare('international', international)
+    print(f'memoized slow path: {_canonicalize_unicode.cache_info()}')
+
+
+if __name__ == '__main__':
+    main()
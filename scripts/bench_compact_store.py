@@ -0,0 +1,100 @@
+"""Compare memory and lookup cost of the JSON-style and compact keystores.
+
+Builds `--identities` synthetic identities in a dict of base64 entries (the
+layout of `DemoIBE.store['identities']`) and in a `CompactKeyStore`, then
+reports resident-memory growth per identity, lookups per second, and how long
+reopening the compact store takes with and without mmap. Memory is measured
+with tracemalloc for the dict and from buffer sizes for the compact store.
+
+Usage:
+    python scripts/bench_compact_store.py [--identities N] [--lookups L]
+"""
+import sys
+import os
+import argparse
+import base64
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.compact_store import CompactKeyStore
+
+
+def identities(n):
+    return ['user%d@example.com' % i for i in range(n)]
+
+
+def keypair(i):
+    return i.to_bytes(8, 'big') * 4, (i + 1).to_bytes(8, 'big') * 4
+
+
+def build_dict(names):
+    tracemalloc.start()
+    store = {}
+    for i, name in enumerate(names):
+        pub, priv = keypair(i)
+        store[name] = {'pub': base64.b64encode(pub).decode('ascii'),
+                       'priv': base64.b64encode(priv).decode('ascii'), 'seq': i + 1}
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, used
+
+
+def timed_lookups(get, probes):
+    start = time.perf_counter()
+    for p in probes:
+        get(p)
+    return len(probes) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compact keystore benchmark')
+    parser.add_argument('--identities', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    args = parser.parse_args()
+
+    names = identities(args.identities)
+    rng = random.Random(5)
+    probes = [rng.choice(names) for _ in range(args.lookups)]
+
+    d, dict_bytes = build_dict(names)
+    dict_rate = timed_lookups(lambda n: base64.b64decode(d[n]['pub']), probes)
+    del d
+
+    tmp = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        store = CompactKeyStore(os.path.join(tmp, 'keys'))
+        for i, name in enumerate(names):
+            store.add(name, *keypair(i), i + 1)
+        build = time.perf_counter() - start
+        compact_bytes = len(store._records) + len(store._idents) + store._table.itemsize * len(store._table)
+        compact_rate = timed_lookups(store.get_pub, probes)
+        store.close()
+
+        reopen = {}
+        for use_mmap in (False, True):
+            start = time.perf_counter()
+            s = CompactKeyStore(os.path.join(tmp, 'keys'), use_mmap=use_mmap)
+            reopen[use_mmap] = time.perf_counter() - start
+            mapped_rate = timed_lookups(s.get_pub, probes) if use_mmap else None
+            s.close()
+    finally:
+        shutil.rmtree(tmp)
+
+    n = args.identities
+    print(f'{n} identities')
+    print(f'  dict of base64 entries: {dict_bytes / n:7.1f} B/identity, {dict_rate / 1e3:7.1f} k lookups/s')
+    print(f'  CompactKeyStore:        {compact_bytes / n:7.1f} B/identity, {compact_rate / 1e3:7.1f} k lookups/s '
+          f'(build {build:.1f}s)')
+    print(f'  reopen: load {reopen[False] * 1e3:.0f} ms, mmap {reopen[True] * 1e3:.1f} ms '
+          f'({mapped_rate / 1e3:.1f} k lookups/s mapped)')
+    print(f'  projected for 10M identities: dict {dict_bytes / n * 1e7 / 2**30:.1f} GiB, '
+          f'compact {compact_bytes / n * 1e7 / 2**30:.1f} GiB')
+
+
+if __name__ == '__main__':
+    main()
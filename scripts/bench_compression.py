@@ -0,0 +1,102 @@
+"""Benchmark pre-encryption compression on a synthetic but realistic mail corpus.
+
+The corpus mixes HTML newsletters, plain-text replies, CSV attachments, JSON
+exports and already-compressed binary attachments (which the adaptive codec
+choice should leave alone). For each compression mode it reports the bytes
+that would go over the wire (the JSON envelope) and the mean end-to-end
+encrypt + decrypt latency per message.
+
+Usage:
+    python scripts/bench_compression.py [--messages N]
+"""
+import sys
+import os
+import argparse
+import json
+import random
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe import compression
+from ibe.crypto_iface import DemoIBE
+
+WORDS = ('account report quarterly meeting schedule invoice customer project update team '
+         'review budget forecast delivery shipment contract renewal payment reminder agenda '
+         'please thanks regards attached summary figures growth revenue margin').split()
+
+
+def sentence(rng, n=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def html_newsletter(rng):
+    items = ''.join(f'<tr><td class="item"><h2>{sentence(rng, 5)}</h2><p>{sentence(rng, 40)}</p>'
+                    f'<a href="https://news.example.com/a/{rng.randrange(10**6)}">Read more</a></td></tr>'
+                    for _ in range(rng.randint(5, 15)))
+    return (f'<html><head><style>td.item{{padding:8px;font-family:Arial}}</style></head>'
+            f'<body><table width="600">{items}</table></body></html>').encode()
+
+
+def plain_reply(rng):
+    quoted = '\n'.join('> ' + sentence(rng) for _ in range(rng.randint(5, 30)))
+    return (sentence(rng) + '\n\n' + quoted + '\n\n-- \nAlice Example\n').encode()
+
+
+def csv_attachment(rng):
+    rows = ['date,customer,sku,quantity,unit_price,currency']
+    for _ in range(rng.randint(200, 2000)):
+        rows.append(f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},CUST{rng.randrange(5000):05d},'
+                    f'SKU-{rng.randrange(300):04d},{rng.randint(1, 50)},{rng.uniform(1, 500):.2f},EUR')
+    return '\n'.join(rows).encode()
+
+
+def json_export(rng):
+    return json.dumps([{'id': rng.randrange(10**9), 'status': rng.choice(['open', 'closed', 'pending']),
+                        'note': sentence(rng, 8)} for _ in range(rng.randint(50, 400))], indent=2).encode()
+
+
+def jpeg_attachment(rng):
+    return b'\xff\xd8\xff\xe0' + os.urandom(rng.randint(20_000, 200_000))
+
+
+GENERATORS = [(html_newsletter, 4), (plain_reply, 4), (csv_attachment, 1), (json_export, 1), (jpeg_attachment, 1)]
+
+
+def corpus(n, seed=7):
+    rng = random.Random(seed)
+    population = [g for g, weight in GENERATORS for _ in range(weight)]
+    return [rng.choice(population)(rng) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compression benchmark on a mail-like corpus')
+    parser.add_argument('--messages', type=int, default=300)
+    args = parser.parse_args()
+
+    messages = corpus(args.messages)
+    raw_total = sum(len(m) for m in messages)
+    print(f'Corpus: {len(messages)} messages, {raw_total / 1e6:.2f} MB plaintext; '
+          f'codecs available: {compression.available_codecs()}')
+
+    modes = ['off', 'auto'] + [c for c, ok in compression.available_codecs().items() if ok]
+    with tempfile.TemporaryDirectory() as d:
+        baseline = None
+        for mode in modes:
+            demo = DemoIBE(store_path=os.path.join(d, 'pkg_data.json'), compression=mode)
+            _, msk = demo.setup()
+            priv = demo.extract(msk, 'alice@example.com')
+            wire = 0
+            start = time.perf_counter()
+            for m in messages:
+                env = demo.encrypt('alice@example.com', m)
+                wire += len(json.dumps(env))
+                assert demo.decrypt(priv, env) == m
+            elapsed = time.perf_counter() - start
+            baseline = baseline or wire
+            print(f'{mode:>5}: wire {wire / 1e6:7.2f} MB ({100 * (1 - wire / baseline):5.1f}% saved), '
+                  f'encrypt+decrypt {1000 * elapsed / len(messages):6.3f} ms/msg')
+
+
+if __name__ == '__main__':
+    main()
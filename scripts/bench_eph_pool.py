@@ -0,0 +1,57 @@
+"""Compare encrypt latency under burst load with and without the ephemeral key pool.
+
+Sends `--bursts` bursts of `--burst-size` back-to-back encrypts, pausing
+between bursts so the pool's background thread can refill. Reports per-call
+latency percentiles and the pool's exhaustion counter.
+
+Usage:
+    python scripts/bench_eph_pool.py [--bursts N] [--burst-size B] [--pool-size P]
+"""
+import sys
+import os
+import argparse
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.crypto_iface import DemoIBE
+from ibe.eph_pool import EphemeralKeyPool
+
+
+def run(demo, bursts, burst_size, pause):
+    latencies = []
+    for _ in range(bursts):
+        for _ in range(burst_size):
+            start = time.perf_counter()
+            demo.encrypt('alice@example.com', b'alert: disk usage above 90% on host web-01')
+            latencies.append(time.perf_counter() - start)
+        time.sleep(pause)
+    latencies.sort()
+    return {p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1e6 for p in (50, 90, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ephemeral key pool burst benchmark')
+    parser.add_argument('--bursts', type=int, default=20)
+    parser.add_argument('--burst-size', type=int, default=200)
+    parser.add_argument('--pool-size', type=int, default=256)
+    parser.add_argument('--pause', type=float, default=0.2, help='Idle seconds between bursts')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        for label, pool in (('no pool', None), (f'pool({args.pool_size})', EphemeralKeyPool(args.pool_size))):
+            demo = DemoIBE(store_path=os.path.join(d, 'pkg_data.json'), eph_pool=pool)
+            _, msk = demo.setup()
+            demo.extract(msk, 'alice@example.com')
+            if pool is not None:
+                pool.fill()
+            pct = run(demo, args.bursts, args.burst_size, args.pause)
+            line = f'{label:>10}: p50 {pct[50]:7.1f} us  p90 {pct[90]:7.1f} us  p99 {pct[99]:7.1f} us'
+            if pool is not None:
+                line += f'  {pool.stats()}'
+                pool.stop()
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
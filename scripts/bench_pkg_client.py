@@ -0,0 +1,74 @@
+"""Measure public-key lookups per second against a local PKG.
+
+Starts `pkg/server.py`'s Flask app on a threaded local server (backed by a
+temporary keystore holding `--identities` keys) and compares:
+
+- `requests.get` per lookup (a new connection each time, as the old clients did),
+- `PKGClient.get_pubkey` in a loop (pooled keep-alive connection),
+- `PKGClient.lookup_many` (concurrent single lookups, capped),
+- `PKGClient.get_pubkeys` (batched through `POST /get_pubkeys`).
+
+Usage:
+    python scripts/bench_pkg_client.py [--identities N] [--lookups L] [--concurrency C]
+"""
+import sys
+import os
+import argparse
+import logging
+import random
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+from clients.pkg_client import PKGClient
+from ibe.crypto_iface import DemoIBE
+
+
+def start_pkg(store_path, identities):
+    from pkg import server
+    server.pkg = DemoIBE(store_path=store_path)
+    server.pkg.setup()
+    for identity in identities:
+        server.pkg.extract(server.MSK, identity)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, 'http://127.0.0.1:%d' % httpd.server_port
+
+
+def report(label, n, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:>26}: {n / elapsed:9.0f} lookups/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PKG client lookup benchmark')
+    parser.add_argument('--identities', type=int, default=2000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    identities = ['user%d@example.com' % i for i in range(args.identities)]
+    sample = random.Random(3).choices(identities, k=args.lookups)
+    with tempfile.TemporaryDirectory() as d:
+        httpd, url = start_pkg(os.path.join(d, 'pkg_data.json'), identities)
+        try:
+            report('requests.get (no pooling)', len(sample),
+                   lambda: [requests.get(url + '/get_pubkey', params={'identity': i}, timeout=10) for i in sample])
+            with PKGClient(url, max_concurrency=args.concurrency) as pkg:
+                report('PKGClient.get_pubkey', len(sample), lambda: [pkg.get_pubkey(i) for i in sample])
+                report('PKGClient.lookup_many', len(sample), lambda: pkg.lookup_many(sample))
+                report('PKGClient.get_pubkeys', len(sample), lambda: pkg.get_pubkeys(sample))
+                print(f'client stats: {pkg.stats()}')
+        finally:
+            httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compare per-message cost of regular envelopes and session mode for one sender -> recipient stream.
+
+Encrypts and decrypts `--messages` small alert-sized messages to the same
+recipient with `DemoIBE.encrypt` / `decrypt` and with `SessionEncryptor` /
+`SessionDecryptor`, and reports the mean microseconds per message for each side.
+
+Usage:
+    python scripts/bench_sessions.py [--messages N] [--rekey-every M]
+"""
+import sys
+import os
+import argparse
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.crypto_iface import DemoIBE, load_private_key
+from ibe.session import RekeyPolicy, SessionDecryptor, SessionEncryptor
+
+MESSAGE = b'alert: disk usage above 90% on host web-01'
+
+
+def timed(fn, items):
+    start = time.perf_counter()
+    out = [fn(x) for x in items]
+    return out, (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Session mode benchmark')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--rekey-every', type=int, default=10000, help='RekeyPolicy max_messages')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        demo = DemoIBE(store_path=os.path.join(d, 'pkg_data.json'))
+        _, msk = demo.setup()
+        priv = load_private_key(demo.extract(msk, 'alice@example.com'))
+        idx = range(args.messages)
+
+        envs, enc = timed(lambda _: demo.encrypt('alice@example.com', MESSAGE), idx)
+        _, dec = timed(lambda e: demo.decrypt(priv, e), envs)
+        print(f' regular: encrypt {enc:7.1f} us/msg  decrypt {dec:7.1f} us/msg')
+
+        sender = SessionEncryptor(demo.get_pubkey_for_identity, RekeyPolicy(max_messages=args.rekey_every))
+        receiver = SessionDecryptor(priv)
+        envs, enc = timed(lambda _: sender.encrypt('alice@example.com', MESSAGE), idx)
+        _, dec = timed(receiver.decrypt, envs)
+        print(f' session: encrypt {enc:7.1f} us/msg  decrypt {dec:7.1f} us/msg  {sender.stats()}')
+
+
+if __name__ == '__main__':
+    main()
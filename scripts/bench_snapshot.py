@@ -0,0 +1,92 @@
+"""Compare PKG keystore load time: JSON store vs binary snapshot.
+
+Writes `--identities` synthetic keypairs as a `DemoIBE` JSON store and as an
+`ibe.snapshot` file (exported from that store, so the external sort runs),
+then times what a PKG does at startup with each:
+
+- JSON: `DemoIBE(store_path=...)` (json.load plus change-feed indexing),
+- snapshot, load: `Snapshot(use_mmap=False)` (one read) and a full scan,
+- snapshot, mmap: `DemoIBE(snapshot=...)` serving the file in place,
+- restore into the compact keystore (`load_snapshot`),
+
+plus lookups per second against the mapped snapshot and file sizes.
+
+Usage:
+    python scripts/bench_snapshot.py [--identities N] [--lookups L]
+"""
+import sys
+import os
+import argparse
+import base64
+import json
+import random
+import shutil
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.crypto_iface import DemoIBE
+from ibe.snapshot import Snapshot
+
+
+def write_json_store(path, n):
+    # Same layout DemoIBE._save writes, streamed so the generator itself stays small
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('{"mpk": {"version": 1}, "store_id": "0123456789abcdef", "seq": %d, "identities": {' % n)
+        for i in range(n):
+            pub = base64.b64encode(i.to_bytes(8, 'big') * 4).decode('ascii')
+            priv = base64.b64encode((i + 1).to_bytes(8, 'big') * 4).decode('ascii')
+            f.write('%s"user%d@example.com": %s' % (',' if i else '', i,
+                                                     json.dumps({'pub': pub, 'priv': priv, 'seq': i + 1})))
+        f.write('}}')
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keystore snapshot load benchmark')
+    parser.add_argument('--identities', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    args = parser.parse_args()
+    n = args.identities
+    rng = random.Random(5)
+    probes = ['user%d@example.com' % rng.randrange(n) for _ in range(args.lookups)]
+
+    tmp = tempfile.mkdtemp()
+    try:
+        json_path = os.path.join(tmp, 'pkg_data.json')
+        snap_path = os.path.join(tmp, 'pkg_data.snap')
+        write_json_store(json_path, n)
+
+        src, json_load = timed(lambda: DemoIBE(store_path=json_path, keystore='json'))
+        _, export = timed(lambda: src.export_snapshot(snap_path))
+        del src
+
+        def scan(use_mmap):
+            with Snapshot(snap_path, use_mmap=use_mmap) as snap:
+                return sum(1 for _ in snap)
+        _, direct_open = timed(lambda: Snapshot(snap_path, use_mmap=False).close())
+        _, direct_scan = timed(lambda: scan(False))
+        layered, mmap_open = timed(lambda: DemoIBE(store_path=os.path.join(tmp, 'layered.json'),
+                                                   keystore='json', snapshot=snap_path))
+        _, lookup_time = timed(lambda: [layered.get_pubkey_for_identity(p) for p in probes])
+        restored = DemoIBE(store_path=os.path.join(tmp, 'restored.json'), keystore='compact')
+        _, restore = timed(lambda: restored.load_snapshot(snap_path))
+        sizes = {p: os.path.getsize(os.path.join(tmp, p)) for p in ('pkg_data.json', 'pkg_data.snap')}
+    finally:
+        shutil.rmtree(tmp)
+
+    print(f'{n} identities')
+    print(f'  JSON store:       {sizes["pkg_data.json"] / 2**20:7.1f} MiB, load {json_load:7.2f} s')
+    print(f'  snapshot:         {sizes["pkg_data.snap"] / 2**20:7.1f} MiB, export {export:.2f} s')
+    print(f'    direct read     {direct_open:7.2f} s (full scan {direct_scan:.2f} s)')
+    print(f'    mmap (in place) {mmap_open * 1e3:7.2f} ms, {args.lookups / lookup_time / 1e3:.1f} k lookups/s')
+    print(f'    restore into compact keystore {restore:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""PKG startup benchmark: time to first served request for a large keystore.
+
+Writes a `--identities` JSON keystore, then boots `pkg/server.py` in a
+subprocess several ways and measures, from process start, when the first
+`GET /mpk` and the first `GET /get_pubkey` are answered:
+
+- cold:  fresh master keys every boot (no sealing secret) and the keystore
+         read before serving — the behaviour before sealed master keys;
+- warm:  master keys unsealed from `pkg_data.master`, keystore opened in the
+         background (PKG_LAZY_KEYSTORE=1);
+- warm, compact keystore (IBE_KEYSTORE=compact), if `--compact`.
+
+Each warm configuration is booted once beforehand to seal the keys (and, for
+compact, to migrate the store).
+
+Usage:
+    python scripts/bench_startup.py [--identities N] [--port P] [--compact]
+"""
+import sys
+import os
+import argparse
+import base64
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_json_store(path, n):
+    # DemoIBE's store layout, streamed
+    with open(path, 'w', encoding='utf8') as f:
+        f.write('{"mpk": {"version": 1}, "store_id": "0123456789abcdef", "seq": %d, "identities": {' % n)
+        for i in range(n):
+            pub = base64.b64encode(i.to_bytes(8, 'big') * 4).decode('ascii')
+            priv = base64.b64encode((i + 1).to_bytes(8, 'big') * 4).decode('ascii')
+            f.write('%s"user%d@example.com": %s' % (',' if i else '', i,
+                                                     json.dumps({'pub': pub, 'priv': priv, 'seq': i + 1})))
+        f.write('}}')
+
+
+def boot(port, env, probe):
+    """Start the PKG; returns (seconds to first /mpk, seconds to first /get_pubkey)."""
+    code = ('import logging; from werkzeug.serving import make_server; from pkg import server; '
+            'logging.getLogger("werkzeug").setLevel(logging.ERROR); '
+            'make_server("127.0.0.1", %d, server.app, threaded=True).serve_forever()' % port)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=ROOT, **env),
+                            stdout=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:%d' % port
+    s = requests.Session()
+    try:
+        first = None
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError('PKG exited with %d' % proc.returncode)
+            try:
+                if first is None and s.get(url + '/mpk', timeout=60).status_code == 200:
+                    first = time.perf_counter() - start
+                if first is not None and s.get(url + '/get_pubkey', params={'identity': probe},
+                                               timeout=60).status_code == 200:
+                    return first, time.perf_counter() - start
+            except requests.ConnectionError:
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PKG time to first request')
+    parser.add_argument('--identities', type=int, default=1_000_000)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--compact', action='store_true', help='also measure the compact keystore')
+    args = parser.parse_args()
+    probe = 'user%d@example.com' % (args.identities // 2)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        store = os.path.join(tmp, 'pkg_data.json')
+        write_json_store(store, args.identities)
+        base = {'PKG_STORE_PATH': store, 'PKG_ADMISSION': '0'}
+        runs = [('cold (setup + eager load)', dict(base, PKG_LAZY_KEYSTORE='0'), False),
+                ('warm (sealed keys, lazy load)', dict(base, PKG_MASTER_SEAL_KEY='ab' * 32), True)]
+        if args.compact:
+            runs.append(('warm, compact keystore', dict(base, PKG_MASTER_SEAL_KEY='ab' * 32, IBE_KEYSTORE='compact'),
+                         True))
+        print(f'{args.identities} identities')
+        for label, env, prime in runs:
+            if prime:
+                boot(args.port, env, probe)
+            mpk, pubkey = boot(args.port, env, probe)
+            print(f'  {label:32} first /mpk {mpk * 1e3:8.0f} ms, first /get_pubkey {pubkey * 1e3:8.0f} ms')
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark /api/decrypt throughput of the web interface.
+
+Drives the Flask app in-process through its test client so the numbers reflect
+request handling + key lookup + decryption, without network noise. For
+comparison it also times the old per-call path (base64-decode the stored key
+and rebuild the X25519 object before every decrypt).
+
+Usage:
+    python scripts/bench_web_decrypt.py [--requests N] [--identities K]
+"""
+import sys
+import os
+import argparse
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_interface
+from ibe.crypto_iface import b64, ub64, load_private_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/decrypt throughput')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--identities', type=int, default=50)
+    args = parser.parse_args()
+
+    demo = web_interface.demo
+    identities = [f'bench{i}@example.com' for i in range(args.identities)]
+    keys = {ident: demo.extract(web_interface.MSK, ident) for ident in identities}
+    envelopes = {ident: demo.encrypt(ident, b'benchmark message ' * 8) for ident in identities}
+
+    client = web_interface.app.test_client()
+    with client.session_transaction() as sess:
+        sess['sid'] = 'bench-session'
+    for ident, priv in keys.items():
+        web_interface.extracted_keys.set(('bench-session', ident), load_private_key(priv))
+
+    start = time.perf_counter()
+    for i in range(args.requests):
+        ident = identities[i % len(identities)]
+        r = client.post('/api/decrypt', json={'identity': ident, 'envelope': envelopes[ident]})
+        assert r.status_code == 200, r.get_json()
+    elapsed = time.perf_counter() - start
+    print(f'/api/decrypt: {args.requests} requests in {elapsed:.3f}s '
+          f'-> {args.requests / elapsed:,.0f} req/s')
+
+    # Crypto-only comparison: cached key object vs decode + parse on every call
+    stored_b64 = {ident: b64(priv) for ident, priv in keys.items()}
+    parsed = {ident: load_private_key(priv) for ident, priv in keys.items()}
+    for label, get_key in (('decode per call', lambda ident: ub64(stored_b64[ident])),
+                           ('cached key object', lambda ident: parsed[ident])):
+        start = time.perf_counter()
+        for i in range(args.requests):
+            ident = identities[i % len(identities)]
+            demo.decrypt(get_key(ident), envelopes[ident])
+        elapsed = time.perf_counter() - start
+        print(f'decrypt ({label}): {args.requests / elapsed:,.0f} ops/s')
+
+    print('key cache stats:', web_interface.extracted_keys.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Load generator for the decrypting inbound gateway (`mail/inbound.py`).
+
+By default it is self-contained: it creates a temporary key directory and
+Maildir root, starts a gateway in-process, pre-encrypts a batch of messages
+and pushes them through several parallel SMTP connections. Pass --host/--port
+(plus --keys pointing at the gateway's key directory) to load an already
+running gateway instead.
+
+Usage:
+    python scripts/inbound_loadgen.py [--messages N] [--connections C] [--recipients R]
+"""
+import sys
+import os
+import argparse
+import shutil
+import smtplib
+import socket
+import tempfile
+import threading
+import time
+from email.message import EmailMessage
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ibe.crypto_iface import DemoIBE, b64, encrypt_multi
+from mail.ibe_mime import wrap_encrypted
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_messages(demo, msk, keys_dir, recipients, count, body_size):
+    identities = [f'user{i}@example.com' for i in range(recipients)]
+    pubs = {}
+    for ident in identities:
+        priv = demo.extract(msk, ident)
+        with open(os.path.join(keys_dir, ident + '.key'), 'w', encoding='ascii') as f:
+            f.write(b64(priv))
+        pubs[ident] = demo.get_pubkey_for_identity(ident)
+    body = ('Quarterly report line item, amount 1234.56 EUR\n' * (body_size // 48 + 1))[:body_size]
+    messages = []
+    for i in range(count):
+        ident = identities[i % len(identities)]
+        msg = EmailMessage()
+        msg['From'] = 'loadgen@example.org'
+        msg['To'] = ident
+        msg['Subject'] = f'load test {i}'
+        msg.set_content(body)
+        raw = msg.as_bytes()
+        messages.append((ident, wrap_encrypted(msg, encrypt_multi([pubs[ident]], raw)).as_bytes()))
+    return messages
+
+
+def send_all(host, port, messages, connections):
+    errors = []
+
+    def worker(chunk):
+        try:
+            with smtplib.SMTP(host, port) as s:
+                for rcpt, data in chunk:
+                    try:
+                        s.sendmail('loadgen@example.org', [rcpt], data)
+                    except smtplib.SMTPResponseException as e:
+                        errors.append(e)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(messages[i::connections],)) for i in range(connections)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load generator for the inbound IBE gateway')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--recipients', type=int, default=100)
+    parser.add_argument('--body-size', type=int, default=4096)
+    parser.add_argument('--pool', choices=('process', 'thread'), default='process')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--host', default=None, help='Target an already running gateway')
+    parser.add_argument('--port', type=int, default=2526)
+    parser.add_argument('--keys', default=None, help='Key directory of the running gateway')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ibe-loadgen-')
+    keys_dir = args.keys or os.path.join(workdir, 'keys')
+    os.makedirs(keys_dir, exist_ok=True)
+    demo = DemoIBE(store_path=os.path.join(workdir, 'pkg_data.json'))
+    _, msk = demo.setup()
+    print(f'Preparing {args.messages} encrypted messages for {args.recipients} recipients...')
+    messages = build_messages(demo, msk, keys_dir, args.recipients, args.messages, args.body_size)
+
+    controller = handler = None
+    host, port = args.host, args.port
+    if host is None:
+        from aiosmtpd.controller import Controller
+        from mail.inbound import InboundGatewayHandler, KeyDirectory, make_executor
+        host, port = '127.0.0.1', free_port()
+        handler = InboundGatewayHandler(KeyDirectory(keys_dir), os.path.join(workdir, 'Maildir'),
+                                        make_executor(args.pool, args.workers))
+        controller = Controller(handler, hostname=host, port=port)
+        controller.start()
+
+    try:
+        elapsed, errors = send_all(host, port, messages, args.connections)
+        print(f'Sent {len(messages)} messages over {args.connections} connections in {elapsed:.2f}s '
+              f'-> {len(messages) / elapsed:,.0f} msg/s')
+        if errors:
+            print(f'{len(errors)} errors, first: {errors[0]}')
+        if handler is not None:
+            print('gateway stats:', handler.snapshot())
+    finally:
+        if controller is not None:
+            controller.stop()
+            handler.executor.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Load harness for PKG admission control.
+
+Starts `pkg/server.py`'s Flask app on a threaded local server backed by a
+temporary keystore of `--identities` keys. OTP checks are stubbed out and OTP
+mail takes `--smtp-ms` to send. Two kinds of client run at once:
+
+- steady readers calling `GET /get_pubkey` in a loop,
+- a burst of `--burst` concurrent clients calling `/extract` (a keystore
+  rewrite per new identity) and `/request_extract_code` (a slow SMTP send).
+
+The run is done twice, with admission control off and then on. For each it
+reports read latency percentiles and, per route, how many requests succeeded
+or were shed with 503.
+
+Usage:
+    python scripts/pkg_loadgen.py [--identities N] [--readers R] [--burst B] [--seconds S] [--smtp-ms MS]
+"""
+import sys
+import os
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from collections import Counter
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+from ibe.crypto_iface import DemoIBE
+from pkg.admission import AdmissionController
+
+
+def start_pkg(store_path, identities, smtp_delay):
+    from pkg import server
+    server.pkg = DemoIBE(store_path=store_path)
+    server.pkg.setup()
+    for identity in identities:
+        server.pkg.extract(server.MSK, identity)
+    server.verify_otp = lambda identity, otp: None
+    server.request_otp = lambda identity: time.sleep(smtp_delay) or True
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return server, httpd, 'http://127.0.0.1:%d' % httpd.server_port
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float('nan')
+
+
+def run(url, identities, readers, burst, seconds, label):
+    stop = time.monotonic() + seconds
+    latencies = []
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def reader(i):
+        s = requests.Session()
+        n = 0
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            r = s.get(url + '/get_pubkey', params={'identity': identities[(i * 7919 + n) % len(identities)]})
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+                outcomes['read', r.status_code] += 1
+            n += 1
+
+    def burster(i):
+        s = requests.Session()
+        n = 0
+        while time.monotonic() < stop:
+            if i % 2:
+                r = s.post(url + '/extract', json={'identity': f'{label}-new{i}-{n}@example.com', 'otp': '0'})
+                kind = 'extract'
+            else:
+                r = s.post(url + '/request_extract_code', json={'identity': f'user{i}@example.com'})
+                kind = 'otp'
+            with lock:
+                outcomes[kind, r.status_code] += 1
+            if r.status_code == 503:
+                time.sleep(min(float(r.headers.get('Retry-After', '1')), 0.2))
+            n += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=burster, args=(i,)) for i in range(burst)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(f'admission {label}:')
+    print(f'  reads: {len(latencies)} requests, p50 {pct(latencies, 50):7.1f} ms, '
+          f'p99 {pct(latencies, 99):7.1f} ms, max {pct(latencies, 100):7.1f} ms')
+    for kind in ('read', 'extract', 'otp'):
+        codes = {code: n for (k, code), n in sorted(outcomes.items()) if k == kind}
+        print(f'  {kind:>8}: ' + ', '.join(f'{code}: {n}' for code, n in codes.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PKG admission control load harness')
+    parser.add_argument('--identities', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--burst', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--smtp-ms', type=float, default=200.0)
+    args = parser.parse_args()
+
+    identities = ['user%d@example.com' % i for i in range(args.identities)]
+    with tempfile.TemporaryDirectory() as d:
+        server, httpd, url = start_pkg(os.path.join(d, 'pkg_data.json'), identities, args.smtp_ms / 1000)
+        try:
+            server.admission = None
+            run(url, identities, args.readers, args.burst, args.seconds, 'off')
+            server.admission = AdmissionController()
+            run(url, identities, args.readers, args.burst, args.seconds, 'on')
+            print('  controller:', server.admission.stats())
+        finally:
+            httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Render traces exported by `ibe.tracing` as waterfalls with their critical path.
+
+Reads one or more JSON-lines span files (`IBE_TRACE=file`, or
+`RingExporter.dump`). Client and PKG processes can write separate files; the
+spans are joined on their trace ids. Without `--trace` it lists the slowest
+traces and draws the slowest one.
+
+The critical path starts at the root span and repeatedly follows the child
+that finished last. Time on that path not covered by a child is the span's own
+(self) time, which is where a slow send actually spent its time.
+
+Usage:
+    python scripts/trace_view.py traces.jsonl [more.jsonl ...] [--trace ID] [--top N] [--width W]
+"""
+import sys
+import argparse
+import json
+from collections import defaultdict
+
+
+def load(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    s = json.loads(line)
+                    traces[s['trace_id']].append(s)
+    return traces
+
+
+def end(s):
+    return s['start'] + (s['duration'] or 0)
+
+
+def tree(spans):
+    ids = {s['span_id'] for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for s in sorted(spans, key=lambda s: s['start']):
+        if s['parent_id'] in ids:
+            children[s['parent_id']].append(s)
+        else:
+            roots.append(s)  # true root, or parent span is in a file we were not given
+    return roots, children
+
+
+def extent(spans):
+    t0 = min(s['start'] for s in spans)
+    return t0, max(end(s) for s in spans) - t0
+
+
+def critical_path(roots, children):
+    node = max(roots, key=lambda s: end(s) - s['start'])
+    path = []
+    while node is not None:
+        kids = children.get(node['span_id'], [])
+        covered = sum(k['duration'] or 0 for k in kids)
+        path.append((node, max(0.0, (node['duration'] or 0) - covered)))
+        node = max(kids, key=end) if kids else None
+    return path
+
+
+def render(trace_id, spans, width):
+    roots, children = tree(spans)
+    t0, total = extent(spans)
+    scale = width / total if total else 0
+    on_path = {s['span_id'] for s, _ in critical_path(roots, children)}
+    print(f'trace {trace_id}  {len(spans)} spans  {total * 1e3:.2f} ms')
+
+    def walk(s, depth):
+        offset = s['start'] - t0
+        dur = s['duration'] or 0
+        left = int(offset * scale)
+        bar = ' ' * left + '#' * max(1, int(dur * scale))
+        mark = '*' if s['span_id'] in on_path else ' '
+        label = ('  ' * depth + s['name'])[:40]
+        extra = ''
+        if s.get('error'):
+            extra = ' !' + s['error']
+        elif s.get('attrs'):
+            extra = ' ' + ' '.join(f'{k}={v}' for k, v in s['attrs'].items())
+        print(f'{mark} {label:<40} {offset * 1e3:9.2f} {dur * 1e3:9.2f} |{bar:<{width}}|{extra}')
+        for child in children.get(s['span_id'], []):
+            walk(child, depth + 1)
+
+    print(f'  {"span":<40} {"start ms":>9} {"dur ms":>9}')
+    for r in roots:
+        walk(r, 0)
+    print('critical path (* above):')
+    for s, self_time in critical_path(roots, children):
+        print(f'  {s["name"]:<40} {(s["duration"] or 0) * 1e3:9.2f} ms  self {self_time * 1e3:9.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trace waterfall viewer')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--trace', help='trace id (prefix) to render')
+    parser.add_argument('--top', type=int, default=10, help='slowest traces to list')
+    parser.add_argument('--width', type=int, default=50)
+    args = parser.parse_args()
+
+    traces = load(args.files)
+    if not traces:
+        print('no spans found')
+        return 1
+    if args.trace:
+        matches = [t for t in traces if t.startswith(args.trace)]
+        if not matches:
+            print('no trace matching', args.trace)
+            return 1
+        for t in matches:
+            render(t, traces[t], args.width)
+        return 0
+    ranked = sorted(traces, key=lambda t: extent(traces[t])[1], reverse=True)
+    print(f'{len(traces)} traces; slowest:')
+    for t in ranked[:args.top]:
+        roots, _ = tree(traces[t])
+        print(f'  {t}  {extent(traces[t])[1] * 1e3:9.2f} ms  {len(traces[t]):4d} spans  {roots[0]["name"]}')
+    print()
+    render(ranked[0], traces[ranked[0]], args.width)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
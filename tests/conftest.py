@@ -0,0 +1,17 @@
+"""Make the repository's packages importable when the suite is run with plain `pytest`,
+and keep `pkg.server`'s import-time keystore out of the developer's working tree."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _server_store_path(tmp_path_factory):
+    # pkg/server.py opens PKG_STORE_PATH (default: the repo's pkg_data.json) when first imported
+    mp = pytest.MonkeyPatch()
+    mp.setenv('PKG_STORE_PATH', str(tmp_path_factory.mktemp('pkg') / 'pkg_data.json'))
+    yield
+    mp.undo()
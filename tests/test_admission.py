@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from pkg.admission import AdmissionController, Overloaded, route_class
+
+
+def test_route_classes():
+    assert route_class('/get_pubkey') == 'read'
+    assert route_class('/extract') == 'extract'
+    assert route_class('/request_extract_code') == 'otp'
+
+
+def test_queue_full_and_wait_timeout_shed():
+    ac = AdmissionController({'otp': 1}, target=1.0, interval=1.0, max_wait=0.05, queue_factor=1)
+    ac.acquire('otp')
+    t0 = time.monotonic()
+    with pytest.raises(Overloaded) as e:
+        ac.acquire('otp')  # waits max_wait for the single slot
+    assert e.value.reason == 'waited too long' and time.monotonic() - t0 >= 0.05
+    assert e.value.retry_after >= 1
+    ac.release('otp')
+    with ac.admit('otp'):
+        assert ac.stats()['otp']['inflight'] == 1
+    assert ac.stats()['otp']['shed'] == 1
+
+
+def test_codel_sheds_arrivals_until_delay_recovers():
+    now = [0.0]
+    ac = AdmissionController({'extract': 1}, target=0.01, interval=0.1, max_wait=10, clock=lambda: now[0])
+    c = ac.classes['extract']
+    ac._observe(c, 0.5, 0.0)
+    ac._observe(c, 0.5, 0.2)   # above target for a whole interval
+    assert c.dropping
+    ac.acquire('extract')      # free slot, no queue: admitted, and zero delay ends dropping
+    assert not c.dropping
+    ac._observe(c, 0.5, 1.0)
+    ac._observe(c, 0.5, 1.2)
+    with pytest.raises(Overloaded) as e:
+        ac.acquire('extract')  # would have to queue while dropping
+    assert e.value.reason == 'queue delay above target'
+
+
+def test_reads_unaffected_by_slow_otp_burst(tmp_path, monkeypatch):
+    from pkg import server
+    from ibe.crypto_iface import DemoIBE
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    demo.setup()
+    demo.extract(server.MSK, 'alice@example.com')
+    monkeypatch.setattr(server, 'pkg', demo)
+    monkeypatch.setattr(server, 'admission',
+                        AdmissionController({'read': 8, 'extract': 1, 'otp': 1}, max_wait=0.05, queue_factor=1))
+    release = threading.Event()
+    monkeypatch.setattr(server, 'request_otp', lambda identity: release.wait(5))
+
+    slow = threading.Thread(target=lambda: server.app.test_client().post(
+        '/request_extract_code', json={'identity': 'alice@example.com'}))
+    slow.start()
+    while server.admission.stats()['otp']['inflight'] == 0:
+        time.sleep(0.005)
+    client = server.app.test_client()
+    r = client.post('/request_extract_code', json={'identity': 'bob@example.com'})
+    assert r.status_code == 503 and int(r.headers['Retry-After']) >= 1
+    assert client.get('/get_pubkey', query_string={'identity': 'alice@example.com'}).status_code == 200
+    release.set()
+    slow.join()
+    assert server.admission.stats()['otp']['inflight'] == 0
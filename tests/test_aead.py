@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from ibe import aead
+from ibe.crypto_iface import DemoIBE, decrypt_envelope
+from ibe.seekable import SeekableReader, SeekableWriter
+
+
+@pytest.fixture
+def demo(tmp_path):
+    d = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = d.setup()
+    return d, d.extract(msk, 'alice@example.com')
+
+
+@pytest.mark.parametrize('suite', [aead.CHACHA20_POLY1305, aead.AES_256_GCM])
+def test_roundtrip_per_suite(demo, suite):
+    d, priv = demo
+    d.aead_suite = suite
+    env = d.encrypt('alice@example.com', b'quarterly figures')
+    assert env['suite'] == suite
+    assert d.decrypt(priv, env) == b'quarterly figures'
+
+
+def test_mixed_suites_interoperate(demo, tmp_path):
+    d, priv = demo
+    other = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'), aead_suite=aead.AES_256_GCM)
+    env = other.encrypt('alice@example.com', b'from an AES-GCM sender')
+    d.aead_suite = aead.CHACHA20_POLY1305
+    assert d.decrypt(priv, env) == b'from an AES-GCM sender'
+
+    pub = d.get_pubkeys_for_identities(['alice@example.com'])['alice@example.com']
+    multi = other.encrypt_multi({'alice@example.com': pub}, b'group note')
+    assert multi['suite'] == aead.AES_256_GCM
+    assert decrypt_envelope(priv, multi) == b'group note'
+
+
+def test_envelope_without_suite_is_chacha(demo):
+    d, priv = demo
+    d.aead_suite = aead.CHACHA20_POLY1305
+    env = d.encrypt('alice@example.com', b'legacy')
+    del env['suite']
+    assert d.decrypt(priv, env) == b'legacy'
+
+
+def test_suite_selection(monkeypatch):
+    monkeypatch.setattr(aead, '_selected', None)
+    assert aead.preferred_suite() in aead.SUITES
+    assert aead.set_preferred_suite('aes-256-gcm') == aead.AES_256_GCM
+    assert aead.preferred_suite() == aead.AES_256_GCM
+    with pytest.raises(ValueError):
+        aead.set_preferred_suite('rot13')
+
+
+def test_seekable_records_suite(demo, tmp_path):
+    import io
+    d, priv = demo
+    pub = d.get_pubkeys_for_identities(['alice@example.com'])['alice@example.com']
+    buf = io.BytesIO()
+    with SeekableWriter(buf, pub, block_size=1024, suite=aead.AES_256_GCM) as w:
+        w.write(os.urandom(5000))
+    reader = SeekableReader(buf.getvalue(), priv)
+    assert reader.suite == aead.AES_256_GCM
+    assert len(reader.read(1000, 2000)) == 2000
@@ -0,0 +1,80 @@
+import glob
+import threading
+
+import pytest
+
+from ibe.crypto_iface import DemoIBE
+from pkg.audit import AuditLog, AuditUnavailable, identity_hash, iter_events
+
+
+def test_group_commit_records_every_event(tmp_path):
+    path = str(tmp_path / 'extract.log')
+    audit = AuditLog(path, window=0.05).start()
+
+    def issue(n):
+        for i in range(50):
+            audit.record('user%d@example.com' % n, '10.0.0.%d' % n, 'issued', ts=1000.0 + i)
+    threads = [threading.Thread(target=issue, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    seq = audit.record('Alice@Example.com', '10.0.0.9', 'invalid', ts=2000.0)
+    assert audit.wait(seq)
+    audit.close()
+
+    stats = audit.stats()
+    assert stats['committed'] == 401 and stats['commits'] < 401  # fsyncs were shared
+    assert len(list(iter_events(path))) == 401
+    assert list(iter_events(path, identities=['alice@example.com'])) == [
+        {'ts': 2000.0, 'id': identity_hash('alice@example.com'), 'ip': '10.0.0.9', 'result': 'invalid'}]
+    assert len(list(iter_events(path, identities=['user3@example.com'], since=1010, until=1019))) == 10
+    with pytest.raises(AuditUnavailable):
+        audit.record('alice@example.com', None, 'issued')  # closed
+
+
+def test_rotation_compression_and_torn_lines(tmp_path):
+    path = str(tmp_path / 'extract.log')
+    with open(path, 'w') as f:
+        f.write('{"ts": 1.0, "id": "x", "ip": null, "result": "iss')  # torn by a crash
+    audit = AuditLog(path, window=0, rotate_bytes=2000).start()
+    for i in range(100):
+        audit.wait(audit.record('user%d@example.com' % i, None, 'issued', ts=1000.0 + i))
+    audit.close()
+
+    rotated = glob.glob(path + '.*')
+    assert rotated and all(f.endswith('.gz') for f in rotated)
+    events = list(iter_events(path))
+    assert [e['ts'] for e in events] == [1000.0 + i for i in range(100)]
+    assert [e['ts'] for e in iter_events(path, since=1090)] == [1090.0 + i for i in range(10)]
+
+
+def test_full_buffer_refuses_instead_of_dropping(tmp_path):
+    audit = AuditLog(str(tmp_path / 'extract.log'), buffer=2, block=0.05)  # writer not started
+    audit.record('a@example.com', None, 'issued')
+    audit.record('b@example.com', None, 'issued')
+    with pytest.raises(AuditUnavailable):
+        audit.record('c@example.com', None, 'issued')
+    assert audit.stats()['blocked'] == 1
+
+
+def test_server_audits_extract(tmp_path, monkeypatch):
+    from pkg import server
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    demo.setup()
+    path = str(tmp_path / 'extract.log')
+    audit = AuditLog(path, window=0).start()
+    monkeypatch.setattr(server, 'pkg', demo)
+    monkeypatch.setattr(server, 'audit', audit)
+    monkeypatch.setattr(server, 'PKG_AUDIT_SYNC', True)
+    client = server.app.test_client()
+
+    monkeypatch.setattr(server, 'verify_otp', lambda identity, otp: 'invalid')
+    assert client.post('/extract', json={'identity': 'alice@example.com', 'otp': '1'}).status_code == 401
+    monkeypatch.setattr(server, 'verify_otp', lambda identity, otp: None)
+    assert client.post('/extract', json={'identity': 'alice@example.com', 'otp': '1'}).status_code == 200
+    audit.close()
+    # A closed log cannot record the issuance, so no key is handed out
+    assert client.post('/extract', json={'identity': 'alice@example.com', 'otp': '1'}).status_code == 503
+    assert [(e['ip'], e['result']) for e in iter_events(path, identities=['alice@example.com'])] == [
+        ('127.0.0.1', 'invalid'), ('127.0.0.1', 'issued')]
@@ -0,0 +1,81 @@
+from ibe.bloom import BloomFilter
+from ibe.crypto_iface import DemoIBE
+
+
+def test_no_false_negatives_and_bounded_false_positives():
+    f = BloomFilter(capacity=5000, fp_rate=0.01)
+    members = ['user%d@example.com' % i for i in range(5000)]
+    f.update(members)
+    assert all(m in f for m in members)
+    fp = sum('other%d@example.org' % i in f for i in range(20000)) / 20000
+    assert fp < 0.02
+
+    g = BloomFilter.from_bytes(f.to_bytes())
+    assert (g.m, g.k, len(g)) == (f.m, f.k, len(f))
+    assert all(m in g for m in members[:100])
+
+
+def test_from_bytes_rejects_bad_headers():
+    import struct
+    import pytest
+    data = BloomFilter(capacity=100, fp_rate=0.01).to_bytes()
+    header = struct.Struct('>8sBB2xQQ')
+    magic, version, k, m, count = header.unpack_from(data)
+    for bad in (header.pack(magic, version, 0, m, count) + data[header.size:],   # k = 0 matches everything
+                header.pack(magic, version, k, 0, count),                          # nothing to probe
+                header.pack(magic, version, k, m * 2, count) + data[header.size:], # bit array too short
+                data + b'\0',
+                b'IBEBLOM2' + data[8:]):
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(bad)
+
+
+def test_demo_filter_tracks_extract(tmp_path, monkeypatch):
+    import ibe.crypto_iface as ci
+    monkeypatch.setattr(ci, 'PKG_BLOOM_CAPACITY', 4)
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    demo.extract(msk, 'alice@example.com')
+    bloom = demo.identity_filter()
+    assert 'alice@example.com' in bloom
+    demo.extract(msk, 'bob@example.com')
+    assert 'bob@example.com' in demo.identity_filter()
+    for i in range(5):
+        demo.extract(msk, 'u%d@example.com' % i)
+    rebuilt = demo.identity_filter()
+    assert rebuilt is not bloom and rebuilt.capacity >= 14
+    assert all('u%d@example.com' % i in rebuilt for i in range(5))
+
+
+def test_filter_rebuild_never_misses_concurrent_extracts(tmp_path):
+    import threading
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    epoch = demo.epochs.current()
+    errors, done = [], threading.Event()
+
+    def issue(n):
+        for i in range(150):
+            demo.extract(msk, 'user%d-%d@example.com' % (n, i))
+            demo.extract(msk, 'user%d-%d@example.com|%s' % (n, i, epoch))
+
+    def rebuild():
+        while not done.is_set():
+            try:
+                demo._bloom = None  # force a rebuild while keys are being issued
+                demo.identity_filter()
+            except Exception as e:
+                errors.append(e)
+    builder = threading.Thread(target=rebuild)
+    builder.start()
+    threads = [threading.Thread(target=issue, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    builder.join()
+    bloom = demo.identity_filter()
+    assert not errors
+    assert all('user%d-%d@example.com' % (n, i) in bloom and 'user%d-%d@example.com|%s' % (n, i, epoch) in bloom
+               for n in range(4) for i in range(150))
@@ -0,0 +1,36 @@
+"""Test the bounded LRU/TTL cache used for parsed keys."""
+from ibe.cache import LRUTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = LRUTTLCache(max_entries=2, ttl=None)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    # Touch 'a' so 'b' becomes least recently used
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['size'] == 2
+    assert stats['evictions'] == 1
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = LRUTTLCache(max_entries=10, ttl=5, clock=clock)
+    cache.set(('sid', 'alice@example.com'), 'key')
+    clock.now = 4.9
+    assert cache.get(('sid', 'alice@example.com')) == 'key'
+    clock.now = 5.0
+    assert cache.get(('sid', 'alice@example.com')) is None
+    assert cache.stats()['expirations'] == 1
+    assert len(cache) == 0
@@ -14,3 +14,16 @@ def test_canonicalize_identity():
     assert canonicalize_identity(f'test{composed}@example.com') == canonicalize_identity(f'test{decomposed}@example.com')
     # Combined test
     assert canonicalize_identity('  Alice@EXAMPLE.com  ') == 'alice@example.com'
+
+
+def test_idna_domains_match_unicode_form():
+    assert canonicalize_identity('User@XN--BCHER-KVA.Example') == 'user@bücher.example'
+    assert canonicalize_identity('user@bücher。example') == 'user@bücher.example'
+    # Malformed punycode is kept as-is rather than rejected
+    assert canonicalize_identity('user@xn--zz-.example') == 'user@xn--zz-.example'
+
+
+def test_canonicalize_many():
+    from ibe.crypto_iface import canonicalize_many
+    out = canonicalize_many([' Bob@Example.com', 'bob@example.com ', 'Zoë@XN--BCHER-KVA.example'])
+    assert out == ['bob@example.com', 'bob@example.com', 'zoë@bücher.example']
@@ -0,0 +1,98 @@
+import json
+import os
+
+import pytest
+
+from ibe.compact_store import CompactKeyStore
+from ibe.crypto_iface import DemoIBE
+
+
+def _key(i):
+    return i.to_bytes(4, 'big') * 8
+
+
+def test_add_lookup_grow_and_reopen(tmp_path):
+    d = str(tmp_path / 'keys')
+    store = CompactKeyStore(d)
+    n = 3000  # forces several index doublings past the 1024-slot minimum
+    for i in range(n):
+        store.add('user%d@example.com' % i, _key(i), _key(i), i + 1)
+    assert len(store) == n
+    assert store.get_pub('user1234@example.com') == _key(1234)
+    assert store.get_seq('user1234@example.com') == 1235
+    assert 'nobody@example.com' not in store
+    with pytest.raises(KeyError):
+        store.add('user1@example.com', _key(1), _key(1), n + 1)
+    store.add('ü@bücher.example', b'\x01' * 32, b'\x02' * 32, n + 1)
+    store.close()
+
+    for use_mmap in (False, True):
+        again = CompactKeyStore(d, use_mmap=use_mmap)
+        assert len(again) == n + 1
+        assert again.get_priv('ü@bücher.example') == b'\x02' * 32
+        assert again.get_pub('user2999@example.com') == _key(2999)
+        assert [e[0] for e in again.entries_after(n - 2, 10)] == [n - 1, n, n + 1]
+        again.close()
+    with pytest.raises(ValueError):
+        CompactKeyStore(d, use_mmap=True).add('x@example.com', b'\0' * 32, b'\0' * 32, 1)
+
+
+def test_unflushed_appends_are_reindexed(tmp_path):
+    d = str(tmp_path / 'keys')
+    store = CompactKeyStore(d)
+    store.add('a@example.com', b'\x01' * 32, b'\x02' * 32, 1)
+    store.flush()
+    store.add('b@example.com', b'\x03' * 32, b'\x04' * 32, 2)  # no flush: index on disk is stale
+    again = CompactKeyStore(d)
+    assert again.get_pub('b@example.com') == b'\x03' * 32
+
+
+def _indexed(directory):
+    # Record count covered by the index on disk
+    import struct
+    with open(os.path.join(directory, 'index.bin'), 'rb') as f:
+        return struct.unpack('<8sQQ', f.read(24))[1]
+
+
+def test_index_is_flushed_periodically_and_on_close(tmp_path):
+    d = str(tmp_path / 'keys')
+    store = CompactKeyStore(d, flush_every=10, flush_interval=3600)
+    for i in range(25):
+        store.add('user%d@example.com' % i, _key(i), _key(i), i + 1)
+    assert _indexed(d) == 20
+    store.close()
+    assert _indexed(d) == 25
+    store.close()  # closing twice is harmless
+    store.flush()
+
+    path = str(tmp_path / 'pkg_data.json')
+    demo = DemoIBE(store_path=path, keystore='compact')
+    _, msk = demo.setup()
+    demo.extract(msk, 'alice@example.com')
+    demo.close()
+    assert _indexed(str(tmp_path / 'pkg_data.keys')) == 1
+
+
+def test_demo_compact_keystore_migrates_and_matches_json(tmp_path):
+    path = str(tmp_path / 'pkg_data.json')
+    demo = DemoIBE(store_path=path)
+    _, msk = demo.setup()
+    alice = demo.extract(msk, 'alice@example.com')
+    demo.extract(msk, 'bob@example.com')
+
+    compact = DemoIBE(store_path=path, keystore='compact')
+    assert compact.extract(msk, 'Alice@Example.com') == alice
+    assert compact.get_pubkey_for_identity('bob@example.com') == demo.get_pubkey_for_identity('bob@example.com')
+    carol = compact.extract(msk, 'carol@example.com')
+    assert compact.store['seq'] == 3
+    with open(path, encoding='utf8') as f:
+        assert json.load(f)['identities'] == {}
+
+    page = compact.changes_since(1, limit=1)
+    assert [c['identity'] for c in page['changes']] == ['bob@example.com'] and page['more']
+    assert 'carol@example.com' in compact.identity_filter()
+    assert set(compact.get_pubkeys_for_identities(['alice@example.com', 'x@example.com'])) == {'alice@example.com'}
+
+    reopened = DemoIBE(store_path=path, keystore='compact')
+    env = reopened.encrypt('carol@example.com', b'hi')
+    assert reopened.decrypt(carol, env) == b'hi'
@@ -0,0 +1,28 @@
+"""Test the pre-generated ephemeral keypair pool."""
+from ibe.crypto_iface import DemoIBE
+from ibe.eph_pool import EphemeralKeyPool
+
+
+def test_keys_are_single_use():
+    pool = EphemeralKeyPool(size=4, start=False)
+    pool.fill()
+    pubs = {pool.take()[1] for _ in range(4)}
+    assert len(pubs) == 4
+    # Handed-out keys are no longer referenced by the pool
+    assert len(pool) == 0
+    # An empty pool still serves keys but records the exhaustion
+    pool.take()
+    stats = pool.stats()
+    assert stats['exhausted'] == 1 and stats['taken'] == 5
+
+
+def test_encrypt_with_pool(tmp_path):
+    pool = EphemeralKeyPool(size=8, start=False)
+    pool.fill()
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'), eph_pool=pool)
+    _, msk = demo.setup()
+    priv = demo.extract(msk, 'alice@example.com')
+    envs = [demo.encrypt('alice@example.com', b'burst %d' % i) for i in range(3)]
+    assert len({e['ephemeral_pub'] for e in envs}) == 3
+    assert [demo.decrypt(priv, e) for e in envs] == [b'burst 0', b'burst 1', b'burst 2']
+    assert pool.stats()['available'] == 5
@@ -0,0 +1,89 @@
+import calendar
+import os
+
+import pytest
+
+from ibe.crypto_iface import DemoIBE, canonicalize_identity
+from ibe.epochs import EpochError, EpochKeyStore, epoch_at, epoch_start, next_epoch, split_epoch, with_epoch
+from pkg.epoch_scheduler import EpochScheduler, parse_hours
+
+NOV_2026 = calendar.timegm((2026, 11, 15, 12, 0, 0))
+
+
+def test_labels_and_split():
+    assert epoch_at(NOV_2026, 'month') == '202611'
+    assert next_epoch('202612', 'month') == '202701'
+    assert epoch_start('202612', 'month') == calendar.timegm((2026, 12, 1, 0, 0, 0))
+    assert epoch_at(3600 * 5 + 1, '3600') == '5' and next_epoch('5', '3600') == '6'
+    assert split_epoch('alice@example.com|202611', 'month') == ('alice@example.com', '202611')
+    # A '|' that is not followed by an epoch label is part of the identity
+    assert split_epoch('a|b@example.com', 'month') == ('a|b@example.com', None)
+    assert canonicalize_identity(' Bob@XN--Bcher-KVA.example|202611 ') == 'bob@bücher.example|202611'
+    assert parse_hours('22-4') == (22, 4) and parse_hours('') is None
+
+
+def test_issue_window_and_gc(tmp_path):
+    now = [NOV_2026]
+    store = EpochKeyStore(str(tmp_path / 'epochs'), retain=1, period='month', clock=lambda: now[0])
+    for epoch in ('202610', '202611', '202612'):
+        store.extract('alice@example.com', epoch)
+    pub, priv, created = store.extract('alice@example.com', '202611')
+    assert not created and store.get('alice@example.com', '202611') == (pub, priv)
+    with pytest.raises(EpochError):
+        store.extract('alice@example.com', '202701')  # two epochs ahead
+    with pytest.raises(EpochError):
+        store.extract('alice@example.com', '202609')  # past retention
+
+    now[0] = calendar.timegm((2027, 1, 2, 0, 0, 0))
+    assert store.gc() == ['202610', '202611']
+    assert store.epochs() == ['202612'] and store.get('alice@example.com', '202611') == (None, None)
+
+
+def test_epoch_identity_encrypts_and_decrypts(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    identity = with_epoch('alice@example.com', epoch_at(period=demo.epochs.period))
+    priv = demo.extract(msk, identity)
+    assert demo.extract(msk, identity.upper()) == priv
+    assert demo.extract(msk, 'alice@example.com') != priv  # the plain identity has its own key
+    ct = demo.encrypt(identity, b'rotating')
+    assert demo.decrypt(priv, ct) == b'rotating'
+    assert identity in demo.identity_filter()
+    assert os.path.isdir(str(tmp_path / 'pkg_data.epochs'))
+
+
+def test_scheduler_precomputes_next_epoch_for_active_identities(tmp_path):
+    now = [calendar.timegm((2026, 11, 30, 12, 0, 0))]
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    demo.epochs._clock = lambda: now[0]
+    demo.extract(msk, 'alice@example.com|202611')
+    demo.extract(msk, 'bob@example.com|202610')
+    demo.extract(msk, 'carol@example.com')  # not using epochs
+
+    sched = EpochScheduler(demo, lead=3600, workers=1, clock=lambda: now[0])
+    assert sched.run_once()['precomputed'] == 0  # boundary still more than an hour away
+    now[0] = calendar.timegm((2026, 11, 30, 23, 30, 0))
+    try:
+        assert sched.run_once() == {'epoch': '202612', 'precomputed': 2, 'removed': []}
+        assert sched.run_once()['precomputed'] == 0
+    finally:
+        sched.stop()
+    assert sorted(demo.epochs.identities('202612')) == ['alice@example.com', 'bob@example.com']
+    pub, priv = demo.epochs.get('alice@example.com', '202612')
+    assert demo.extract(msk, 'alice@example.com|202612') == priv
+    assert 'bob@example.com|202612' in demo.identity_filter()
+
+
+def test_extract_does_not_rewrite_the_index_every_time(tmp_path, monkeypatch):
+    from ibe.compact_store import CompactKeyStore
+    flushes = []
+    flush = CompactKeyStore.flush
+    monkeypatch.setattr(CompactKeyStore, 'flush', lambda self: flushes.append(1) or flush(self))
+    store = EpochKeyStore(str(tmp_path / 'epochs'), period='month', clock=lambda: NOV_2026)
+    privs = [store.extract('user%d@example.com' % i, '202611')[1] for i in range(200)]
+    assert len(flushes) < 10
+    store.close()
+
+    reopened = EpochKeyStore(str(tmp_path / 'epochs'), period='month', clock=lambda: NOV_2026)
+    assert reopened.count('202611') == 200 and reopened.get('user199@example.com', '202611')[1] == privs[-1]
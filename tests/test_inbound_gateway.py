@@ -0,0 +1,115 @@
+"""Test the decrypting inbound gateway's decrypt-and-deliver path."""
+import mailbox
+import os
+from email.message import EmailMessage
+
+from ibe.crypto_iface import DemoIBE, b64, encrypt_multi
+from mail.ibe_mime import wrap_encrypted
+from mail.inbound import KeyDirectory, decrypt_and_deliver
+
+
+def _message(body):
+    msg = EmailMessage()
+    msg['From'] = 'alice@example.com'
+    msg['To'] = 'bob@example.com'
+    msg['Subject'] = 'hello'
+    msg.set_content(body)
+    return msg
+
+
+def test_decrypt_and_deliver_to_maildir(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    priv = demo.extract(msk, 'bob@example.com')
+    keys_dir = tmp_path / 'keys'
+    keys_dir.mkdir()
+    (keys_dir / 'bob@example.com.key').write_text(b64(priv))
+    keys = KeyDirectory(str(keys_dir))
+    assert keys.get('Bob@Example.com') == priv
+    assert keys.get('carol@example.com') is None
+
+    msg = _message('top secret')
+    pub = demo.get_pubkey_for_identity('bob@example.com')
+    raw = wrap_encrypted(msg, encrypt_multi([pub], msg.as_bytes())).as_bytes()
+    root = str(tmp_path / 'Maildir')
+    assert decrypt_and_deliver(root, 'bob@example.com', raw, keys.get('bob@example.com')) == 'decrypted'
+    assert decrypt_and_deliver(root, 'carol@example.com', raw, None) == 'no-key'
+    assert decrypt_and_deliver(root, 'bob@example.com', _message('plain').as_bytes(), None) == 'passthrough'
+
+    bob_box = mailbox.Maildir(os.path.join(root, 'bob@example.com'), create=False)
+    bodies = sorted(m.get_payload().strip() for m in bob_box)
+    assert bodies == ['plain', 'top secret']
+    # Nothing is left behind in tmp/ once delivery has been renamed into new/
+    assert os.listdir(os.path.join(root, 'bob@example.com', 'tmp')) == []
+    carol_box = mailbox.Maildir(os.path.join(root, 'carol@example.com'), create=False)
+    assert [m['X-IBE-Status'] for m in carol_box] == ['no-key']
+
+
+def test_recipients_cannot_escape_the_maildir_root(tmp_path):
+    import asyncio
+    import types
+    import pytest
+    from concurrent.futures import ThreadPoolExecutor
+    from mail.inbound import InboundGatewayHandler, safe_path
+
+    root = str(tmp_path / 'Maildir')
+    for identity in ('../escaped', '../../esc2@x', '.hidden@x', 'a/b@x', 'nul\0@x', ''):
+        assert safe_path(root, identity) is None
+        with pytest.raises(ValueError):
+            decrypt_and_deliver(root, identity, _message('plain').as_bytes())
+    assert os.listdir(str(tmp_path)) == []
+    os.makedirs(root)
+    os.symlink(str(tmp_path), os.path.join(root, 'link@example.com'))
+    assert safe_path(root, 'link@example.com') is None  # resolves outside the root
+
+    keys_dir = tmp_path / 'keys'
+    keys_dir.mkdir()
+    (keys_dir / 'bob@example.com.key').write_text(b64(b'\x01' * 32))
+    handler = InboundGatewayHandler(KeyDirectory(str(keys_dir)), root, ThreadPoolExecutor(1))
+    envelope = types.SimpleNamespace(rcpt_tos=[])
+
+    async def rcpt(address):
+        return await handler.handle_RCPT(None, None, envelope, address, [])
+    assert asyncio.run(rcpt('Bob@Example.com')) == '250 OK'
+    for address in ('carol@example.com', '../escaped', '../keys/bob@example.com'):
+        assert asyncio.run(rcpt(address)).startswith('550')
+    assert envelope.rcpt_tos == ['Bob@Example.com']
+    handler.executor.shutdown()
+
+
+def test_recipients_are_delivered_independently(tmp_path):
+    import asyncio
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+    from mail.inbound import InboundGatewayHandler
+
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    keys_dir = tmp_path / 'keys'
+    keys_dir.mkdir()
+    for identity in ('bob@example.com', 'carol@example.com', 'dave@example.com'):
+        (keys_dir / (identity + '.key')).write_text(b64(demo.extract(msk, identity)))
+    msg = _message('top secret')
+    pubs = [demo.get_pubkey_for_identity(i) for i in ('bob@example.com', 'carol@example.com')]
+    raw = wrap_encrypted(msg, encrypt_multi(pubs, msg.as_bytes())).as_bytes()
+    root = tmp_path / 'Maildir'
+    root.mkdir()
+    (root / 'carol@example.com').write_text('not a directory')  # carol's delivery fails with an I/O error
+    handler = InboundGatewayHandler(KeyDirectory(str(keys_dir)), str(root), ThreadPoolExecutor(2))
+
+    def data(*rcpts):
+        envelope = types.SimpleNamespace(rcpt_tos=list(rcpts), original_content=raw, content=raw)
+        return asyncio.run(handler.handle_DATA(None, None, envelope))
+
+    # Bob got his copy, so the message is accepted once (no retry, no duplicate)
+    assert data('bob@example.com', 'carol@example.com').startswith('250')
+    assert len(mailbox.Maildir(str(root / 'bob@example.com'), create=False)) == 1
+    # Dave holds a key the envelope was not encrypted to: delivered as received, tagged
+    assert data('dave@example.com').startswith('250')
+    dave_box = mailbox.Maildir(str(root / 'dave@example.com'), create=False)
+    assert [m['X-IBE-Status'] for m in dave_box] == ['error']
+    assert handler.delivered == {'decrypted': 1, 'passthrough': 0, 'no-key': 0, 'error': 1}
+    # Nobody delivered: transient errors ask for a retry, anything else is refused for good
+    assert data('carol@example.com').startswith('451')
+    assert data('carol@example.com', '../escaped').startswith('554')
+    handler.executor.shutdown()
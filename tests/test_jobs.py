@@ -0,0 +1,52 @@
+"""Test the background job queue used for large web encrypt/decrypt."""
+from pkg.jobs import JobQueue, iter_chunks
+
+
+def test_job_runs_and_reports_progress():
+    queue = JobQueue(workers=1)
+
+    def work(job, payload):
+        job.report(0.5, 'halfway')
+        return payload.upper(), 'text/plain'
+
+    job = queue.submit('demo', work, b'hello', owner='sid-1')
+    states = list(queue.events(job, heartbeat=1.0))
+    assert states[-1]['status'] == 'done'
+    assert job.result == b'HELLO'
+    # Jobs are only visible to the session that submitted them
+    assert queue.get(job.id, owner='sid-1') is job
+    assert queue.get(job.id, owner='sid-2') is None
+
+
+def test_failed_job_records_error():
+    queue = JobQueue(workers=1)
+
+    def boom(job):
+        raise ValueError('bad envelope')
+
+    job = queue.submit('demo', boom)
+    list(queue.events(job, heartbeat=1.0))
+    assert job.status == 'failed'
+    assert job.error == 'bad envelope'
+
+
+def test_iter_chunks():
+    data = bytes(range(256)) * 10
+    chunks = list(iter_chunks(data, chunk_size=1000))
+    assert b''.join(chunks) == data
+    assert len(chunks) == 3
+
+
+def test_result_is_dropped_after_fetch_and_expired_jobs_purged():
+    queue = JobQueue(workers=1, result_ttl=0)
+
+    def work(job):
+        return b'private key', 'application/octet-stream'
+
+    job = queue.submit('extract', work)
+    list(queue.events(job, heartbeat=1.0))
+    assert job.take_result() == (b'private key', 'application/octet-stream')
+    assert job.take_result()[0] is None and job.to_dict()['fetched']
+    # An expired job is gone on the next lookup, without another submit
+    assert queue.get(job.id) is None
+    queue.close()
@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from ibe.crypto_iface import DemoIBE
+from pkg.master_keys import SealError, load_or_setup, seal, unseal
+
+KEY = {'key': '11' * 32}
+
+
+def test_seal_roundtrip_and_wrong_secret(tmp_path):
+    path = str(tmp_path / 'pkg.master')
+    mpk = {'version': 1, 'public_salt': 'abc'}
+    for secret in (KEY, {'passphrase': 'correct horse'}):
+        seal(path, mpk, b'\x07' * 32, secret)
+        assert oct(os.stat(path).st_mode & 0o777) == '0o600'
+        assert b'\x07' * 32 not in open(path, 'rb').read()
+        assert unseal(path, secret) == (mpk, b'\x07' * 32)
+    with pytest.raises(SealError):
+        unseal(path, {'passphrase': 'wrong'})
+    with pytest.raises(SealError):
+        unseal(path, KEY)  # sealed with a passphrase, not a raw key
+
+
+def test_warm_restart_reuses_master_keys_without_touching_keystore(tmp_path):
+    store = str(tmp_path / 'pkg_data.json')
+    master = str(tmp_path / 'pkg_data.master')
+    first = DemoIBE(store_path=store)
+    mpk, msk = load_or_setup(first, master, KEY)
+    first.extract(msk, 'alice@example.com')
+    mtime = os.stat(store).st_mtime_ns
+
+    warm = DemoIBE(store_path=store, lazy=True)
+    assert load_or_setup(warm, master, KEY) == (mpk, msk)
+    assert not warm._ready  # the keystore has not been read yet
+    assert warm.get_pubkey_for_identity('alice@example.com') == first.get_pubkey_for_identity('alice@example.com')
+    assert warm.store['mpk'] == mpk and os.stat(store).st_mtime_ns == mtime
+
+    # Without a secret nothing is sealed and setup() runs as before
+    fresh = DemoIBE(store_path=str(tmp_path / 'other.json'))
+    assert load_or_setup(fresh, str(tmp_path / 'other.master'), None)[0] != mpk
+    assert not os.path.exists(str(tmp_path / 'other.master'))
+
+
+def test_restored_mpk_is_written_to_a_store_that_lacks_it(tmp_path):
+    store = str(tmp_path / 'pkg_data.json')
+    master = str(tmp_path / 'pkg_data.master')
+    mpk, _ = load_or_setup(DemoIBE(store_path=str(tmp_path / 'seed.json')), master, KEY)
+    with open(store, 'w') as f:
+        json.dump({"identities": {}, "mpk": {}}, f)
+    demo = DemoIBE(store_path=store, lazy=True)
+    load_or_setup(demo, master, KEY)
+    demo.preload()
+    with open(store) as f:
+        assert json.load(f)['mpk'] == mpk
@@ -1,5 +1,7 @@
 """Test the OTP request and verification flow."""
-from pkg.auth_otp import request_otp, verify_otp, otp_store
+from pkg import auth_otp
+from pkg.auth_otp import request_otp, verify_otp, otp_store, otp_counters
+import threading
 import time
 
 
@@ -40,3 +42,50 @@ def test_otp_expiry():
     err = verify_otp(identity, '123456')
     assert err == 'expired'
     assert identity not in otp_store  # should be cleaned up
+
+
+def test_repeated_requests_coalesce(monkeypatch):
+    identity = 'carol@example.com'
+    otp_store.clear()
+    sent = []
+    release = threading.Event()
+
+    def slow_send(to_email, otp):
+        release.wait(5)
+        sent.append(otp)
+    monkeypatch.setattr(auth_otp, 'send_otp_email', slow_send)
+    before = dict(otp_counters)
+    # Concurrent clicks while the first email is still being sent share that send
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(request_otp(identity))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+    # A later click inside the resend window reuses the pending code
+    assert request_otp(identity)
+    assert results == [True] * 5 and len(sent) == 1
+    assert verify_otp(identity, sent[0]) is None
+    assert otp_counters['accepted'] - before['accepted'] == 1
+    assert otp_counters['coalesced'] - before['coalesced'] == 5
+
+
+def test_resend_after_window_or_failure(monkeypatch):
+    identity = 'dave@example.com'
+    otp_store.clear()
+    sent = []
+    monkeypatch.setattr(auth_otp, 'send_otp_email', lambda to_email, otp: sent.append(otp))
+    monkeypatch.setattr(auth_otp, 'OTP_RESEND_WINDOW_SECONDS', 0)
+    request_otp(identity)
+    request_otp(identity)
+    assert len(sent) == 2 and verify_otp(identity, sent[1]) is None
+
+    def failing(to_email, otp):
+        raise OSError('smtp down')
+    monkeypatch.setattr(auth_otp, 'OTP_RESEND_WINDOW_SECONDS', 60)
+    monkeypatch.setattr(auth_otp, 'send_otp_email', failing)
+    assert not request_otp(identity)
+    monkeypatch.setattr(auth_otp, 'send_otp_email', lambda to_email, otp: sent.append(otp))
+    assert request_otp(identity) and len(sent) == 3  # a failed send is not coalesced
@@ -0,0 +1,160 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from clients.pkg_client import AsyncPKGClient, PKGClient, PKGError
+from ibe.bloom import BloomFilter
+from ibe.sender import b64
+
+KEYS = {'alice@example.com': b'a' * 32, 'bob@example.com': b'b' * 32}
+
+
+@pytest.fixture
+def stub_pkg():
+    """Minimal PKG: counts requests, fails the first `fail` ones with 503, can add latency."""
+    app = Flask(__name__)
+    state = {'calls': 0, 'fail': 0, 'delay': 0.0}
+
+    @app.route('/get_pubkey')
+    def get_pubkey():
+        state['calls'] += 1
+        time.sleep(state['delay'])
+        if state['fail'] > 0:
+            state['fail'] -= 1
+            return jsonify({'error': 'busy'}), 503
+        pub = KEYS.get(request.args['identity'])
+        if pub is None:
+            return jsonify({'error': 'unknown identity'}), 404
+        return jsonify({'identity': request.args['identity'], 'pub_b64': b64(pub)})
+
+    @app.route('/pubkeys/filter')
+    def pubkey_filter():
+        state['calls'] += 1
+        bloom = BloomFilter(capacity=100, fp_rate=0.001)
+        bloom.update(KEYS)
+        return bloom.to_bytes(), 200, {'ETag': '"1"'}
+
+    @app.route('/get_pubkeys', methods=['POST'])
+    def get_pubkeys():
+        state['calls'] += 1
+        ids = request.get_json()['identities']
+        return jsonify({'pubkeys': {i: b64(KEYS[i]) for i in ids if i in KEYS},
+                        'unknown': [i for i in ids if i not in KEYS]})
+
+    @app.route('/extract', methods=['POST'])
+    def extract():
+        state['calls'] += 1
+        data = request.get_json()
+        if data['otp'] != '123456':
+            return jsonify({'error': 'invalid'}), 401
+        return jsonify({'identity': data['identity'], 'private_b64': b64(KEYS[data['identity']])})
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_port, state
+    server.shutdown()
+
+
+def test_lookups_and_batch(stub_pkg):
+    url, state = stub_pkg
+    with PKGClient(url, batch_size=1) as pkg:
+        assert pkg.get_pubkey('Alice@Example.com') == KEYS['alice@example.com']
+        assert pkg.get_pubkey('nobody@example.com') is None
+        assert pkg.lookup_many(['alice@example.com', 'bob@example.com', 'carol@example.com']) == KEYS
+        assert pkg.get_pubkeys(['alice@example.com', 'bob@example.com', 'carol@example.com']) == KEYS
+
+
+def test_retries_with_backoff(stub_pkg):
+    url, state = stub_pkg
+    state['fail'] = 2
+    with PKGClient(url, retries=3, backoff=0.001) as pkg:
+        assert pkg.get_pubkey('bob@example.com') == KEYS['bob@example.com']
+        assert pkg.stats()['retried'] == 2
+    state['fail'] = 5
+    with PKGClient(url, retries=1, backoff=0.001) as pkg:
+        with pytest.raises(PKGError):
+            pkg.get_pubkey('bob@example.com')
+
+
+def test_duplicate_inflight_lookups_coalesce(stub_pkg):
+    url, state = stub_pkg
+    state['delay'] = 0.2
+    with PKGClient(url) as pkg:
+        threads = [threading.Thread(target=pkg.get_pubkey, args=('alice@example.com',)) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert state['calls'] == 1
+        assert pkg.stats()['coalesced'] == 4
+
+
+def test_async_client(stub_pkg):
+    url, state = stub_pkg
+    state['delay'] = 0.05
+
+    async def run():
+        async with AsyncPKGClient(url) as pkg:
+            keys = await pkg.lookup_many(['alice@example.com', 'bob@example.com', 'zed@example.com'])
+            same = await asyncio.gather(*(pkg.get_pubkey('alice@example.com') for _ in range(4)))
+            return keys, same
+
+    keys, same = asyncio.run(run())
+    assert keys == KEYS
+    assert same == [KEYS['alice@example.com']] * 4
+    assert state['calls'] == 4
+
+
+def test_identity_filter_skips_unknown_recipients(stub_pkg):
+    url, state = stub_pkg
+    with PKGClient(url, use_filter=True) as pkg:
+        assert pkg.get_pubkey('alice@example.com') == KEYS['alice@example.com']
+        calls = state['calls']  # filter download + one lookup
+        assert pkg.get_pubkey('spam-target-1@example.com') is None
+        found = pkg.get_pubkeys(['bob@example.com', 'spam-target-2@example.com'])
+        assert found == {'bob@example.com': KEYS['bob@example.com']}
+        assert state['calls'] == calls + 1
+        assert pkg.stats()['filtered'] == 2
+
+
+def test_async_lookup_uses_identity_filter(stub_pkg):
+    url, state = stub_pkg
+
+    async def run():
+        async with AsyncPKGClient(url, use_filter=True) as pkg:
+            return await pkg.get_pubkey('alice@example.com'), await pkg.get_pubkey('spam@example.com'), pkg.client
+
+    alice, spam, client = asyncio.run(run())
+    assert alice == KEYS['alice@example.com'] and spam is None
+    assert client.stats()['filtered'] == 1 and state['calls'] == 2  # filter download + alice
+
+
+def test_cli_scripts_go_through_pkg_client(stub_pkg, monkeypatch, capsys):
+    import json
+    from clients import decrypt, encrypt
+    from cryptography.hazmat.primitives.asymmetric import x25519
+    from cryptography.hazmat.primitives import serialization
+    url, state = stub_pkg
+    priv = x25519.X25519PrivateKey.generate()
+    raw = serialization.Encoding.Raw
+    monkeypatch.setitem(KEYS, 'alice@example.com', priv.public_key().public_bytes(raw, serialization.PublicFormat.Raw))
+    monkeypatch.setattr(sys, 'argv', ['encrypt.py', '--pkg', url, '--identity', 'Alice@Example.com',
+                                      '--message', 'hi'])
+    encrypt.main()
+    env = json.loads(capsys.readouterr().out)
+    with PKGClient(url) as pkg:
+        with pytest.raises(PKGError):
+            pkg.extract('alice@example.com', '000000')
+    # The stub hands back whatever KEYS holds, so serve the private half for the extract
+    monkeypatch.setitem(KEYS, 'alice@example.com', priv.private_bytes(raw, serialization.PrivateFormat.Raw,
+                                                                      serialization.NoEncryption()))
+    monkeypatch.setattr(sys, 'argv', ['decrypt.py', '--pkg', url, '--identity', 'alice@example.com',
+                                      '--otp', '123456', '--envelope', json.dumps(env)])
+    decrypt.main()
+    assert capsys.readouterr().out.strip() == 'hi'
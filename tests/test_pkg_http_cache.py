@@ -0,0 +1,66 @@
+import calendar
+
+import pytest
+
+from ibe.crypto_iface import DemoIBE
+from pkg.epoch_scheduler import EpochScheduler
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    from pkg import server
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    demo.setup()
+    demo.extract(server.MSK, 'alice@example.com')
+    monkeypatch.setattr(server, 'pkg', demo)
+    server._pubkey_responses.clear()
+    return server
+
+
+def test_mpk_etag_and_304(server):
+    client = server.app.test_client()
+    r = client.get('/mpk')
+    assert r.status_code == 200 and r.get_json() == server.MPK
+    etag = r.headers['ETag']
+    assert etag.startswith('"') and 'max-age' in r.headers['Cache-Control']
+    r2 = client.get('/mpk', headers={'If-None-Match': 'W/"other", ' + etag})
+    assert r2.status_code == 304 and r2.data == b'' and r2.headers['ETag'] == etag
+
+
+def test_pubkey_cached_response_and_revalidation(server):
+    client = server.app.test_client()
+    r = client.get('/get_pubkey', query_string={'identity': ' Alice@Example.com'})
+    assert r.status_code == 200
+    assert r.get_json()['identity'] == 'alice@example.com'
+    etag = r.headers['ETag']
+    assert client.get('/get_pubkey', query_string={'identity': 'alice@example.com'}).headers['ETag'] == etag
+    r2 = client.get('/get_pubkey', query_string={'identity': 'alice@example.com'}, headers={'If-None-Match': etag})
+    assert r2.status_code == 304
+    assert server._pubkey_responses.stats()['hits'] >= 1
+
+    # Unknown identities are not cached: once issued, the key is served
+    assert client.get('/get_pubkey', query_string={'identity': 'bob@example.com'}).status_code == 404
+    server.pkg.extract(server.MSK, 'bob@example.com')
+    assert client.get('/get_pubkey', query_string={'identity': 'bob@example.com'}).status_code == 200
+    assert client.get('/get_pubkey').status_code == 400
+
+
+def test_epoch_pubkeys_are_cached_only_until_their_epoch_expires(server):
+    now = [calendar.timegm((2026, 11, 15, 0, 0, 0))]
+    server.pkg.epochs._clock = lambda: now[0]
+    server.pkg.extract(server.MSK, 'alice@example.com|202611')
+    client = server.app.test_client()
+    r = client.get('/get_pubkey', query_string={'identity': 'alice@example.com|202611'})
+    assert r.status_code == 200 and r.headers['Cache-Control'] == 'public, max-age=%d' % server.PUBKEY_MAX_AGE
+    assert server._pubkey_responses.get('alice@example.com|202611') is not None
+
+    # Half an hour before the retention window closes (default: two past epochs kept), max-age shrinks to fit
+    now[0] = calendar.timegm((2027, 2, 1, 0, 0, 0)) - 1800
+    r = client.get('/get_pubkey', query_string={'identity': 'alice@example.com|202611'})
+    assert r.headers['Cache-Control'] == 'public, max-age=1800'
+
+    now[0] = calendar.timegm((2027, 2, 2, 0, 0, 0))
+    sched = EpochScheduler(server.pkg, lead=0, clock=lambda: now[0], on_gc=server._forget_epochs)
+    assert sched.run_once()['removed'] == ['202611']
+    assert server._pubkey_responses.get('alice@example.com|202611') is None
+    assert client.get('/get_pubkey', query_string={'identity': 'alice@example.com|202611'}).status_code == 404
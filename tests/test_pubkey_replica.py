@@ -0,0 +1,104 @@
+from clients.pubkey_replica import PubkeyReplica
+from ibe.crypto_iface import DemoIBE
+from ibe.epochs import with_epoch
+
+
+class FeedClient:
+    """Serves DemoIBE.changes_since directly, counting calls."""
+
+    def __init__(self, demo):
+        self.demo = demo
+        self.calls = 0
+
+    def get_changes(self, since, limit=None, epoch=None):
+        self.calls += 1
+        return self.demo.changes_since(since, limit or 1000, epoch)
+
+
+def test_change_feed_paging(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    for i in range(5):
+        demo.extract(msk, 'user%d@example.com' % i)
+    page = demo.changes_since(0, limit=2)
+    assert [c['seq'] for c in page['changes']] == [1, 2] and page['more']
+    page = demo.changes_since(page['next'], limit=10)
+    assert [c['identity'] for c in page['changes']] == ['user%d@example.com' % i for i in (2, 3, 4)]
+    assert not page['more'] and page['latest'] == 5
+    # Sequence numbers survive a reload
+    assert DemoIBE(store_path=str(tmp_path / 'pkg_data.json')).changes_since(4)['changes'][0]['seq'] == 5
+
+
+def test_replica_sync_and_catch_up(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    for i in range(7):
+        demo.extract(msk, 'user%d@example.com' % i)
+    feed = FeedClient(demo)
+    path = str(tmp_path / 'keys.replica')
+    replica = PubkeyReplica(path, feed, page_size=3)
+    assert replica.sync() == 7 and feed.calls == 3
+    assert replica.get_pubkey('USER3@example.com') == demo.get_pubkey_for_identity('user3@example.com')
+
+    # Offline for a while: reopening from disk only fetches the new changes
+    demo.extract(msk, 'late@example.com')
+    replica = PubkeyReplica(path, feed, page_size=3)
+    assert len(replica) == 7 and replica.seq == 7
+    assert replica.sync() == 1
+    assert replica.get_pubkeys(['late@example.com', 'nobody@example.com']) == {
+        'late@example.com': demo.get_pubkey_for_identity('late@example.com')}
+
+
+def test_replica_resets_when_store_changes(tmp_path):
+    old = DemoIBE(store_path=str(tmp_path / 'old.json'))
+    _, msk = old.setup()
+    old.extract(msk, 'gone@example.com')
+    path = str(tmp_path / 'keys.replica')
+    PubkeyReplica(path, FeedClient(old)).sync()
+
+    new = DemoIBE(store_path=str(tmp_path / 'new.json'))
+    new.setup()
+    new.extract(msk, 'fresh@example.com')
+    replica = PubkeyReplica(path, FeedClient(new))
+    replica.sync()
+    assert 'gone@example.com' not in replica and 'fresh@example.com' in replica
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    demo.extract(msk, 'a@example.com')
+    path = str(tmp_path / 'keys.replica')
+    PubkeyReplica(path, FeedClient(demo)).sync()
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x00\x20partial')
+    replica = PubkeyReplica(path)
+    assert len(replica) == 1 and replica.seq == 1
+
+
+def test_replica_follows_epoch_feeds(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    epoch = demo.epochs.current()
+    demo.extract(msk, 'plain@example.com')
+    for i in range(5):
+        demo.extract(msk, with_epoch('user%d@example.com' % i, epoch))
+    feed = FeedClient(demo)
+    path = str(tmp_path / 'keys.replica')
+    replica = PubkeyReplica(path, feed, page_size=2)
+    assert replica.sync() == 6 and replica.epochs == {epoch: 5}
+    alice = with_epoch('user3@example.com', epoch)
+    assert replica.get_pubkey(alice) == demo.get_pubkey_for_identity(alice)
+
+    # Cursors survive a reopen, so only the new epoch key is fetched
+    demo.extract(msk, with_epoch('late@example.com', epoch))
+    replica = PubkeyReplica(path, feed, page_size=2)
+    assert replica.epochs == {epoch: 5} and replica.sync() == 1
+
+    # Once the PKG stops retaining the epoch its keys go, and stay gone after a reopen
+    feed.get_changes = lambda since, limit=None, epoch=None: dict(
+        demo.changes_since(since, limit or 1000, epoch), epochs=[])
+    replica.sync()
+    assert replica.epochs == {} and alice not in replica and 'plain@example.com' in replica
+    replica = PubkeyReplica(path)
+    assert replica.epochs == {} and len(replica) == 1
@@ -0,0 +1,203 @@
+import threading
+
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from ibe.crypto_iface import DemoIBE
+from ibe.epochs import split_epoch, with_epoch
+from ibe.sender import b64
+from clients.pkg_client import PKGError
+from pkg.router import HashRing, MigrationConflict, ShardRouter, UnknownNode, create_app
+
+
+def test_ring_balance_and_minimal_movement():
+    identities = ['user%d@example.com' % i for i in range(4000)]
+    ring = HashRing(['http://n%d' % i for i in range(4)], vnodes=128)
+    before = {i: ring.node_for(i) for i in identities}
+    counts = {n: list(before.values()).count(n) for n in ring.nodes}
+    assert min(counts.values()) > 0.6 * 1000 and max(counts.values()) < 1.4 * 1000
+    bigger = ring.copy()
+    bigger.add('http://n4')
+    moved = [i for i in identities if bigger.node_for(i) != before[i]]
+    assert all(bigger.node_for(i) == 'http://n4' for i in moved)  # keys only move to the new node
+    assert 0.1 < len(moved) / len(identities) < 0.3
+    bigger.remove('http://n4')
+    assert all(bigger.node_for(i) == before[i] for i in identities)
+
+
+def node(tmp_path, name):
+    """A PKG node with the routes the router uses, backed by its own DemoIBE."""
+    demo = DemoIBE(store_path=str(tmp_path / (name + '.json')))
+    _, msk = demo.setup()
+    app = Flask(name)
+
+    @app.route('/get_pubkey')
+    def get_pubkey():
+        pub = demo.get_pubkey_for_identity(request.args['identity'])
+        if pub is None:
+            return jsonify({'error': 'unknown identity'}), 404
+        return jsonify({'identity': request.args['identity'], 'pub_b64': b64(pub)})
+
+    @app.route('/get_pubkeys', methods=['POST'])
+    def get_pubkeys():
+        found = demo.get_pubkeys_for_identities(request.get_json()['identities'])
+        return jsonify({'pubkeys': {i: b64(p) for i, p in found.items()}})
+
+    @app.route('/extract', methods=['POST'])
+    def extract():
+        identity = request.get_json()['identity']
+        return jsonify({'identity': identity, 'private_b64': b64(demo.extract(msk, identity))})
+
+    @app.route('/pubkeys/changes')
+    def changes():
+        return jsonify(demo.changes_since(int(request.args['since']), 2, request.args.get('epoch')))
+
+    @app.route('/admin/export_keys', methods=['POST'])
+    def export_keys():
+        assert request.headers['X-PKG-Admin-Token'] == 'secret'
+        return jsonify({'keys': demo.export_keys(request.get_json()['identities'])})
+
+    @app.route('/admin/import_keys', methods=['POST'])
+    def import_keys():
+        conflicts = []
+        imported = demo.import_keys(request.get_json()['keys'], conflicts)
+        return jsonify({'imported': imported, 'conflicts': conflicts})
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d' % server.server_port, demo
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    nodes = [node(tmp_path, 'n%d' % i) for i in range(3)]
+    yield nodes
+    for server, _, _ in nodes:
+        server.shutdown()
+
+
+def test_router_forwards_fans_out_and_rebalances(cluster):
+    urls = [u for _, u, _ in cluster[:2]]
+    router = ShardRouter(urls, vnodes=64, admin_token='secret')
+    client = create_app(router).test_client()
+    identities = ['user%d@example.com' % i for i in range(40)]
+    privs = {i: client.post('/extract', json={'identity': i}).get_json()['private_b64'] for i in identities}
+    stores = {u: d for _, u, d in cluster}
+    assert all(stores[router.node_for(i)].get_pubkey_for_identity(i) is not None for i in identities)
+
+    r = client.post('/get_pubkeys', json={'identities': identities + ['nobody@example.com']}).get_json()
+    assert set(r['pubkeys']) == set(identities) and r['unknown'] == ['nobody@example.com']
+    assert client.get('/get_pubkey', query_string={'identity': 'nobody@example.com'}).status_code == 404
+
+    new = cluster[2][1]
+    moved = router.add_node(new)
+    owned = [i for i in identities if router.node_for(i) == new]
+    assert moved == len(owned) > 0
+    for i in owned:  # same key, now served by the new node
+        assert client.post('/extract', json={'identity': i}).get_json()['private_b64'] == privs[i]
+    assert client.get('/shards').get_json()['nodes'] == urls + [new]
+    router.close()
+
+
+def test_rebalance_moves_epoch_keys(cluster):
+    urls = [u for _, u, _ in cluster[:2]]
+    router = ShardRouter(urls, vnodes=64, admin_token='secret')
+    client = create_app(router).test_client()
+    epoch = cluster[0][2].epochs.current()
+    identities = [with_epoch('user%d@example.com' % i, epoch) for i in range(30)] + ['plain@example.com']
+    privs = {i: client.post('/extract', json={'identity': i}).get_json()['private_b64'] for i in identities}
+
+    new = cluster[2][1]
+    moved = router.add_node(new)
+    owned = [i for i in identities if router.node_for(i) == new]
+    assert moved == len(owned) and any(split_epoch(i)[1] for i in owned)
+    for i in owned:  # epoch keys moved with the rest, unchanged
+        assert client.post('/extract', json={'identity': i}).get_json()['private_b64'] == privs[i]
+    assert cluster[2][2].epochs.count(epoch) == len([i for i in owned if split_epoch(i)[1]])
+    router.close()
+
+
+def test_extracts_of_moving_identities_wait_for_the_migration(cluster, monkeypatch):
+    urls = [u for _, u, _ in cluster[:2]]
+    router = ShardRouter(urls, vnodes=64, admin_token='secret')
+    client = create_app(router).test_client()
+    identities = ['user%d@example.com' % i for i in range(40)]
+    for i in identities:
+        client.post('/extract', json={'identity': i})
+    new, new_demo = cluster[2][1], cluster[2][2]
+    stores = {u: d for _, u, d in cluster}
+    migrate, seen = router._migrate, []
+
+    def interleaved(source, ring):
+        # Between the passes, a client asks for a key that is moving to the new node
+        if not seen:
+            fresh = next(i for i in ('late%d@example.com' % n for n in range(1000)) if ring.node_for(i) == new)
+            seen.append(fresh)
+            assert router.moving(fresh)
+            r = client.post('/extract', json={'identity': fresh})
+            assert r.status_code == 503 and r.headers['Retry-After'] == '1'
+            assert new_demo.get_pubkey_for_identity(fresh) is None
+        return migrate(source, ring)
+    monkeypatch.setattr(router, '_migrate', interleaved)
+    router.add_node(new)
+    fresh = seen[0]
+    assert not router.moving(fresh) and router.node_for(fresh) == new
+    issued = client.post('/extract', json={'identity': fresh}).get_json()['private_b64']
+    assert b64(new_demo._keypair(fresh)[1]) == issued
+
+    # A node that issued its own key for a moving identity stops the migration
+    clash = next(i for i in identities if router.node_for(i) == urls[0])
+    old_pub = stores[urls[0]].get_pubkey_for_identity(clash)
+    ring = router.ring.copy()
+    ring.remove(urls[0])
+    other = stores[ring.node_for(clash)]
+    other.extract(b'', clash)  # the demo backend ignores the MSK
+    assert other.get_pubkey_for_identity(clash) != old_pub
+    with pytest.raises(MigrationConflict) as e:
+        router.remove_node(urls[0])
+    assert clash in e.value.identities
+    assert urls[0] in router.ring.nodes and not router.moving(clash)
+    router.close()
+
+
+def test_admin_nodes_errors_and_serialization(cluster, monkeypatch):
+    urls = [u for _, u, _ in cluster[:2]]
+    router = ShardRouter(urls, vnodes=64, admin_token='secret')
+    client = create_app(router).test_client()
+    headers = {'X-PKG-Admin-Token': 'secret'}
+    r = client.delete('/admin/nodes', json={'url': 'http://127.0.0.1:1'}, headers=headers)
+    assert r.status_code == 404 and router.ring.nodes == urls
+    with pytest.raises(UnknownNode):
+        router.remove_node('http://127.0.0.1:1')
+
+    # A node failing mid-migration is a 502, and the ring stays as it was
+    def failing(node, path, payload):
+        raise PKGError(500, 'boom')
+    for i in range(20):
+        client.post('/extract', json={'identity': 'user%d@example.com' % i})
+    monkeypatch.setattr(router, '_admin', failing)
+    r = client.post('/admin/nodes', json={'url': cluster[2][1]}, headers=headers)
+    assert r.status_code == 502 and router.ring.nodes == urls
+    monkeypatch.undo()
+
+    # Concurrent membership changes run one at a time
+    migrate, active, overlap = router._migrate, [], []
+
+    def tracked(source, ring):
+        active.append(source)
+        overlap.append(len(active) > 1)
+        try:
+            return migrate(source, ring)
+        finally:
+            active.pop()
+    monkeypatch.setattr(router, '_migrate', tracked)
+    threads = [threading.Thread(target=router.add_node, args=(cluster[2][1],)),
+               threading.Thread(target=router.remove_node, args=(urls[1],))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert overlap and not any(overlap)
+    assert sorted(router.ring.nodes) == sorted([urls[0], cluster[2][1]])
+    router.close()
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+from ibe.crypto_iface import DemoIBE
+from ibe.sender import decrypt_with_privkey, encrypt_to_pubkey
+
+
+def test_interop_with_demo_ibe(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    priv = demo.extract(msk, 'alice@example.com')
+    pub = demo.get_pubkey_for_identity('alice@example.com')
+
+    env = encrypt_to_pubkey(pub, b'hello alice', compression_mode='zlib')
+    assert demo.decrypt(priv, env) == b'hello alice'
+    assert decrypt_with_privkey(priv, demo.encrypt('alice@example.com', b'reply')) == b'reply'
+    assert decrypt_with_privkey(priv, demo.encrypt_multi({'alice@example.com': pub}, b'group')) == b'group'
+
+
+def test_sender_does_not_load_keystore_module():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import sys, ibe.sender; print("ibe.crypto_iface" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
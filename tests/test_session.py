@@ -0,0 +1,70 @@
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from ibe.crypto_iface import DemoIBE, decrypt_envelope
+from ibe.session import RekeyPolicy, SessionDecryptor, SessionEncryptor
+
+
+@pytest.fixture
+def demo(tmp_path):
+    d = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = d.setup()
+    return d, d.extract(msk, 'alice@example.com'), msk
+
+
+def test_session_roundtrip_and_caching(demo):
+    d, priv, _ = demo
+    sender = SessionEncryptor(d.get_pubkey_for_identity)
+    receiver = SessionDecryptor(priv)
+    envs = [sender.encrypt('Alice@Example.com', b'alert %d' % i) for i in range(5)]
+    assert len({e['session_id'] for e in envs}) == 1
+    assert [e['seq'] for e in envs] == list(range(5))
+    assert sender.stats()['established'] == 1
+    # Out-of-order delivery is fine; only the first message derives the key
+    for i in (3, 0, 4, 1, 2):
+        assert receiver.decrypt(envs[i]) == b'alert %d' % i
+    assert receiver.stats()['misses'] == 1
+    # Envelopes also decrypt statelessly
+    assert decrypt_envelope(priv, envs[2]) == b'alert 2'
+    # Regular envelopes still go through the receiver
+    assert receiver.decrypt(d.encrypt('alice@example.com', b'plain')) == b'plain'
+
+
+def test_rekey_policies(demo):
+    d, _, _ = demo
+    now = [0.0]
+    sender = SessionEncryptor(d.get_pubkey_for_identity,
+                              RekeyPolicy(max_messages=3, max_bytes=100, max_age=60),
+                              clock=lambda: now[0])
+    ids = [sender.encrypt('alice@example.com', b'x')['session_id'] for _ in range(7)]
+    assert ids[0] == ids[2] and ids[2] != ids[3] and ids[3] != ids[6]
+
+    first = sender.encrypt('alice@example.com', b'y' * 60)['session_id']
+    assert sender.encrypt('alice@example.com', b'y' * 60)['session_id'] != first
+
+    current = sender.encrypt('alice@example.com', b'z')['session_id']
+    now[0] += 61
+    assert sender.encrypt('alice@example.com', b'z')['session_id'] != current
+
+
+def test_recipient_key_change_starts_new_session(demo):
+    d, priv, msk = demo
+    bob_priv = d.extract(msk, 'bob@example.com')
+    keys = {'alice@example.com': d.get_pubkey_for_identity('alice@example.com')}
+    sender = SessionEncryptor(keys.get)
+    current = sender.encrypt('alice@example.com', b'z')['session_id']
+    keys['alice@example.com'] = d.get_pubkey_for_identity('bob@example.com')
+    env = sender.encrypt('alice@example.com', b'after rotation')
+    assert env['session_id'] != current
+    assert SessionDecryptor(bob_priv).decrypt(env) == b'after rotation'
+
+
+def test_tampered_seq_rejected(demo):
+    d, priv, _ = demo
+    sender = SessionEncryptor(d.get_pubkey_for_identity)
+    receiver = SessionDecryptor(priv)
+    receiver.decrypt(sender.encrypt('alice@example.com', b'first'))
+    env = sender.encrypt('alice@example.com', b'second')
+    env['seq'] = 0
+    with pytest.raises(InvalidTag):
+        receiver.decrypt(env)
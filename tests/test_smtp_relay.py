@@ -0,0 +1,91 @@
+"""End-to-end test of the encrypting SMTP relay against a local upstream server."""
+import smtplib
+import socket
+import time
+from email.message import EmailMessage
+
+from aiosmtpd.controller import Controller
+
+from ibe.crypto_iface import DemoIBE, decrypt_multi, encrypt_multi
+from mail.ibe_mime import MARKER_HEADER, find_envelope, parse_message
+from mail.relay import EncryptingRelayHandler
+from mail.smtp_pool import SMTPConnectionPool
+
+
+class CollectingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content)
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_encrypt_multi_roundtrip(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    alice = demo.extract(msk, 'alice@example.com')
+    bob = demo.extract(msk, 'bob@example.com')
+    carol = demo.extract(msk, 'carol@example.com')
+    pubs = demo.get_pubkeys_for_identities(['alice@example.com', 'Bob@Example.com'])
+    env = encrypt_multi(pubs.values(), b'for both')
+    assert demo.decrypt(alice, env) == b'for both'
+    assert decrypt_multi(bob, env) == b'for both'
+    try:
+        demo.decrypt(carol, env)
+        assert False, 'carol is not a recipient'
+    except ValueError:
+        pass
+
+
+def test_relay_encrypts_and_forwards(tmp_path):
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    _, msk = demo.setup()
+    priv = demo.extract(msk, 'bob@example.com')
+
+    upstream_handler = CollectingHandler()
+    upstream_port = free_port()
+    upstream = Controller(upstream_handler, hostname='127.0.0.1', port=upstream_port)
+    upstream.start()
+    pool = SMTPConnectionPool('127.0.0.1', upstream_port, size=2)
+    relay_handler = EncryptingRelayHandler(demo.get_pubkeys_for_identities, pool, max_concurrency=4)
+    port = free_port()
+    relay = Controller(relay_handler, hostname='127.0.0.1', port=port)
+    relay.start()
+    try:
+        msg = EmailMessage()
+        msg['From'] = 'alice@example.com'
+        msg['To'] = 'bob@example.com'
+        msg['Subject'] = 'quarterly numbers'
+        msg.set_content('the secret body')
+        with smtplib.SMTP('127.0.0.1', port) as s:
+            s.send_message(msg)
+            s.send_message(msg)
+            try:
+                s.sendmail('alice@example.com', ['nobody@example.com'], msg.as_bytes())
+                assert False, 'unknown recipient should be rejected'
+            except smtplib.SMTPDataError as e:
+                assert e.smtp_code == 550
+        for _ in range(50):
+            if len(upstream_handler.messages) == 2:
+                break
+            time.sleep(0.05)
+        assert len(upstream_handler.messages) == 2
+        forwarded = parse_message(upstream_handler.messages[0])
+        assert forwarded[MARKER_HEADER] == '1'
+        assert b'the secret body' not in upstream_handler.messages[0]
+        plaintext = demo.decrypt(priv, find_envelope(forwarded))
+        assert parse_message(plaintext).get_content().strip() == 'the secret body'
+        stats = relay_handler.stats.snapshot()
+        assert stats['relayed'] == 2 and stats['rejected'] == 1
+        assert pool.opened == 1 and pool.reused == 1
+    finally:
+        relay.stop()
+        upstream.stop()
+        pool.close()
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from ibe.compact_store import identity_hash
+from ibe.crypto_iface import DemoIBE
+from ibe.epochs import with_epoch
+from ibe.snapshot import RECORD_SIZE, Snapshot, write_snapshot
+
+
+def _key(i):
+    return i.to_bytes(4, 'big') * 8
+
+
+def test_external_sort_lookup_and_checksums(tmp_path):
+    path = str(tmp_path / 'keys.snap')
+    entries = [('user%d@example.com' % i, _key(i), _key(i + 1), i + 1) for i in range(2500)]
+    entries.append(('ü@bücher.example', b'\x01' * 32, b'\x02' * 32, 2501))
+    # small runs force several spill files and a k-way merge
+    assert write_snapshot(path, iter(entries), seq=2501, store_id='00112233aabbccdd',
+                          mpk={'version': 1}, run_size=300) == 2501
+    assert not [f for f in os.listdir(str(tmp_path)) if f != 'keys.snap']
+
+    for use_mmap in (True, False):
+        with Snapshot(path, use_mmap=use_mmap) as snap:
+            assert (len(snap), snap.seq, snap.store_id, snap.mpk) == (2501, 2501, '00112233aabbccdd', {'version': 1})
+            assert snap.get('user1234@example.com') == (_key(1234), _key(1235), 1235)
+            assert snap.get('ü@bücher.example') == (b'\x01' * 32, b'\x02' * 32, 2501)
+            assert 'nobody@example.com' not in snap
+            hashes = [identity_hash(i.encode('utf8')) for i, _, _, _ in snap]
+            assert hashes == sorted(hashes)
+            assert snap.verify()
+
+    with open(path, 'r+b') as f:
+        f.seek(200 + RECORD_SIZE * 10)
+        f.write(b'\xff')
+    with Snapshot(path) as snap:
+        assert not snap.verify()
+    with open(path, 'wb') as f:
+        f.write(b'not a snapshot at all, just some bytes')
+    with pytest.raises(ValueError):
+        Snapshot(path)
+
+
+@pytest.mark.parametrize('keystore', ['json', 'compact'])
+def test_export_restore_and_mmap_base(tmp_path, keystore):
+    src = DemoIBE(store_path=str(tmp_path / 'src.json'), keystore=keystore)
+    src.setup()
+    privs = {i: src.extract(b'', 'user%d@example.com' % i) for i in range(50)}
+    path = str(tmp_path / 'src.snap')
+    assert src.export_snapshot(path) == 50
+
+    restored = DemoIBE(store_path=str(tmp_path / 'restored.json'), keystore=keystore)
+    assert restored.load_snapshot(path) == 50
+    assert restored.extract(b'', 'user7@example.com') == privs[7]
+    assert restored.changes_since(0)['changes'] == src.changes_since(0)['changes']
+    assert restored.store['store_id'] == src.store['store_id']
+    with pytest.raises(ValueError):
+        restored.load_snapshot(path)
+
+    layered = DemoIBE(store_path=str(tmp_path / 'layered.json'), keystore=keystore, snapshot=path)
+    assert layered.extract(b'', 'user3@example.com') == privs[3]
+    assert layered.get_pubkey_for_identity('User9@Example.com') == src.get_pubkey_for_identity('user9@example.com')
+    layered.extract(b'', 'new@example.com')
+    assert layered.changes_since(0)['changes'][0]['seq'] == 51
+    assert 'user42@example.com' in layered.identity_filter()
+    assert layered.export_snapshot(str(tmp_path / 'layered.snap')) == 51
+
+
+@pytest.mark.parametrize('keystore', ['json', 'compact'])
+def test_snapshot_carries_epoch_keys(tmp_path, keystore):
+    src = DemoIBE(store_path=str(tmp_path / 'src.json'), keystore=keystore)
+    src.setup()
+    epoch = src.epochs.current()
+    src.extract(b'', 'alice@example.com')
+    epoch_priv = src.extract(b'', with_epoch('alice@example.com', epoch))
+    path = str(tmp_path / 'src.snap')
+    assert src.export_snapshot(path) == 2
+
+    restored = DemoIBE(store_path=str(tmp_path / 'restored.json'), keystore=keystore)
+    restored.load_snapshot(path)
+    assert restored.epochs.get('alice@example.com', epoch)[1] == epoch_priv
+    assert [c['identity'] for c in restored.changes_since(0)['changes']] == ['alice@example.com']
+
+    layered = DemoIBE(store_path=str(tmp_path / 'layered.json'), keystore=keystore, snapshot=path)
+    assert layered.extract(b'', with_epoch('alice@example.com', epoch)) == epoch_priv
+    assert layered.epochs.count(epoch) == 0  # served from the snapshot, not re-issued
+    assert layered.export_snapshot(str(tmp_path / 'layered.snap')) == 2
+
+
+def test_load_refuses_a_corrupt_snapshot(tmp_path):
+    src = DemoIBE(store_path=str(tmp_path / 'src.json'))
+    src.setup()
+    for i in range(10):
+        src.extract(b'', 'user%d@example.com' % i)
+    path = str(tmp_path / 'src.snap')
+    src.export_snapshot(path)
+    with Snapshot(path) as snap:
+        at = snap._header_len + 3 * RECORD_SIZE + 20  # inside one record's public key
+    with open(path, 'r+b') as f:
+        f.seek(at)
+        byte = f.read(1)
+        f.seek(at)
+        f.write(bytes([byte[0] ^ 0x01]))
+
+    restored = DemoIBE(store_path=str(tmp_path / 'restored.json'))
+    with pytest.raises(ValueError):
+        restored.load_snapshot(path)
+    assert restored.changes_since(0)['changes'] == []
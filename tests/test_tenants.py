@@ -0,0 +1,101 @@
+import os
+import threading
+
+import pytest
+
+from pkg.tenants import TenantRegistry, UnknownTenant, canonical_domain, tenant_dirname
+
+
+def test_domain_names():
+    assert canonical_domain(' Example.COM ') == 'example.com'
+    assert canonical_domain('xn--bcher-kva.example') == 'bücher.example'
+    assert tenant_dirname('bücher.example') == 'xn--bcher-kva.example'
+    assert tenant_dirname('../etc').startswith('h-')
+
+
+def test_lazy_load_lru_eviction_and_pinning(tmp_path, monkeypatch):
+    monkeypatch.setattr('pkg.master_keys.PKG_MASTER_SEAL_KEY', '11' * 32)
+    reg = TenantRegistry(str(tmp_path), domains=['a.example', 'b.example', 'c.example'], memory_budget=150 * 1024)
+    assert reg.stats()['resident'] == []
+    with reg.use('a.example') as a:
+        priv = a.pkg.extract(a.msk, 'alice@a.example')
+        mpk = a.mpk
+        with reg.use('b.example'):
+            pass
+        with reg.use('c.example'):
+            # only two tenants fit: the idle one goes, the one in use stays although it is older
+            assert reg.stats()['resident'] == ['a.example', 'c.example']
+    assert reg.evictions == 1
+
+    with reg.use('b.example'):
+        pass
+    assert 'a.example' not in reg.stats()['resident']
+    with reg.use('a.example') as a:  # reloaded from disk with the same keys
+        assert a.pkg.extract(a.msk, 'alice@a.example') == priv
+        assert a.mpk == mpk
+    assert reg.loads == 5
+
+    with pytest.raises(UnknownTenant):
+        with reg.use('other.example'):
+            pass
+    assert not reg.serves('other.example') and not reg.serves('')
+
+
+def test_tenants_without_sealing_secret_stay_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr('pkg.master_keys.PKG_MASTER_SEAL_KEY', '')
+    monkeypatch.setattr('pkg.master_keys.PKG_MASTER_PASSPHRASE', '')
+    reg = TenantRegistry(str(tmp_path), domains=['a.example', 'b.example', 'c.example'], memory_budget=150 * 1024)
+    with reg.use('a.example') as a:
+        msk = a.msk
+    for domain in ('b.example', 'c.example'):
+        with reg.use(domain):
+            pass
+    # Unloading would pair the stored MPK with a fresh MSK, so nothing is evicted
+    assert reg.evictions == 0 and reg.stats()['resident'] == ['a.example', 'b.example', 'c.example']
+    with reg.use('a.example') as a:
+        assert a.msk == msk and not a.sealed
+
+
+def test_concurrent_first_use_loads_once(tmp_path):
+    loads = []
+
+    def factory(path):
+        from ibe.crypto_iface import DemoIBE
+        loads.append(path)
+        return DemoIBE(store_path=path)
+    reg = TenantRegistry(str(tmp_path), domains=['*'], factory=factory)
+    threads = [threading.Thread(target=lambda: reg.use('x.example').__enter__()) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1 and reg.stats()['resident'] == ['x.example']
+
+
+def test_server_multi_tenant_mode(tmp_path, monkeypatch):
+    from pkg import server
+    reg = TenantRegistry(str(tmp_path), domains=['a.example', 'b.example'])
+    monkeypatch.setattr(server, 'tenants', reg)
+    monkeypatch.setattr(server, 'verify_otp', lambda identity, otp: None)
+    server._pubkey_responses.clear()
+    client = server.app.test_client()
+
+    keys = {}
+    for identity in ('alice@a.example', 'bob@b.example'):
+        r = client.post('/extract', json={'identity': identity, 'otp': '1'})
+        assert r.status_code == 200
+        keys[identity] = r.get_json()['private_b64']
+    assert client.post('/extract', json={'identity': 'eve@c.example', 'otp': '1'}).status_code == 404
+    assert client.post('/request_extract_code', json={'identity': 'eve@c.example'}).status_code == 404
+
+    mpk_a = client.get('/mpk', query_string={'domain': 'A.example'}).get_json()
+    mpk_b = client.get('/mpk', query_string={'domain': 'b.example'}).get_json()
+    assert mpk_a != mpk_b
+    assert client.get('/get_pubkey', query_string={'identity': 'Bob@B.example'}).status_code == 200
+    r = client.post('/get_pubkeys', json={'identities': ['alice@a.example', 'bob@b.example', 'eve@c.example']})
+    assert sorted(r.get_json()['pubkeys']) == ['alice@a.example', 'bob@b.example']
+    assert r.get_json()['unknown'] == ['eve@c.example']
+    changes = client.get('/pubkeys/changes', query_string={'domain': 'a.example'}).get_json()['changes']
+    assert [c['identity'] for c in changes] == ['alice@a.example']
+    assert client.get('/pubkeys/changes').status_code == 404
+    assert sorted(os.listdir(str(tmp_path))) == ['a.example', 'b.example']
@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+from ibe import tracing
+from ibe.crypto_iface import DemoIBE
+
+
+@pytest.fixture
+def ring():
+    exporter = tracing.RingExporter(100)
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+
+
+def test_disabled_is_noop():
+    assert not tracing.enabled()
+    with tracing.span('x') as s:
+        s.set(a=1)
+    assert tracing.inject({}) == {}
+
+
+def test_nesting_and_traceparent_round_trip(ring):
+    with tracing.span('outer') as outer:
+        with tracing.span('inner', k=1):
+            pass
+        headers = tracing.inject({})
+    inner, root = ring.recent()
+    assert inner['parent_id'] == root['span_id'] and root['parent_id'] is None
+    assert inner['attrs'] == {'k': 1} and root['duration'] >= inner['duration']
+    remote = tracing.parse_traceparent(headers['traceparent'])
+    assert (remote.trace_id, remote.span_id) == (outer.trace_id, outer.span_id)
+    assert tracing.parse_traceparent('00-' + '0' * 32 + '-' + '1' * 16 + '-01') is None
+
+
+def test_pkg_request_joins_client_trace(ring, tmp_path, monkeypatch):
+    from pkg import server
+    demo = DemoIBE(store_path=str(tmp_path / 'pkg_data.json'))
+    demo.setup()
+    monkeypatch.setattr(server, 'pkg', demo)
+    monkeypatch.setattr(server, 'request_otp', lambda identity: True)
+    monkeypatch.setattr(server, 'verify_otp', lambda identity, otp: None)
+    client = server.app.test_client()
+    with tracing.span('client.decrypt') as root:
+        r = client.post('/extract', json={'identity': 'Alice@example.com', 'otp': '1'},
+                        headers=tracing.inject({}))
+    assert r.status_code == 200
+    spans = {s['name']: s for s in ring.recent(root.trace_id)}
+    handler = spans['pkg POST /extract']
+    assert handler['parent_id'] == root.span_id and handler['attrs']['status'] == 200
+    assert spans['keystore.extract']['parent_id'] == handler['span_id']
+    assert spans['keystore.save']['parent_id'] == spans['keystore.extract']['span_id']
+    assert 'canonicalize_identity' in spans
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+    import trace_view
+    roots, children = trace_view.tree(ring.recent(root.trace_id))
+    path = [s['name'] for s, _ in trace_view.critical_path(roots, children)]
+    assert path[:3] == ['client.decrypt', 'pkg POST /extract', 'keystore.extract']
@@ -2,25 +2,93 @@
 Web Interface for IBE Email System Demo
 Flask application providing a user-friendly interface to demonstrate IBE functionality
 """
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
 import sys
 import os
+import atexit
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from ibe.crypto_iface import DemoIBE, b64, ub64, canonicalize_identity
+from ibe.crypto_iface import DemoIBE, b64, ub64, canonicalize_identity, load_private_key
+from ibe import aead
+from ibe.cache import LRUTTLCache
 from pkg.auth_otp import request_otp, verify_otp
+from pkg.jobs import JobQueue, iter_chunks
+from pkg.master_keys import load_or_setup, master_key_path
 import secrets
 import json
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(32)
 
-# Initialize IBE system (in production, load from persistent storage)
-demo = DemoIBE()
-MPK, MSK = demo.setup()
+# Initialize IBE system; master keys are reused across restarts when a sealing secret is set
+demo = DemoIBE(lazy=True)
+atexit.register(demo.close)  # writes the compact keystore index, so the next start is O(1)
+MPK, MSK = load_or_setup(demo, master_key_path(demo.store_path))
+
+# Extracted keys, parsed once and scoped to the browser session that extracted them.
+# Bounded so a long-running deployment does not grow one entry per identity forever.
+KEY_CACHE_SIZE = int(os.environ.get('WEB_KEY_CACHE_SIZE', '1024'))
+KEY_CACHE_TTL = int(os.environ.get('WEB_KEY_CACHE_TTL', '900'))
+extracted_keys = LRUTTLCache(max_entries=KEY_CACHE_SIZE, ttl=KEY_CACHE_TTL)
+
+
+def _session_id():
+    """Return a random per-browser-session id, creating it on first use."""
+    sid = session.get('sid')
+    if not sid:
+        sid = secrets.token_hex(16)
+        session['sid'] = sid
+    return sid
+
+
+def _remember_key(identity, private_key):
+    extracted_keys.set((_session_id(), identity), load_private_key(private_key))
+
+
+# Payloads above this size (bytes) are processed as background jobs instead of inline
+ASYNC_THRESHOLD = int(os.environ.get('WEB_ASYNC_THRESHOLD', str(256 * 1024)))
+jobs = JobQueue()
+
+
+def _encrypt_payload(recipient, message_bytes):
+    envelope = demo.encrypt(recipient, message_bytes)
+    ciphertext_len = len(ub64(envelope['ciphertext']))
+    return {
+        'status': 'success',
+        'recipient': recipient,
+        'envelope': envelope,
+        'stats': {
+            'message_length': len(message_bytes),
+            'ciphertext_length': ciphertext_len,
+            'overhead': ciphertext_len - len(message_bytes),
+            'ephemeral_pub_length': 32,
+            'nonce_length': 12,
+            'mac_tag_length': 16
+        }
+    }
+
+
+def _encrypt_job(job, recipient, message_bytes):
+    job.report(0.1, 'encrypting')
+    payload = _encrypt_payload(recipient, message_bytes)
+    job.report(0.8, 'serializing')
+    return json.dumps(payload).encode('utf-8'), 'application/json'
+
+
+def _decrypt_job(job, private_key, envelope):
+    job.report(0.1, 'decrypting')
+    plaintext = demo.decrypt(private_key, envelope)
+    return plaintext, 'text/plain; charset=utf-8'
+
+
+def _job_accepted(job):
+    return jsonify({
+        'status': 'queued',
+        'job_id': job.id,
+        'events_url': f'/api/jobs/{job.id}/events',
+        'result_url': f'/api/jobs/{job.id}/result'
+    }), 202
 
-# Store for extracted keys (in-memory for demo)
-extracted_keys = {}
 
 @app.route('/')
 def index():
@@ -33,10 +101,15 @@ def system_info():
     return jsonify({
         'mpk': MPK,
         'msk_hidden': '***PROTECTED***',
-        'algorithm': 'X25519 + ChaCha20-Poly1305',
+        'algorithm': 'X25519 + ' + aead.suite_name(aead.preferred_suite()),
         'status': 'operational'
     })
 
+@app.route('/api/key_cache_stats', methods=['GET'])
+def key_cache_stats():
+    """Size, hit/miss and eviction counters for the extracted key cache"""
+    return jsonify(extracted_keys.stats())
+
 @app.route('/api/request_otp', methods=['POST'])
 def api_request_otp():
     """Request OTP for private key extraction"""
@@ -76,8 +149,8 @@ def api_extract_key():
     private_key = demo.extract(MSK, identity)
     private_key_b64 = b64(private_key)
     
-    # Store in session (in production, use secure storage)
-    extracted_keys[identity] = private_key_b64
+    # Cache the parsed key for this session (in production, use secure storage)
+    _remember_key(identity, private_key)
     
     return jsonify({
         'status': 'success',
@@ -96,27 +169,16 @@ def api_encrypt():
     if not recipient or not message:
         return jsonify({'error': 'Recipient and message required'}), 400
     
+    message_bytes = message.encode('utf-8')
+    if len(message_bytes) > ASYNC_THRESHOLD or data.get('async'):
+        if demo.get_pubkey_for_identity(recipient) is None:
+            return jsonify({'error': 'unknown identity/public key'}), 404
+        job = jobs.submit('encrypt', _encrypt_job, recipient, message_bytes, owner=_session_id())
+        return _job_accepted(job)
+    
     try:
-        # Encrypt message
-        envelope = demo.encrypt(recipient, message.encode('utf-8'))
-        
-        # Get ciphertext stats
-        ciphertext_bytes = ub64(envelope['ciphertext'])
-        
-        return jsonify({
-            'status': 'success',
-            'recipient': recipient,
-            'original_message': message,
-            'envelope': envelope,
-            'stats': {
-                'message_length': len(message),
-                'ciphertext_length': len(ciphertext_bytes),
-                'overhead': len(ciphertext_bytes) - len(message.encode('utf-8')),
-                'ephemeral_pub_length': 32,
-                'nonce_length': 12,
-                'mac_tag_length': 16
-            }
-        })
+        # Small messages take the synchronous fast path
+        return jsonify(_encrypt_payload(recipient, message_bytes))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -131,13 +193,15 @@ def api_decrypt():
         return jsonify({'error': 'Identity and envelope required'}), 400
     
     # Check if we have the private key
-    if identity not in extracted_keys:
+    private_key = extracted_keys.get((_session_id(), identity))
+    if private_key is None:
         return jsonify({'error': 'Private key not found. Please extract key first.'}), 403
     
+    if len(envelope.get('ciphertext', '')) > ASYNC_THRESHOLD or data.get('async'):
+        job = jobs.submit('decrypt', _decrypt_job, private_key, envelope, owner=_session_id())
+        return _job_accepted(job)
+    
     try:
-        # Get private key
-        private_key = ub64(extracted_keys[identity])
-        
         # Decrypt
         plaintext = demo.decrypt(private_key, envelope)
         decrypted_message = plaintext.decode('utf-8')
@@ -150,6 +214,49 @@ def api_decrypt():
     except Exception as e:
         return jsonify({'error': f'Decryption failed: {str(e)}'}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Current state of a background job"""
+    job = jobs.get(job_id, owner=_session_id())
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def api_job_events(job_id):
+    """Stream job progress as Server-Sent Events"""
+    job = jobs.get(job_id, owner=_session_id())
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    def generate():
+        for state in jobs.events(job):
+            if not state:
+                yield ': keep-alive\n\n'
+                continue
+            event = 'progress' if state['status'] in ('queued', 'running') else state['status']
+            yield f'event: {event}\ndata: {json.dumps(state)}\n\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def api_job_result(job_id):
+    """Download a finished job's result as a streamed response"""
+    job = jobs.get(job_id, owner=_session_id())
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    if not job.done:
+        return jsonify(job.to_dict()), 409
+    # The result is handed out once and then dropped from memory
+    result, content_type = job.take_result()
+    if result is None:
+        return jsonify({'error': 'Result already downloaded'}), 410
+    return Response(iter_chunks(result), content_type=content_type,
+                    headers={'Content-Length': str(len(result))})
+
 @app.route('/api/demo_flow', methods=['POST'])
 def api_demo_flow():
     """Complete demo flow for presentation"""
@@ -167,7 +274,7 @@ def api_demo_flow():
             return jsonify({'error': 'Invalid or expired OTP'}), 403
         
         private_key = demo.extract(MSK, recipient)
-        extracted_keys[recipient] = b64(private_key)
+        _remember_key(recipient, private_key)
         
         # Step 2: Encrypt
         envelope = demo.encrypt(recipient, message.encode('utf-8'))